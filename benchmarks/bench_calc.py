@@ -0,0 +1,194 @@
+"""
+Scaling benchmark of the calc.py enumerator on synthetic catalogues
+(see synthetic_catalogue.py).
+
+For each catalogue size, in a fresh process, it profiles the stages of
+calc.py (see --profile in calc.py and calc_profile.py) separately:
+ - load_inputs
+ - intersection_table      (build_intersection_table)
+ - masks                   (generate_valid_sets_*)
+ - find_solutions          (find_solutions_*, without the masks)
+ - get_quads               (get_quads_from_solutions*)
+ - process_tag_combinations (the rest: card0 sets, incremental state...)
+ - dedup_solutions         (the quint dedup)
+ - write_*                 (the JSON / binary outputs)
+and reports the peak RSS of the run. The results are appended to a JSON
+history file, and compared with the previous entry of the same settings.
+
+    python benchmarks/bench_calc.py -n 1500 3000 6000
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+from datetime import datetime
+import io
+from itertools import combinations
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import platform
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "scripts"))
+import calc  # noqa: E402
+from calc_inputs import load_inputs  # noqa: E402
+from calc_profile import Profile, get_peak_rss_mb, merge_profiles  # noqa: E402
+from synthetic_catalogue import generate_catalogue, parse_color_weights  # noqa: E402
+
+DEFAULT_HISTORY = BENCH_DIR / "calc_history.json"
+
+
+def run_size(n_cards, seed, color_weights, skew, engine, dedup):
+    """
+    Benchmark one catalogue size. Run in a fresh process, so the peak RSS
+    is the one of this size only.
+    """
+    if "numpy" in (engine, dedup):
+        calc.import_numpy()
+    questions = tuple(combinations(range(1, 6), 2))
+    calc._profile = profile = Profile()
+    unit_profiles = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate_catalogue(os.path.join(tmp, "catalogue"), n_cards,
+                                   seed, color_weights, skew)
+        with profile.stage("load_inputs"):
+            inputs = load_inputs(paths)
+
+        quad_dict = {f"{a},{b}": {} for a, b in questions}
+        card0_dict = {f"{a},{b}": {} for a, b in questions}
+        with profile.stage("enumerate"):
+            for color_pair_as_key, quads, card0s, _, unit_profile in \
+                    calc.solve_units(
+                        calc.get_units(questions), 1, inputs["cards_encoded"],
+                        inputs["tag_cards"], inputs["silver_tags"], engine,
+                        profile=True):
+                quad_dict[color_pair_as_key].update(quads)
+                card0_dict[color_pair_as_key].update(card0s)
+                unit_profiles.append(unit_profile)
+
+        with profile.stage("dedup_solutions"):
+            solutions, quint_cnt = calc.dedup_solutions(
+                questions, quad_dict, card0_dict, max(inputs["valid_cards"]),
+                dedup)
+        with profile.stage("write_solutions"), \
+                contextlib.redirect_stdout(io.StringIO()):
+            calc.write_solutions(os.path.join(tmp, "output"), solutions)
+
+    # the unit stages, then the main ones (enumerate is their total)
+    stages = merge_profiles(unit_profiles)["stages"]
+    stages.update(profile.stages)
+    return {
+        "cards": n_cards,
+        "valid_cards": len(inputs["valid_cards"]),
+        "quads": sum(len(quads) for tag_pairs in quad_dict.values()
+                     for quads in tag_pairs.values()),
+        "solutions": len(solutions),
+        "quints": quint_cnt,
+        "stages": {name: {"s": round(stage["s"], 4), "calls": stage["calls"],
+                          "rss_growth_mb": round(stage["rss_growth_mb"], 1)}
+                   for name, stage in stages.items()},
+        "peak_rss_mb": round(get_peak_rss_mb(), 1),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not path.exists():
+        return []
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_history(path, history):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        json.dump(history, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def print_run(run, previous=None):
+    """
+    Print the stages of a run, with the change from the previous run
+    of the same size when there is one.
+    """
+    print(f"{run['cards']} cards ({run['valid_cards']} SR/SSR): "
+          f"{run['solutions']} solutions, {run['quints']} quints, "
+          f"peak RSS {run['peak_rss_mb']} MB")
+    for stage, result in run["stages"].items():
+        line = f"  {stage:<26} {result['s']:9.3f}s  {result['calls']:>7} calls"
+        old = (previous or {}).get("stages", {}).get(stage)
+        if old and old["s"] > 0:
+            line += f"  {(result['s'] / old['s'] - 1) * 100:+6.1f}%"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the calc.py stages on synthetic catalogues")
+    parser.add_argument("-n", "--cards", type=int, nargs="+",
+                        default=[1500, 3000],
+                        help="Catalogue sizes (default: 1500 3000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--color-weights", type=parse_color_weights,
+                        default=(1,) * 5,
+                        help="Weights of the 5 colors (default: 1,1,1,1,1)")
+    parser.add_argument("--skew", type=float, default=0.0,
+                        help="Skew of the silver tags within a color "
+                             "(default: 0)")
+    parser.add_argument("--engine", choices=tuple(calc.SOLVERS),
+                        default="python")
+    parser.add_argument("--dedup", choices=tuple(calc.DEDUP_MODES),
+                        default="set")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY,
+                        help=f"History file (default: {DEFAULT_HISTORY.name})")
+    parser.add_argument("--no-history", action="store_true",
+                        help="Do not record this run")
+    args = parser.parse_args()
+
+    settings = {
+        "engine": args.engine,
+        "dedup": args.dedup,
+        "seed": args.seed,
+        "color_weights": list(args.color_weights),
+        "skew": args.skew,
+    }
+    history = load_history(args.history)
+    previous = next((entry for entry in reversed(history)
+                     if entry["settings"] == settings), None)
+    previous_runs = {run["cards"]: run for run in (previous or {}).get("runs", [])}
+    if previous:
+        print(f"Compared with {previous['date']} ({previous['commit']})")
+
+    runs = []
+    spawn = multiprocessing.get_context("spawn")
+    for n_cards in args.cards:
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            run = executor.submit(run_size, n_cards, args.seed,
+                                  args.color_weights, args.skew,
+                                  args.engine, args.dedup).result()
+        print_run(run, previous_runs.get(n_cards))
+        runs.append(run)
+
+    if not args.no_history:
+        history.append({
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "settings": settings,
+            "runs": runs,
+        })
+        save_history(args.history, history)
+        print(f"Recorded in {args.history}")
@@ -0,0 +1,107 @@
+"""
+Benchmark of the CSV merge in maintain.py (overwrite_from_id_generic)
+against the previous list-based approach, on a synthetic characteristic
+table (card_give_characteristic.csv layout).
+
+    python benchmarks/bench_csv_merge.py --rows 1000000
+"""
+import argparse
+import csv
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+import maintain  # noqa: E402
+
+FIELDS = ['card_id', 'No', 'characteristic_id', 'manually_added']
+
+
+def overwrite_from_id_lists(src_csv, dest_csv, key_field, start_id):
+    """
+    The previous implementation: load every kept and new row into lists,
+    then rewrite dest in place.
+    """
+    kept_rows = []
+    kept_fields = []
+    if os.path.exists(dest_csv):
+        with open(dest_csv, newline='', encoding='utf-8') as f:
+            dest_reader = csv.DictReader(f)
+            kept_fields = dest_reader.fieldnames or []
+            for r in dest_reader:
+                v = r.get(key_field, "")
+                if str(v).isdigit() and int(v) < start_id:
+                    kept_rows.append(r)
+    with open(src_csv, newline='', encoding='utf-8') as f:
+        src_reader = csv.DictReader(f)
+        if not kept_fields:
+            kept_fields = src_reader.fieldnames or []
+        new_rows = [r for r in src_reader if any((str(v).strip() if v is not None else "") for v in r.values())]
+    with open(dest_csv, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=kept_fields)
+        writer.writeheader()
+        writer.writerows(kept_rows + new_rows)
+
+
+def write_table(path, first_card, n_rows, rows_per_card=4):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for k in range(n_rows):
+            writer.writerow([first_card + k // rows_per_card, k % rows_per_card + 1, k % 119 + 1, ''])
+
+
+def measure(func, base_csv, dest_csv, src_csv, key_field, start_id):
+    """
+    Time a merge, then run it again under tracemalloc for its peak memory
+    (tracing slows the run down too much to time both at once).
+    """
+    shutil.copy(base_csv, dest_csv)
+    start = time.perf_counter()
+    func(src_csv, dest_csv, key_field, start_id)
+    elapsed = time.perf_counter() - start
+
+    shutil.copy(base_csv, dest_csv)
+    tracemalloc.start()
+    func(src_csv, dest_csv, key_field, start_id)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the CSV merge of maintain.py")
+    parser.add_argument("-n", "--rows", type=int, default=1_000_000,
+                        help="Rows of the destination table (default: 1000000)")
+    parser.add_argument("--new-rows", type=int, default=2000,
+                        help="Rows merged from the source table (default: 2000)")
+    args = parser.parse_args()
+
+    # silence the merge log
+    maintain.log = lambda level, msg: None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        base_csv, src_csv = tmp / "base.csv", tmp / "src.csv"
+        n_cards = args.rows // 4
+        start_id = n_cards - args.new_rows // 8 + 1
+        write_table(base_csv, 1, args.rows)
+        write_table(src_csv, start_id, args.new_rows)
+
+        results = {}
+        for name, func in (("lists", overwrite_from_id_lists),
+                           ("streaming", maintain.overwrite_from_id_generic)):
+            results[name] = measure(func, base_csv, tmp / f"dest_{name}.csv",
+                                    src_csv, "card_id", start_id)
+
+        with open(tmp / "dest_lists.csv", 'rb') as a, open(tmp / "dest_streaming.csv", 'rb') as b:
+            same = a.read() == b.read()
+
+    print(f"{args.rows} rows, merging {args.new_rows} new rows from card_id {start_id}")
+    for name, (elapsed, peak) in results.items():
+        print(f"  {name:<10} {elapsed:7.2f}s  peak {peak / 2 ** 20:8.1f} MiB")
+    print(f"  identical output: {same}")
@@ -0,0 +1,194 @@
+"""
+Benchmark of the gamerch page parsing in maintain.py (RowTable: only the
+<tr> rows and <img> tags, an alt text -> row index) against the previous
+whole-page BeautifulSoup parsing, on saved copies of the card list and the
+permanent card pages.
+
+The pages are read from the page cache of maintain.py
+(scripts/maintain-log/http-cache, filled by any run of maintain.py), or
+from the paths given with --card-list / --permanent. Without saved pages,
+--synthetic N builds pages of N card rows in the gamerch layout.
+
+    python benchmarks/bench_gamerch_parse.py
+    python benchmarks/bench_gamerch_parse.py --synthetic 3000
+"""
+import argparse
+import csv
+import itertools
+from pathlib import Path
+import random
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+import maintain  # noqa: E402
+
+PARSERS = ("html.parser", "lxml")
+
+
+def card_list_whole_page(content, start_title, parser="html.parser"):
+    """
+    The previous implementation of get_alt_title_for_id + export_card_infos:
+    parse the whole page, then find the start row with a lambda per row.
+    """
+    soup = BeautifulSoup(content, parser)
+    target_alt = soup.find('img', alt=lambda x: x and start_title in x)['alt']
+    found_target = False
+    rows = []
+    for tr in soup.find_all('tr'):
+        if not found_target:
+            if tr.find('img', alt=lambda x: x and target_alt in x):
+                found_target = True
+            continue
+        img_tag = tr.find('img', alt=True)
+        if img_tag and maintain.PLACEHOLDER_MARK in img_tag['alt'].strip():
+            break
+        row = maintain.process_card_row(tr, len(rows))
+        if row:
+            rows.append(row)
+    return rows
+
+
+def card_list_row_table(content, start_title, parser=None):
+    table = maintain.RowTable(content, parser=parser)
+    target_row = table.find_row(table.find_alt(start_title))
+    rows = []
+    for tr in table.rows[target_row + 1:]:
+        img_tag = tr.find('img', alt=True)
+        if img_tag and maintain.PLACEHOLDER_MARK in img_tag['alt'].strip():
+            break
+        row = maintain.process_card_row(tr, len(rows))
+        if row:
+            rows.append(row)
+    return rows
+
+
+def permanent_whole_page(content, parser="html.parser"):
+    soup = BeautifulSoup(content, parser)
+    return [title for title in map(maintain.get_permanent_row_title, soup.find_all('tr'))
+            if title is not None]
+
+
+def permanent_row_table(content, parser=None):
+    table = maintain.RowTable(content, parser=parser)
+    return [title for title in map(maintain.get_permanent_row_title, table.rows)
+            if title is not None]
+
+
+def synthetic_pages(n_cards, n_placeholders=3, seed=0):
+    """
+    Card list and permanent pages with n_cards rows in the gamerch layout,
+    surrounded by page furniture, the card list ending with placeholders.
+    """
+    rng = random.Random(seed)
+    with open(maintain.DATA_DIR / "character_card.csv", newline='', encoding='utf-8') as f:
+        titles = [row['title'] for row in csv.DictReader(f)]
+    rarities = ('R', 'SR', 'SSR')
+
+    def row(k, title):
+        prefix, _, name = title.partition('】')
+        return (f'<tr><td class="mu__table--col1"><img alt="{title}" '
+                f'src="https://img.gamerch.com/wizard-promise/{k}.png" loading="lazy"></td>'
+                f'<td class="mu__table--col2"><a href="https://gamerch.com/wizard-promise/{k}">'
+                f'{prefix}】{name}<ruby>{name}<rt>x</rt></ruby></a></td>'
+                f'<td class="mu__table--col3">{rng.choice(rarities)}</td></tr>\n')
+
+    furniture = "".join(f'<div class="ad"><script>var x{k} = {k};</script><p>text {k}</p></div>\n'
+                        for k in range(500))
+    card_rows = [row(k, titles[k % len(titles)] + ("" if k < len(titles) else str(k)))
+                 for k in range(n_cards)]
+    placeholders = [row(n_cards + k, f"【未定{k}】（仮）") for k in range(n_placeholders)]
+    head = f"<html><head><title>x</title></head><body>{furniture}<table>"
+    tail = f"</table><div id='comments'>{furniture}</div></body></html>"
+    card_list = head + "".join(card_rows + placeholders) + tail
+    permanent = head + "".join(rng.sample(card_rows, n_cards // 2)) + tail
+    return card_list.encode('utf-8'), permanent.encode('utf-8')
+
+
+def saved_page(url, path):
+    if path is not None:
+        return Path(path).read_bytes()
+    body_path, _ = maintain.page_cache._paths(url)
+    if not body_path.exists():
+        sys.exit(f"No saved copy of {url} in {body_path.parent}: "
+                 "run maintain.py once, or pass the page paths or --synthetic N")
+    return body_path.read_bytes()
+
+
+def measure(func, repeat, *args):
+    """
+    Best time of repeat runs, then one more run under tracemalloc for
+    its peak memory (tracing slows the run down too much to time both).
+    """
+    elapsed = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def available_parsers():
+    parsers = []
+    for parser in PARSERS:
+        try:
+            BeautifulSoup("<tr></tr>", parser)
+        except Exception:  # bs4.FeatureNotFound
+            continue
+        parsers.append(parser)
+    return parsers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the gamerch page parsing of maintain.py")
+    parser.add_argument("--card-list", default=None,
+                        help="Saved card list page (default: from the page cache)")
+    parser.add_argument("--permanent", default=None,
+                        help="Saved permanent card page (default: from the page cache)")
+    parser.add_argument("--synthetic", type=int, default=None, metavar="N",
+                        help="Use synthetic pages of N cards instead of saved pages")
+    parser.add_argument("--start-back", type=int, default=3,
+                        help="Start the card list this many rows before the "
+                             "first placeholder (default: 3)")
+    parser.add_argument("-n", "--repeat", type=int, default=3,
+                        help="Runs per measure, the best is kept (default: 3)")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        card_list, permanent = synthetic_pages(args.synthetic)
+    else:
+        card_list = saved_page(maintain.GAMERCH_CARD_LIST_URL, args.card_list)
+        permanent = saved_page(maintain.GAMERCH_PERMANENT_URL, args.permanent)
+
+    # start title: as main() does, the card before the new ones
+    alts = list(itertools.takewhile(lambda alt: maintain.PLACEHOLDER_MARK not in alt,
+                                    filter(None, maintain.RowTable(card_list).alts)))
+    start_title = alts[-1 - args.start_back]
+
+    parsers = available_parsers()
+    cases = [("card list", f"{len(card_list) / 2 ** 20:.2f} MiB, from {start_title}",
+              [("whole page html.parser", card_list_whole_page, ())]
+              + [(f"row table {p}", card_list_row_table, (p,)) for p in parsers],
+              (card_list, start_title)),
+             ("permanent", f"{len(permanent) / 2 ** 20:.2f} MiB",
+              [("whole page html.parser", permanent_whole_page, ())]
+              + [(f"row table {p}", permanent_row_table, (p,)) for p in parsers],
+              (permanent,))]
+
+    for page, description, funcs, page_args in cases:
+        print(f"{page} ({description})")
+        expected = None
+        for name, func, extra in funcs:
+            elapsed, peak, result = measure(func, args.repeat, *page_args, *extra)
+            if expected is None:
+                expected = result
+            same = "" if result == expected else "  DIFFERENT RESULT"
+            print(f"  {name:<24} {elapsed * 1000:9.1f} ms  peak {peak / 2 ** 20:8.1f} MiB"
+                  f"  {len(result)} rows{same}")
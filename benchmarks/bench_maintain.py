@@ -0,0 +1,128 @@
+"""
+Stage benchmark of the maintain.py pipeline, offline, from a recording
+made with `python scripts/maintain.py --record` (see HttpArchive in
+maintain.py).
+
+Each run happens in a fresh process, on a copy of maintain.py in a
+temporary tree where the local state of the recording (data CSVs,
+maintain-log state files, icon manifest) is restored, so every run sends
+the same requests and gets the same responses. The stages of main() are
+timed with the Profile of calc_profile.py (nested stages not counted in
+their parent):
+ - card list      (get_alt_title_for_id, export_card_infos)
+ - traits         (export_characteristics_json_bwiki, update_changed_bwiki_cards)
+ - permanent IDs  (collect_and_write_permanent_ids)
+ - icons          (load_or_init_icon_manifest, download_missing_icons)
+ - CSV merges     (overwrite_from_id_generic, patch_csv_by_key, Catalogue.save)
+
+    python scripts/maintain.py --record
+    python benchmarks/bench_maintain.py -n 3
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import json
+import multiprocessing
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = Path(__file__).resolve().parent
+SCRIPTS_DIR = BENCH_DIR.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+from calc_profile import Profile, get_peak_rss_mb  # noqa: E402
+
+DEFAULT_ARCHIVE = SCRIPTS_DIR / "maintain-log" / "http-archive"
+
+# stage -> functions of maintain.py counted in it
+STAGES = {
+    "card list": ("get_alt_title_for_id", "export_card_infos"),
+    "traits": ("export_characteristics_json_bwiki", "update_changed_bwiki_cards"),
+    "permanent IDs": ("collect_and_write_permanent_ids",),
+    "icons": ("load_or_init_icon_manifest", "download_missing_icons"),
+    "CSV merges": ("overwrite_from_id_generic", "patch_csv_by_key"),
+}
+
+
+def profiled(profile, name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with profile.stage(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def run_replay(tree, archive_dir):
+    """
+    Replay main() on the maintain.py copy of tree. Run in a fresh process,
+    so the module state and the peak RSS are the ones of this run only.
+    """
+    sys.path.insert(0, str(Path(tree) / "scripts"))
+    import maintain
+
+    maintain.HttpArchive(archive_dir).restore_snapshot(maintain.BASE_DIR)
+    maintain.log = lambda level, msg: None
+    profile = Profile()
+    for stage, names in STAGES.items():
+        for name in names:
+            setattr(maintain, name, profiled(profile, stage, getattr(maintain, name)))
+    maintain.Catalogue.save = profiled(profile, "CSV merges", maintain.Catalogue.save)
+
+    archive = maintain.setup_http_archive(Path(archive_dir), replay=True)
+    start = time.perf_counter()
+    maintain.main()
+    wall_s = time.perf_counter() - start
+    return {
+        "requests": sum(archive.replayed.values()),
+        "misses": len(archive.misses),
+        "wall_s": wall_s,
+        "stages": profile.stages,
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the maintain.py stages from a recording")
+    parser.add_argument("--archive", type=Path, default=DEFAULT_ARCHIVE,
+                        help=f"Recording of maintain.py --record (default: {DEFAULT_ARCHIVE})")
+    parser.add_argument("-n", "--repeat", type=int, default=3,
+                        help="Runs, the best time of each stage is kept (default: 3)")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the results as json")
+    args = parser.parse_args()
+    if not (args.archive / "index.json").exists():
+        sys.exit(f"No recording in {args.archive}: run scripts/maintain.py --record first")
+
+    runs = []
+    spawn = multiprocessing.get_context("spawn")
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as tree:
+            (Path(tree) / "scripts").mkdir()
+            shutil.copy(SCRIPTS_DIR / "maintain.py", Path(tree) / "scripts")
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+                runs.append(executor.submit(run_replay, tree, str(args.archive.resolve())).result())
+
+    results = {
+        "requests": runs[-1]["requests"],
+        "misses": runs[-1]["misses"],
+        "wall_s": round(min(run["wall_s"] for run in runs), 4),
+        "peak_rss_mb": round(max(run["peak_rss_mb"] for run in runs), 1),
+        "stages": {stage: {"s": round(min(run["stages"][stage]["s"] for run in runs), 4),
+                           "calls": runs[-1]["stages"][stage]["calls"]}
+                   for stage in STAGES if stage in runs[-1]["stages"]},
+    }
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"main(): {results['wall_s']:.3f}s, {results['requests']} requests replayed, "
+              f"peak RSS {results['peak_rss_mb']} MB (best of {args.repeat})")
+        for stage, result in results["stages"].items():
+            print(f"  {stage:<14} {result['s']:9.3f}s  {result['calls']:>4} calls")
+        other = results["wall_s"] - sum(result["s"] for result in results["stages"].values())
+        print(f"  {'other':<14} {other:9.3f}s")
+    if results["misses"]:
+        print(f"WARNING: {results['misses']} requests were not in the recording",
+              file=sys.stderr)
@@ -0,0 +1,134 @@
+"""
+Startup benchmark of calc.py: import time (python -X importtime) and the
+time to get the parsed inputs with each loader, in fresh interpreters.
+
+    python benchmarks/bench_startup.py [--max-import-ms 150]
+
+Exits with 1 if importing calc pulls in a module of HEAVY_MODULES, or if
+the import takes longer than --max-import-ms.
+"""
+import argparse
+import json
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = BASE_DIR / "scripts"
+DATA_DIR = BASE_DIR / "public" / "data"
+
+# Modules that calc.py must only import when asked to (--loader / --engine)
+HEAVY_MODULES = ("pandas", "numpy")
+
+INPUT_PATHS = {
+    "cards_lists": str(DATA_DIR / "character_card.csv"),
+    "card_tags_base": str(DATA_DIR / "card_give_characteristic.csv"),
+    "card_tags_grow": str(DATA_DIR / "card_give_characteristic_grow_list.csv"),
+    "tags_all": str(DATA_DIR / "characteristics_normal.csv"),
+}
+
+LOAD_SCRIPT = """
+import time
+start = time.perf_counter()
+import calc
+from calc_inputs import load_inputs
+load_inputs({paths!r}, None, {loader!r})
+print(time.perf_counter() - start)
+"""
+
+
+def run_python(args):
+    return subprocess.run([sys.executable, *args], cwd=SCRIPTS_DIR,
+                          capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr, root):
+    """
+    Get [(module, cumulative us, depth)] of the modules imported by root
+    (root last) from -X importtime output, where a module is listed after
+    everything it imports.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(cumulative_us), depth))
+    end = next(i for i, entry in enumerate(entries)
+               if entry[0] == root and entry[2] == 0)
+    start = end
+    while start > 0 and entries[start - 1][2] > 0:
+        start -= 1
+    return entries[start:end + 1]
+
+
+def measure_import(repeat):
+    """
+    Import calc in fresh interpreters, returns (median ms, modules imported
+    by the last run).
+    """
+    times = []
+    for _ in range(repeat):
+        modules = parse_importtime(
+            run_python(["-X", "importtime", "-c", "import calc"]).stderr,
+            "calc")
+        times.append(modules[-1][1] / 1000)
+    return statistics.median(times), modules
+
+
+def measure_load(loader, repeat):
+    script = LOAD_SCRIPT.format(paths=INPUT_PATHS, loader=loader)
+    return statistics.median(
+        float(run_python(["-c", script]).stdout) * 1000
+        for _ in range(repeat))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup benchmark of calc.py")
+    parser.add_argument("-n", "--repeat", type=int, default=5,
+                        help="Runs per measure, the median is kept (default: 5)")
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="Fail if importing calc takes longer than this")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the results as json")
+    args = parser.parse_args()
+
+    import_ms, modules = measure_import(args.repeat)
+    heavy = sorted(name for name, _, _ in modules
+                   if name.split(".")[0] in HEAVY_MODULES)
+    # the slowest modules imported directly by calc
+    top = sorted(((name, cumulative / 1000)
+                  for name, cumulative, depth in modules if depth == 1),
+                 key=lambda x: -x[1])[:8]
+    results = {
+        "import_ms": round(import_ms, 1),
+        "heavy_modules": heavy,
+        "load_ms": {}
+    }
+    for loader in ("csv", "pandas"):
+        try:
+            results["load_ms"][loader] = round(measure_load(loader, args.repeat), 1)
+        except subprocess.CalledProcessError:
+            results["load_ms"][loader] = None  # pandas not installed
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"import calc: {results['import_ms']:.1f} ms")
+        for name, ms in top:
+            print(f"  {name:<28} {ms:7.1f} ms")
+        for loader, ms in results["load_ms"].items():
+            text = f"{ms:.1f} ms" if ms is not None else "unavailable"
+            print(f"import + load_inputs (--loader {loader}): {text}")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: importing calc imports {', '.join(heavy[:5])}", file=sys.stderr)
+        failed = True
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"FAIL: importing calc took {import_ms:.1f} ms "
+              f"(> {args.max_import_ms} ms)", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,150 @@
+"""
+Synthetic card catalogues for the calc.py benchmarks.
+
+Writes the four CSVs calc.py reads, in the layout of public/data, for N
+cards. Each color has 7 silver tags (rarity 3) as in the game. As in the
+game, an SSR has 2 silver tags of one color and 1 of another, an SR 1 of
+each of two colors. The colors and tags are drawn with:
+ - color_weights: relative weight of each of the 5 colors
+ - skew: within a color, the k-th silver tag has weight 1 / (k + 1) ** skew
+   (0 = uniform, higher = a few popular tags)
+
+    python benchmarks/synthetic_catalogue.py -n 3000 -o /tmp/catalogue
+"""
+import argparse
+import csv
+import os
+import random
+
+COLORS = (1, 2, 3, 4, 5)
+# tags per color and rarity, as in characteristics_normal.csv
+TAGS_PER_RARITY = {1: 5, 2: 7, 3: 7, 4: 5}
+SILVER_RARITY = 3
+# card rarity (N, R, SR, SSR) -> share of the cards, as in character_card.csv
+CARD_RARITY_WEIGHTS = {1: 0.014, 2: 0.22, 3: 0.265, 4: 0.501}
+# card rarity -> number of silver tags in each of its colors
+SILVER_LAYOUT = {1: (), 2: (1,), 3: (1, 1), 4: (2, 1)}
+# card rarity -> levels of the grow tags, as in maintain.py
+GROW_LEVELS = {1: [35, 45, 55, 70], 2: [35, 45, 55, 70],
+               3: [15, 40, 65, 75], 4: [30, 55, 75, 100]}
+# share of the tag cells holding the name of an unknown tag (as "星舞")
+UNKNOWN_TAG_RATE = 0.005
+
+# file names, by calc.py input name
+FILE_NAMES = {
+    "cards_lists": "character_card.csv",
+    "card_tags_base": "card_give_characteristic.csv",
+    "card_tags_grow": "card_give_characteristic_grow_list.csv",
+    "tags_all": "characteristics_normal.csv",
+}
+
+
+def write_csv(path, fieldnames, rows):
+    with open(path, "w", newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        writer.writerows(rows)
+
+
+def generate_catalogue(out_dir, n_cards, seed=0, color_weights=(1,) * 5,
+                       skew=0.0):
+    """
+    Write a catalogue of n_cards cards to out_dir.
+    Returns {calc.py input name: path}.
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {name: os.path.join(out_dir, file_name)
+             for name, file_name in FILE_NAMES.items()}
+
+    # tags: id, title, color, rarity, bonus, t1, t2
+    tags = []
+    tags_by = {}  # (color, rarity) -> [tag_id]
+    for rarity, count in TAGS_PER_RARITY.items():
+        for color in COLORS:
+            for k in range(count):
+                tag_id = len(tags) + 1
+                tags.append([tag_id, f"tag{tag_id}", color, rarity,
+                             50 * (rarity + 1), rarity, 10 * rarity])
+                tags_by.setdefault((color, rarity), []).append(tag_id)
+    write_csv(paths["tags_all"],
+              ["id", "title", "color", "rarity", "bonus", "t1", "t2"], tags)
+
+    silver_weights = [1 / (k + 1) ** skew
+                      for k in range(TAGS_PER_RARITY[SILVER_RARITY])]
+    other_tags = [tag for (color, rarity), ids in tags_by.items()
+                  if rarity != SILVER_RARITY for tag in ids]
+
+    def draw_distinct(population, weights, k):
+        drawn = []
+        while len(drawn) < k:
+            x = rng.choices(population, weights)[0]
+            if x not in drawn:
+                drawn.append(x)
+        return drawn
+
+    def tag_cell(tag):
+        return "星舞" if rng.random() < UNKNOWN_TAG_RATE else tag
+
+    cards, give_rows, grow_rows = [], [], []
+    rarities, rarity_weights = zip(*CARD_RARITY_WEIGHTS.items())
+    for card_id in range(1, n_cards + 1):
+        rarity = rng.choices(rarities, rarity_weights)[0]
+        character_id = (card_id - 1) % 21 + 1
+        cards.append([card_id, f"【synthetic {card_id}】", character_id,
+                      rarity, (character_id - 1) // 4 + 1, "", "main", ""])
+
+        # silver tags of distinct colors, then other tags
+        layout = SILVER_LAYOUT[rarity]
+        card_silver = []
+        for color, count in zip(
+                draw_distinct(COLORS, color_weights, len(layout)), layout):
+            card_silver += draw_distinct(
+                tags_by[(color, SILVER_RARITY)], silver_weights, count)
+        card_tags = card_silver + rng.sample(other_tags, 8 - len(card_silver))
+        rng.shuffle(card_tags)
+
+        # 4 base tags, 4 grow tags
+        for no, tag in enumerate(card_tags[:4], 1):
+            give_rows.append([card_id, no, tag_cell(tag), ""])
+        for level, tag in zip(GROW_LEVELS[rarity], card_tags[4:]):
+            grow_rows.append([card_id, level, tag_cell(tag), 1, ""])
+
+    write_csv(paths["cards_lists"],
+              ["id", "title", "character_id", "rarity", "country",
+               "character_first_name_en", "series", "manually_added"], cards)
+    write_csv(paths["card_tags_base"],
+              ["card_id", "No", "characteristic_id", "manually_added"],
+              give_rows)
+    write_csv(paths["card_tags_grow"],
+              ["card_id", "level", "characteristic_id", "value",
+               "manually_added"], grow_rows)
+    return paths
+
+
+def parse_color_weights(text):
+    weights = tuple(float(x) for x in text.split(","))
+    if len(weights) != len(COLORS):
+        raise argparse.ArgumentTypeError("expected 5 comma separated weights")
+    return weights
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic card catalogue for calc.py")
+    parser.add_argument("-n", "--cards", type=int, default=1500,
+                        help="Number of cards (default: 1500)")
+    parser.add_argument("-o", "--output-dir", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--color-weights", type=parse_color_weights,
+                        default=(1,) * 5,
+                        help="Weights of the 5 colors (default: 1,1,1,1,1)")
+    parser.add_argument("--skew", type=float, default=0.0,
+                        help="Skew of the silver tags within a color "
+                             "(default: 0, uniform)")
+    args = parser.parse_args()
+
+    for name, path in generate_catalogue(
+            args.output_dir, args.cards, args.seed, args.color_weights,
+            args.skew).items():
+        print(f"{name}: {path}")
@@ -1,8 +1,62 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import functools
+import hashlib
+import importlib.util
 from itertools import combinations, permutations, product
-import pandas as pd
 import os
 import json
+import struct
+import time
+
+from calc_inputs import LOADERS, load_inputs
+from calc_profile import Profile, build_report, print_report
+from solution_index import build_solution_index, write_solution_index
+from solution_pack import SolutionPack, write_solution_pack
+
+# numpy is only needed by the "numpy" engine and dedup, and is imported by
+# import_numpy() when one of them is picked, to keep the startup light
+np = None
+
+
+def import_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+# ====== Profiling (--profile) ======
+
+# Profile of the current process, None when profiling is off
+_profile = None
+
+
+def profiled(stage):
+    """
+    Decorator: account the calls of the function to stage,
+    when profiling is on.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profile is None:
+                return func(*args, **kwargs)
+            with _profile.stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def profile_stage(stage):
+    """
+    Context manager accounting a block to stage, when profiling is on.
+    """
+    if _profile is None:
+        return contextlib.nullcontext()
+    return _profile.stage(stage)
 
 
 def get_two_bit_numbers():
@@ -12,6 +66,7 @@ def get_two_bit_numbers():
     return [sum(1 << i for i in bits) for bits in combinations(range(7), 2)]
 
 
+@profiled("masks")
 def generate_valid_sets_1bit(x):
     """
     Given a number x with only one bit set in the low 7 bits,
@@ -43,6 +98,7 @@ def generate_valid_sets_1bit(x):
     return valid_sets
 
 
+@profiled("masks")
 def generate_valid_sets_0bit():
     """
     find all valid sets of 4 numbers that satisfy the following conditions:
@@ -80,6 +136,7 @@ def generate_valid_sets_0bit():
     return valid_sets
 
 
+@profiled("masks")
 def generate_valid_sets_2bit(x):
     """
     Given a number x with 2 bit set in the low 7 bits,
@@ -108,7 +165,14 @@ def generate_valid_sets_2bit(x):
     return valid_sets
 
 
-def find_solutions_2_2(A, B):
+@profiled("find_solutions")
+def find_solutions_2_2(A, B, table=None):
+    """
+    Given the two tag codes A (color a) and B (color b),
+    enumerate all 4-slot solutions as (code_a, code_b) pairs.
+    If an intersection table is given, only keep the solutions
+    whose every slot has at least one card.
+    """
     set_A = generate_valid_sets_1bit(A)
     set_B = generate_valid_sets_1bit(B)
 
@@ -124,17 +188,29 @@ def find_solutions_2_2(A, B):
     for a in set_A:
         for b in set_B:
             for idx in permutations_idx:
-                solutions.append([
+                solution = [
                     (a[idx[0]], b[idx[1]]),
                     (a[idx[2]], b[idx[3]]),
                     (a[idx[4]], b[idx[5]]),
                     (a[idx[6]], b[idx[7]])
-                ])
+                ]
+                if table is not None and not (
+                        solution[0] in table and solution[1] in table
+                        and solution[2] in table and solution[3] in table):
+                    continue
+                solutions.append(solution)
 
     return solutions
 
 
-def find_solutions_3_1(A1, A2):
+@profiled("find_solutions")
+def find_solutions_3_1(A1, A2, table=None):
+    """
+    Given the two tag codes A1, A2 (both of color a),
+    enumerate all 4-slot solutions as (code_a, code_b) pairs.
+    If an intersection table is given, only keep the solutions
+    whose every slot has at least one card.
+    """
     set_A = generate_valid_sets_2bit(A1 | A2)  # two, one1, one2, one3
     set_B = generate_valid_sets_0bit()         # two1, two2, two3, one
 
@@ -152,13 +228,21 @@ def find_solutions_3_1(A1, A2):
     for a in set_A:
         for b in set_B:
             card_fixed = (a[0], b[3])
+            # the fixed slot is shared by all permutations, prune it first
+            if table is not None and card_fixed not in table:
+                continue
             for idx in permutations_idx:
-                solutions.append([
+                solution = [
                     card_fixed,
                     (a[idx[0]], b[idx[1]]),
                     (a[idx[2]], b[idx[3]]),
                     (a[idx[4]], b[idx[5]])
-                ])
+                ]
+                if table is not None and not (
+                        solution[1] in table and solution[2] in table
+                        and solution[3] in table):
+                    continue
+                solutions.append(solution)
     return solutions
 
 
@@ -177,36 +261,41 @@ def generate_tag_codes():
     return sorted(codes)
 
 
-# Get color and code of a given tag
-def get_tag_color_and_code(tag, all_tags):
-    color = next(
-        (i + 1 for i, tags in enumerate(all_tags) if tag in tags), None)
-    index = all_tags[color - 1].index(tag)
-    return color, 1 << index
-
+@profiled("intersection_table")
+def build_intersection_table(cards_encoded_a, cards_encoded_b):
+    """
+    Precompute, once per (ordered) color pair, the cards owning both
+    code_a in color a and code_b in color b.
 
-def get_quads_from_solutions(
-        solutions,
-        cards_encoded_a,
-        cards_encoded_b,
-):
-    flag_next = False
+    Returns a dict: (code_a, code_b) -> tuple of card ids.
+    Empty intersections are left out, so a missing key means "no card".
+    The tuples keep the iteration order of the set intersection,
+    which keeps the output order stable.
+    """
+    table = {}
+    sets_b = {code_b: set(cards_b)
+              for code_b, cards_b in cards_encoded_b.items()}
+    for code_a, cards_a in cards_encoded_a.items():
+        set_a = set(cards_a)
+        for code_b, set_b in sets_b.items():
+            intersection = set_a & set_b
+            if intersection:
+                table[(code_a, code_b)] = tuple(intersection)
+    return table
+
+
+@profiled("get_quads")
+def get_quads_from_solutions(solutions, table):
+    """
+    Expand the solutions into sorted quads of card ids,
+    looking up each slot in the intersection table.
+    """
     quad_list = []
     for s in solutions:
-        # add a 4-array to store the card id, each element is a list
-        tmp_quad = [[] for _ in range(4)]
-        for m in range(4):
-            intersection = set(cards_encoded_a[s[m][0]]) & set(
-                cards_encoded_b[s[m][1]])
-            if not intersection:
-                flag_next = True
-                break
-            else:
-                tmp_quad[m] = intersection
-
-        # if there is no card, skip this solution
-        if flag_next:
-            flag_next = False
+        tmp_quad = [table.get(slot) for slot in s]
+
+        # if there is no card for some slot, skip this solution
+        if not all(tmp_quad):
             continue
 
         for quad in product(*tmp_quad):
@@ -215,50 +304,626 @@ def get_quads_from_solutions(
     return quad_list
 
 
+# ====== NumPy engine ======
+#
+# Same enumeration as above, but the mask sets are uint8 arrays
+# and the cross product / permutation expansion is done by broadcasting.
+# A solution array has shape (N, 4, 2): N solutions, 4 slots, (code_a, code_b).
+# Row order matches the pure-Python functions, so the output is the same.
+
+def _split_low_bit(x):
+    """
+    Split x into (lowest set bit, the remaining bits).
+    """
+    low = x & (~x + np.uint8(1))
+    return low, x ^ low
+
+
+@profiled("masks")
+def generate_valid_sets_1bit_np(x):
+    """
+    NumPy version of generate_valid_sets_1bit, returns an (N, 4) uint8 array.
+    """
+    FULL_MASK = np.uint8(0b1111111)
+    x_low = np.uint8(x) & FULL_MASK
+    two_bit_numbers = np.array(get_two_bit_numbers(), dtype=np.uint8)
+
+    # combinations(two_bit_numbers, 2) in the same order
+    idx_i, idx_j = np.triu_indices(len(two_bit_numbers), 1)
+    two1, two2 = two_bit_numbers[idx_i], two_bit_numbers[idx_j]
+    keep = ((two1 & two2) == 0) & ((two1 & x_low) == 0) & \
+        ((two2 & x_low) == 0)
+    two1, two2 = two1[keep], two2[keep]
+
+    remain = FULL_MASK & ~(two1 | two2 | x_low)
+    one1, one2 = _split_low_bit(remain)
+
+    return np.stack([two1, two2, one1, one2], axis=1)
+
+
+@profiled("masks")
+def generate_valid_sets_0bit_np():
+    """
+    NumPy version of generate_valid_sets_0bit, returns an (N, 4) uint8 array.
+    """
+    FULL_MASK = np.uint8(0b1111111)
+    one_bit_numbers = np.array([1 << i for i in range(7)], dtype=np.uint8)
+    two_bit_numbers = np.array(get_two_bit_numbers(), dtype=np.uint8)
+
+    # (one, two1, two2) with one as the outer loop, then index_i < index_j
+    idx_i, idx_j = np.triu_indices(len(two_bit_numbers), 1)
+    one = np.repeat(one_bit_numbers, len(idx_i))
+    two1 = np.tile(two_bit_numbers[idx_i], len(one_bit_numbers))
+    two2 = np.tile(two_bit_numbers[idx_j], len(one_bit_numbers))
+    keep = ((one & two1) == 0) & ((one & two2) == 0) & ((two1 & two2) == 0)
+    one, two1, two2 = one[keep], two1[keep], two2[keep]
+
+    two3 = FULL_MASK & ~(one | two1 | two2)
+
+    return np.stack([two1, two2, two3, one], axis=1)
+
+
+@profiled("masks")
+def generate_valid_sets_2bit_np(x):
+    """
+    NumPy version of generate_valid_sets_2bit, returns an (N, 4) uint8 array.
+    """
+    FULL_MASK = np.uint8(0b1111111)
+    x_low = np.uint8(x) & FULL_MASK
+    two_bit_numbers = np.array(get_two_bit_numbers(), dtype=np.uint8)
+
+    two = two_bit_numbers[(two_bit_numbers & x_low) == 0]
+    remain = FULL_MASK & ~(two | x_low)
+    one0, remain = _split_low_bit(remain)
+    one1, one2 = _split_low_bit(remain)
+
+    return np.stack([two, one0, one1, one2], axis=1)
+
+
+def build_nonempty_mask(table):
+    """
+    Turn the keys of an intersection table into a 128x128 boolean matrix,
+    so that slots can be checked with fancy indexing.
+    """
+    nonempty = np.zeros((128, 128), dtype=bool)
+    if table:
+        codes = np.array(list(table.keys()), dtype=np.uint8)
+        nonempty[codes[:, 0], codes[:, 1]] = True
+    return nonempty
+
+
+def _expand_solutions_np(set_A, set_B, cols_a, cols_b, nonempty=None):
+    """
+    Cross product of set_A and set_B, expanded by the permutation columns.
+
+    cols_a, cols_b: (P, 4) arrays, the slot m of permutation p is
+    (a[cols_a[p, m]], b[cols_b[p, m]]).
+    """
+    codes_a = set_A[:, None, None, :][..., cols_a]  # (nA, 1, P, 4)
+    codes_b = set_B[None, :, None, :][..., cols_b]  # (1, nB, P, 4)
+    codes_a, codes_b = np.broadcast_arrays(codes_a, codes_b)
+    solutions = np.stack([codes_a, codes_b], axis=-1).reshape(-1, 4, 2)
+
+    if nonempty is not None:
+        keep = nonempty[solutions[..., 0], solutions[..., 1]].all(axis=1)
+        solutions = solutions[keep]
+    return solutions
+
+
+@profiled("find_solutions")
+def find_solutions_2_2_np(A, B, nonempty=None):
+    """
+    NumPy version of find_solutions_2_2, returns an (N, 4, 2) uint8 array.
+    """
+    set_A = generate_valid_sets_1bit_np(A)
+    set_B = generate_valid_sets_1bit_np(B)
+
+    # Same permutations as find_solutions_2_2, split into a / b columns
+    permutations_idx = np.array([
+        (0, 2, 1, 3, 2, 0, 3, 1),
+        (0, 2, 1, 3, 2, 1, 3, 0),
+        (0, 3, 1, 2, 2, 0, 3, 1),
+        (0, 3, 1, 2, 2, 1, 3, 0),
+    ])
+
+    return _expand_solutions_np(
+        set_A, set_B,
+        permutations_idx[:, 0::2], permutations_idx[:, 1::2],
+        nonempty
+    )
+
+
+@profiled("find_solutions")
+def find_solutions_3_1_np(A1, A2, nonempty=None):
+    """
+    NumPy version of find_solutions_3_1, returns an (N, 4, 2) uint8 array.
+    """
+    set_A = generate_valid_sets_2bit_np(A1 | A2)  # two, one1, one2, one3
+    set_B = generate_valid_sets_0bit_np()         # two1, two2, two3, one
+
+    # Same permutations as find_solutions_3_1, with the fixed slot (0, 3)
+    permutations_idx = np.array([
+        (0, 3, 1, 0, 2, 1, 3, 2),
+        (0, 3, 1, 0, 2, 2, 3, 1),
+        (0, 3, 1, 1, 2, 0, 3, 2),
+        (0, 3, 1, 1, 2, 2, 3, 0),
+        (0, 3, 1, 2, 2, 0, 3, 1),
+        (0, 3, 1, 2, 2, 1, 3, 0),
+    ])
+
+    return _expand_solutions_np(
+        set_A, set_B,
+        permutations_idx[:, 0::2], permutations_idx[:, 1::2],
+        nonempty
+    )
+
+
+@profiled("get_quads")
+def get_quads_from_solutions_np(solutions, table):
+    """
+    NumPy version of get_quads_from_solutions.
+    The solutions are expected to be pruned already, so every slot is a hit.
+    """
+    quad_list = []
+    for s in solutions.tolist():
+        tmp_quad = [table[(code_a, code_b)] for code_a, code_b in s]
+        for quad in product(*tmp_quad):
+            quad_list.append(sorted(quad))
+
+    return quad_list
+
+
+# Solvers for each engine:
+#  - "2_2": 2 tags from each color
+#  - "3_1": 3 tags from the first color, 1 tag from the other
+SOLVERS = {
+    "python": {
+        "2_2": find_solutions_2_2,
+        "3_1": find_solutions_3_1,
+        "quads": get_quads_from_solutions,
+        "prune": lambda table: table,
+    },
+    "numpy": {
+        "2_2": find_solutions_2_2_np,
+        "3_1": find_solutions_3_1_np,
+        "quads": get_quads_from_solutions_np,
+        "prune": build_nonempty_mask,
+    },
+}
+
+# Solutions of a tag pair before pruning: the mask sets of both colors
+# crossed, times the slot permutations (the same for every tag pair)
+CANDIDATES_PER_TAG_PAIR = {
+    "2_2": len(generate_valid_sets_1bit(1)) ** 2 * 4,
+    "3_1": len(generate_valid_sets_2bit(3)) * len(generate_valid_sets_0bit()) * 6,
+}
+
+
+# ====== Incremental state ======
+#
+# The quads of a tag pair only depend on the entries of the intersection
+# table whose codes can appear in its solutions. Hashing that slice tells
+# whether the cached quads of the previous run are still valid.
+
+STATE_VERSION = 1
+
+
+def get_solution_codes(case, tagX, tagY):
+    """
+    Get the codes (color a, color b) that the solutions of a tag pair use.
+    """
+    if case == "2_2":
+        set_A = generate_valid_sets_1bit(tagX)
+        set_B = generate_valid_sets_1bit(tagY)
+    else:
+        set_A = generate_valid_sets_2bit(tagX | tagY)
+        set_B = generate_valid_sets_0bit()
+    return ({code for a in set_A for code in a},
+            {code for b in set_B for code in b})
+
+
+def get_table_digest(table, codes_a, codes_b):
+    """
+    Hash the entries of the intersection table restricted to the given codes.
+    The card order of each entry is hashed as well, since it drives the
+    order of the quads.
+    """
+    items = sorted(
+        (key, cards) for key, cards in table.items()
+        if key[0] in codes_a and key[1] in codes_b)
+    return hashlib.sha1(repr(items).encode()).hexdigest()
+
+
+def load_state(path, input_digests):
+    """
+    Load the per-unit state of the previous run.
+    Returns an empty state if there is none, or if it cannot be reused.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("version") != STATE_VERSION:
+        return {}
+    # the tag codes depend on the silver tag list, start over if it changed
+    if state.get("inputs", {}).get("tags_all") != input_digests["tags_all"]:
+        return {}
+    return state.get("units", {})
+
+
+def save_state(path, input_digests, units_state):
+    with open(path, "w") as f:
+        json.dump({
+            "version": STATE_VERSION,
+            "inputs": input_digests,
+            "units": units_state
+        }, f, separators=(',', ':'))
+
+
 # Process all possible tag combinations based on given information
 def process_tag_combinations(
     color_a, color_b,
     color_p_tags, color_q_tags,  # Note: p, q is possible to be the same
-    find_solution_func,
-    cards_encoded_a, cards_encoded_b,
+    case,  # "2_2" or "3_1"
+    table,  # the intersection table of (color_a, color_b)
     tag_cards, quad_dict, card0_dict,
-    tags_len=7
+    tags_len=7,
+    engine="python",
+    state=None,  # tag pair -> cached results of the previous run
+    new_state=None  # tag pair -> results of this run, to be filled
 ):
     sorted_color_pair = sorted([color_a, color_b])
     color_pair_as_key = f"{sorted_color_pair[0]},{sorted_color_pair[1]}"
 
+    find_solution_func = SOLVERS[engine][case]
+    get_quads_func = SOLVERS[engine]["quads"]
+    pruner = SOLVERS[engine]["prune"](table)
+
     for i in range(tags_len):
-        j_start = 0 if find_solution_func == find_solutions_2_2 else i + 1
+        j_start = 0 if case == "2_2" else i + 1
         for j in range(j_start, tags_len):
             tagX, tagY = (1 << i), (1 << j)
 
             # if there is no card with both tags, skip this tag pair
-            if not (set(tag_cards[str(color_p_tags[i])]) &
-                    set(tag_cards[str(color_q_tags[j])])):
+            if not (set(tag_cards[color_p_tags[i]]) &
+                    set(tag_cards[color_q_tags[j]])):
+                if _profile is not None:
+                    _profile.count(skipped_tag_pairs=1)
                 continue
 
+            # generate the key for the tag pair
+            tag_pair_as_key = f"{color_p_tags[i]},{color_q_tags[j]}"
+
+            # reuse the quads of the previous run if the inputs are the same
+            quad_list = None
+            if new_state is not None:
+                digest = get_table_digest(
+                    table, *get_solution_codes(case, tagX, tagY))
+                cached = (state or {}).get(tag_pair_as_key)
+                if cached and cached["digest"] == digest:
+                    quad_list = cached["quads"]
+
             # find solutions
-            quad_list = get_quads_from_solutions(
-                find_solution_func(
-                    tagX, tagY),
-                cards_encoded_a,
-                cards_encoded_b
-            )
+            if quad_list is None:
+                solutions = find_solution_func(tagX, tagY, pruner)
+                quad_list = get_quads_func(solutions, table)
+                if _profile is not None:
+                    _profile.count(
+                        candidates=CANDIDATES_PER_TAG_PAIR[case],
+                        solutions=len(solutions))
+            elif _profile is not None:
+                _profile.count(cached_tag_pairs=1)
+            if _profile is not None:
+                _profile.count(tag_pairs=1, quads=len(quad_list))
+            if new_state is not None:
+                new_state[tag_pair_as_key] = {
+                    "digest": digest, "quads": quad_list}
 
             if not quad_list:
                 continue
 
-            # generate the key for the tag pair
-            tag_pair_as_key = f"{color_p_tags[i]},{color_q_tags[j]}"
-
             # store the results in the corresponding json structure
             quad_dict[color_pair_as_key][tag_pair_as_key] = quad_list
             card0_dict[color_pair_as_key][tag_pair_as_key] = list(
-                set(tag_cards[str(color_p_tags[i])]) & set(
-                    tag_cards[str(color_q_tags[j])])
+                set(tag_cards[color_p_tags[i]]) & set(
+                    tag_cards[color_q_tags[j]])
             )
 
 
+# ====== Work units ======
+#
+# A unit is (color_a, color_b, case), i.e. one process_tag_combinations call.
+# Units share nothing but the read-only tables below, so they can be
+# dispatched to worker processes and merged back in order.
+
+# Read-only tables of the current process, set by init_worker
+_worker_state = {}
+
+
+def init_worker(cards_encoded, tag_cards, silver_tags_int, engine,
+                profile=False):
+    """
+    Store the shared tables once per (worker) process,
+    so they are not pickled again for every unit.
+    """
+    _worker_state["cards_encoded"] = cards_encoded
+    _worker_state["tag_cards"] = tag_cards
+    _worker_state["silver_tags_int"] = silver_tags_int
+    _worker_state["engine"] = engine
+    _worker_state["profile"] = profile
+    if engine == "numpy":
+        import_numpy()
+
+
+def get_units(questions):
+    """
+    List all units in the order of the serial run.
+    """
+    units = []
+    for color_1, color_2 in questions:
+        units.append((color_1, color_2, "2_2"))  # case: [A1, B1]
+        units.append((color_1, color_2, "3_1"))  # case: [A1, A2]
+        units.append((color_2, color_1, "3_1"))  # case: [B1, B2]
+    return units
+
+
+def solve_unit(color_a, color_b, case, state=None):
+    """
+    Run process_tag_combinations for one unit.
+
+    state: the cache of the unit from the previous run,
+    or None if not incremental.
+
+    Returns (color_pair_as_key, quads, card0s, new_state, profile), where
+    quads / card0s map the tag pair key to its results, in insertion order,
+    and profile is the profile dict of the unit (None if profiling is off).
+    """
+    global _profile
+    outer_profile = _profile
+    _profile = Profile() if _worker_state["profile"] else None
+    try:
+        return _solve_unit(color_a, color_b, case, state)
+    finally:
+        _profile = outer_profile
+
+
+def _solve_unit(color_a, color_b, case, state):
+    cards_encoded = _worker_state["cards_encoded"]
+    silver_tags_int = _worker_state["silver_tags_int"]
+
+    color_p_tags = silver_tags_int[color_a - 1]
+    color_q_tags = silver_tags_int[color_b - 1] if case == "2_2" \
+        else color_p_tags
+
+    sorted_color_pair = sorted([color_a, color_b])
+    color_pair_as_key = f"{sorted_color_pair[0]},{sorted_color_pair[1]}"
+    quad_dict = {color_pair_as_key: {}}
+    card0_dict = {color_pair_as_key: {}}
+    new_state = {} if state is not None else None
+
+    table = build_intersection_table(
+        cards_encoded[color_a], cards_encoded[color_b])
+    with profile_stage("process_tag_combinations"):
+        process_tag_combinations(
+            color_a, color_b, color_p_tags, color_q_tags,
+            case, table,
+            _worker_state["tag_cards"], quad_dict, card0_dict,
+            engine=_worker_state["engine"], state=state, new_state=new_state
+        )
+    return (color_pair_as_key,
+            quad_dict[color_pair_as_key], card0_dict[color_pair_as_key],
+            new_state, _profile.to_dict() if _profile is not None else None)
+
+
+def solve_units(units, jobs, cards_encoded, tag_cards, silver_tags_int,
+                engine="python", states=None, profile=False):
+    """
+    Solve all units, serially (jobs=1) or with a process pool,
+    and yield the results in the order of units.
+
+    states: the per-unit caches (same order as units), or None.
+    profile: whether to profile each unit (see solve_unit).
+    """
+    initargs = (cards_encoded, tag_cards, silver_tags_int, engine, profile)
+    if states is None:
+        states = [None] * len(units)
+    if jobs <= 1:
+        init_worker(*initargs)
+        for unit, state in zip(units, states):
+            yield solve_unit(*unit, state)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=initargs) as executor:
+        # map() keeps the order of units, whatever order they finish in
+        yield from executor.map(solve_unit, *zip(*units), states)
+
+
+# ====== Quint dedup ======
+#
+# A quint is a quad plus one of its card0s, sorted. Each quint is only kept
+# in the first solution it appears in (color pairs, then tag pairs, quads
+# and card0s, in order). The quints seen so far are kept packed, far
+# smaller than tuples of ints, and the solutions go into a SolutionPack
+# (columns of arrays) instead of the full_solution dicts.
+
+# A quint as 5 uint16, for the set of dedup_quints_set
+pack_quint = struct.Struct("<5H").pack
+
+
+def dedup_quints_set(questions, quad_dict, card0_dict, id_bits):
+    """
+    Dedup with a set of packed quints (10 bytes each), one card0 at a time.
+    """
+    solutions = SolutionPack.empty()
+    quint_set = set()
+    for color_1, color_2 in questions:
+        color_pair_as_key = f"{color_1},{color_2}"
+        for tag_pair, quads in quad_dict[color_pair_as_key].items():
+            card0s = card0_dict[color_pair_as_key][tag_pair]
+            for quad in quads:
+                tmp_card0_set = []
+                # remove the card0s whose quint is already in a previous solution
+                for card0 in card0s:
+                    quint = pack_quint(*sorted(quad + [card0]))
+                    if quint not in quint_set:
+                        tmp_card0_set.append(card0)
+                        quint_set.add(quint)
+                if tmp_card0_set:
+                    solutions.append(quad, tmp_card0_set, color_pair_as_key,
+                                     tag_pair)
+    return solutions, len(quint_set)
+
+
+def dedup_quints_np(questions, quad_dict, card0_dict, id_bits):
+    """
+    Dedup with a sorted int64 array of packed quints (5 fields of id_bits
+    bits), one color pair at a time: the quints of all (quad, card0) of the
+    color pair are built and checked against the array at once.
+    """
+    if 5 * id_bits > 63:
+        raise ValueError(f"Card ids of {id_bits} bits do not fit "
+                         "5 to an int64, use --dedup set")
+    shifts = np.arange(4, -1, -1, dtype=np.int64) * id_bits
+    solutions = SolutionPack.empty()
+    seen = np.empty(0, dtype=np.int64)
+    for color_1, color_2 in questions:
+        color_pair_as_key = f"{color_1},{color_2}"
+        blocks, quints = [], []
+        for tag_pair, quads in quad_dict[color_pair_as_key].items():
+            card0s = card0_dict[color_pair_as_key][tag_pair]
+            if not quads or not card0s:
+                continue
+            quads = np.array(quads, dtype=np.int64)
+            card0s = np.array(card0s, dtype=np.int64)
+            # [quad][card0] -> sorted quad+[card0], packed. The quads are
+            # sorted, so card0 goes after the cards of the quad below it.
+            quad_cards = quads[:, None, :]
+            card0_cols = card0s[None, :, None]
+            above = quad_cards >= card0_cols
+            quint = (quad_cards << (shifts[:4] - above * id_bits)).sum(axis=2)
+            quint |= card0s[None, :] << ((4 - (~above).sum(axis=2)) * id_bits)
+            quints.append(quint.ravel())
+            blocks.append((tag_pair, quads, card0s))
+        if not blocks:
+            continue
+
+        quints = np.concatenate(quints)
+        # a stable sort puts the first occurrence of each quint first
+        order = np.argsort(quints, kind="stable")
+        quints = quints[order]
+        new = np.ones(len(quints), dtype=bool)
+        new[1:] = quints[1:] != quints[:-1]
+        # and the quints of the previous color pairs are dropped
+        pos = np.searchsorted(seen, quints)
+        found = pos < len(seen)
+        found[found] = seen[pos[found]] == quints[found]
+        new &= ~found
+        keep = np.zeros(len(quints), dtype=bool)
+        keep[order[new]] = True
+        seen = np.insert(seen, pos[new], quints[new])
+
+        start = 0
+        for tag_pair, quads, card0s in blocks:
+            end = start + len(quads) * len(card0s)
+            kept = keep[start:end].reshape(len(quads), len(card0s))
+            start = end
+            counts = kept.sum(axis=1)
+            solutions.append_block(
+                quads[counts > 0].ravel().tolist(),
+                counts[counts > 0].tolist(),
+                np.broadcast_to(card0s, kept.shape)[kept].tolist(),
+                color_pair_as_key, tag_pair)
+    return solutions, len(seen)
+
+
+DEDUP_MODES = {
+    "set": dedup_quints_set,
+    "numpy": dedup_quints_np,
+}
+
+
+def dedup_solutions(questions, quad_dict, card0_dict, max_card_id,
+                    mode="set"):
+    """
+    Number the solutions in the order of the color pairs and tag pairs,
+    removing from each solution the card0s whose quint (sorted quad+[card0])
+    is already in a previous solution. Solutions left with no card0 are
+    dropped.
+
+    Returns (solutions as a SolutionPack, number of quints).
+    """
+    id_bits = max(max_card_id, 1).bit_length()
+    return DEDUP_MODES[mode](questions, quad_dict, card0_dict, id_bits)
+
+
+# ====== Outputs ======
+
+# Solutions per full_solution_bwiki_<k>.json chunk
+CHUNK_SIZE = 15000
+
+
+def write_solutions_json(path, solutions, cnts, with_tag=True):
+    """
+    Stream the solutions cnts of the pack as the json object
+    {cnt: solution}, the same bytes as json.dump of the dict.
+    """
+    with open(path, "w") as f:
+        f.write("{")
+        for i, cnt in enumerate(cnts):
+            solution = solutions.get_solution(cnt)
+            if not with_tag:
+                del solution["t"]
+            f.write(f'{"," if i else ""}"{cnt}":'
+                    f'{json.dumps(solution, separators=(",", ":"))}')
+        f.write("}")
+
+
+def write_solutions(output_dir, solutions):
+    """
+    Write full_solution.json (and its packed copy and index),
+    the full_solution_bwiki chunks and solutions4bwiki_meta.json.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    total_items = len(solutions)
+    with profile_stage("write_full_solution"):
+        write_solutions_json(f"{output_dir}/full_solution.json", solutions,
+                             range(total_items))
+    # feat: the same solutions in a packed binary format (see solution_pack.py)
+    with profile_stage("write_solution_pack"):
+        write_solution_pack(f"{output_dir}/full_solution.bin", solutions)
+    # feat: card -> solution posting lists (see solution_index.py)
+    with profile_stage("write_solution_index"):
+        write_solution_index(f"{output_dir}/solution_index.json",
+                             build_solution_index(solutions))
+    # feat: save the full_solution_bwiki (full_solution without the tag
+    # pairs) in chunks of consecutive solutions
+    total_chunks = (total_items + CHUNK_SIZE - 1) // CHUNK_SIZE
+
+    meta_info = {
+        "total_chunks": total_chunks,
+        "total_items": total_items,
+        "chunk_size": CHUNK_SIZE,
+        "timestamp": int(time.time())
+    }
+
+    # save each chunk
+    for i in range(total_chunks):
+        chunk_index = i + 1
+        start_idx = i * CHUNK_SIZE
+        end_idx = min(start_idx + CHUNK_SIZE, total_items)
+
+        filename = f"full_solution_bwiki_{chunk_index}.json"
+        with profile_stage("write_bwiki_chunk"):
+            write_solutions_json(f"{output_dir}/{filename}", solutions,
+                                 range(start_idx, end_idx), with_tag=False)
+        print(f"Saved chunk {chunk_index}/{total_chunks}: {filename} ({end_idx - start_idx} items)")
+
+    # save the meta info
+    with open(f"{output_dir}/solutions4bwiki_meta.json", "w") as f:
+        json.dump(meta_info, f, separators=(',', ':'))
+
+
 # Main function
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -272,11 +937,48 @@ if __name__ == "__main__":
                         help="Path to card_give_characteristic_grow_list.csv")
     parser.add_argument("-t", "--tags-all", required=True,
                         help="Path to characteristics_normal.csv")
+    parser.add_argument("--loader", choices=tuple(LOADERS), default="csv",
+                        help="How to parse the CSVs (default: csv, "
+                             "pandas needs pandas to be installed)")
     # Arguments related to the output files
     parser.add_argument("-o", "--output-dir", required=True,
                         help="Path to the output directory")
+    # Arguments related to the solver
+    parser.add_argument("--engine", choices=tuple(SOLVERS), default="python",
+                        help="Enumeration engine (default: python)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of worker processes (default: 1)")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="Reuse the results of the previous run "
+                             "(calc_state.json in the output directory)")
+    parser.add_argument("--dedup", choices=tuple(DEDUP_MODES), default="set",
+                        help="How to dedup the quints (default: set, "
+                             "numpy needs numpy to be installed)")
+    # Arguments related to profiling
+    parser.add_argument("--profile", action="store_true",
+                        help="Write a per-stage report "
+                             "(calc_profile.json in the output directory)")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="Dump cProfile stats of the main process "
+                             "(calc_profile.prof in the output directory)")
 
     args = parser.parse_args()
+    if args.engine == "numpy" and importlib.util.find_spec("numpy") is None:
+        parser.error("--engine numpy requires numpy to be installed")
+    if args.dedup == "numpy":
+        if importlib.util.find_spec("numpy") is None:
+            parser.error("--dedup numpy requires numpy to be installed")
+        import_numpy()
+    if args.loader == "pandas" and importlib.util.find_spec("pandas") is None:
+        parser.error("--loader pandas requires pandas to be installed")
+
+    run_start = time.perf_counter()
+    if args.profile:
+        _profile = Profile()
+    if args.cprofile:
+        import cProfile
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
 
     # Generate all 2-tuples as color pairs (sequence does not matter)
     #
@@ -292,7 +994,6 @@ if __name__ == "__main__":
 
     # Encoded tag info
     tag_codes = generate_tag_codes()
-    cards_encoded = {i: {} for i in range(1, 6)}
 
     # Generate all 2-lists as color pairs for 'i_1,i_1,i_2' cards (sequence matters)
     #
@@ -300,167 +1001,94 @@ if __name__ == "__main__":
     # so there are 20 pairs
     color_comb = tuple(permutations(colors, 2))
 
-    # Load all silver tags
-    #
-    # silver tags are the tags with rarity=3,
-    # and should be divided by colors
-    df_tags_all = pd.read_csv(args.tags_all)
-    df_silver_tags = tuple(
-        df_tags_all[df_tags_all['rarity'] == 3].groupby('color'))
-    # silver_tags_int: color[i] -> (tag_id)
-    silver_tags_int = tuple([tuple(df['id']) for _, df in df_silver_tags])
-    silver_tags_str = tuple([tuple(map(str, df['id']))
-                             for _, df in df_silver_tags])
-
-    # Load all cards
-    #
-    # cards are the cards with rarity=4,3
-    df_cards = pd.read_csv(args.cards_lists)
-    df_cards = df_cards[df_cards['rarity'].isin([3, 4])]
-    # delete SR(133, 134), since each of them only provide 1 normal silver tag
-    df_cards = df_cards[~df_cards['id'].isin([133, 134])]
-    # get all valid cards (SSR, SR)
-    valid_cards = tuple(df_cards['id'].sort_values())
-
-    # Load card-tag mappings from base and grow lists
-    #
-    # Note: the characteristics should be filtered by "silver_tags"
-    #  - card_tags_base: card_id -> characteristic_id
-    #  - card_tags_grow: card_id -> characteristic_id
-    # Steps:
-    #  - remove unnecessary columns, then merge them into a single dictionary.
-    #  - filter the characteristics by "silver_tags".
-    # Other data structures:
-    #  - card_tags: card_id -> characteristic_id
-    #  - tag_cards: characteristic_id -> card_id
-    df_card_tags_base = pd.read_csv(args.card_tags_base)[['card_id', 'characteristic_id']]
-    df_card_tags_grow = pd.read_csv(args.card_tags_grow)[['card_id', 'characteristic_id']]
-    # merge the two dataframes to get all card-tag mappings
-    df_card_tags = pd.concat([df_card_tags_base, df_card_tags_grow])
-    # >filter: only keep records of valid cards
-    df_card_tags = df_card_tags[df_card_tags['card_id'].isin(valid_cards)]
-    # >filter: only keep records of silver tags
-    df_card_tags = df_card_tags[df_card_tags['characteristic_id'].isin(
-        [tag for tags in silver_tags_str for tag in tags])]
-    # card_tags: card_id -> [characteristic_id]
-    card_tags = df_card_tags['characteristic_id'].groupby(
-        df_card_tags['card_id']).apply(list).to_dict()
-    # tag_cards: characteristic_id -> [card_id]
-    tag_cards = df_card_tags['card_id'].groupby(
-        df_card_tags['characteristic_id']).apply(list).to_dict()
-
-    # Generate encoded card info with mapping: [color][code] -> [card_id]
-    for card in card_tags:
-        tags = card_tags[card]
-        temp_color_codes = {}
-        for tag in tags:
-            color, code = get_tag_color_and_code(tag, silver_tags_str)
-            if color not in temp_color_codes:
-                temp_color_codes[color] = 0
-            temp_color_codes[color] |= code
-        for color in temp_color_codes:
-            if temp_color_codes[color] not in cards_encoded[color]:
-                cards_encoded[color][temp_color_codes[color]] = []
-            cards_encoded[color][temp_color_codes[color]].append(card)
+    # Load the inputs (see calc_inputs.py)
+    #  - silver_tags_int: color[i] -> (tag_id)
+    #  - tag_cards: characteristic_id -> [card_id]
+    #  - cards_encoded: [color][code] -> [card_id]
+    # The parsed tables are cached next to the outputs, keyed by the
+    # digests of the CSVs, so an unchanged rerun skips the parsing.
+    with profile_stage("load_inputs"):
+        inputs = load_inputs(
+            {name: getattr(args, name) for name in (
+                "cards_lists", "card_tags_base", "card_tags_grow", "tags_all")},
+            f"{args.output_dir}/calc_inputs.json", args.loader)
+    silver_tags_int = inputs["silver_tags"]
+    tag_cards = inputs["tag_cards"]
+    cards_encoded = inputs["cards_encoded"]
 
     # Initialize the two json structures for the output
     card0_dict = {}
     quad_dict = {}
 
-    # Iterate over color pairs ([A])
+    # Iterate over color pairs ([A]), each with 3 cases (see get_units)
     for color_pair in questions:
         color_1, color_2 = color_pair
         color_pair_as_key = f"{color_1},{color_2}"
-        color_1_tags = silver_tags_int[color_1 - 1]
-        color_2_tags = silver_tags_int[color_2 - 1]
 
         # Initialize the two json structures for the current color pair
         card0_dict[color_pair_as_key] = {}
         quad_dict[color_pair_as_key] = {}
 
-        # Iterate over all tag pairs for the selected color pair
-        # case: [A1, B1]
-        process_tag_combinations(
-            color_1, color_2, color_1_tags, color_2_tags,
-            find_solutions_2_2, cards_encoded[color_1], cards_encoded[color_2],
-            tag_cards, quad_dict, card0_dict
-        )
-        # case: [A1, A2]
-        process_tag_combinations(
-            color_1, color_2, color_1_tags, color_1_tags,
-            find_solutions_3_1, cards_encoded[color_1], cards_encoded[color_2],
-            tag_cards, quad_dict, card0_dict
-        )
-        # case: [B1, B2]
-        process_tag_combinations(
-            color_2, color_1, color_2_tags, color_2_tags,
-            find_solutions_3_1, cards_encoded[color_2], cards_encoded[color_1],
-            tag_cards, quad_dict, card0_dict
-        )
-
+    # Load the state of the previous run: unit key -> {tag pair -> cache}
+    units = get_units(questions)
+    unit_keys = [f"{color_a},{color_b},{case}"
+                 for color_a, color_b, case in units]
+    states = None
+    if args.incremental:
+        state_path = f"{args.output_dir}/calc_state.json"
+        input_digests = inputs["digests"]
+        units_state = load_state(state_path, input_digests)
+        states = [units_state.get(key, {}) for key in unit_keys]
+
+    # Merge the results back in the order of the serial run
+    new_units_state = {}
+    unit_profiles = {}
+    with profile_stage("enumerate"):
+        for unit_key, (color_pair_as_key, quads, card0s, new_state,
+                       unit_profile) in zip(
+                unit_keys, solve_units(
+                    units, args.jobs, cards_encoded, tag_cards,
+                    silver_tags_int, args.engine, states, args.profile)):
+            quad_dict[color_pair_as_key].update(quads)
+            card0_dict[color_pair_as_key].update(card0s)
+            new_units_state[unit_key] = new_state
+            unit_profiles[unit_key] = unit_profile
+
+    if args.incremental:
+        total_cnt = recomputed_cnt = 0
+        for unit_key, new_state in new_units_state.items():
+            for tag_pair, cache in new_state.items():
+                old_cache = units_state.get(unit_key, {}).get(tag_pair)
+                total_cnt += 1
+                if not old_cache or old_cache["digest"] != cache["digest"]:
+                    recomputed_cnt += 1
+        print(f"Incremental: {recomputed_cnt}/{total_cnt} tag pairs recomputed")
 
     # Save the results to the output directory
-    cnt = 0
-    full_solution = {}
-    full_solution_bwiki = {}
-    quint_set = set()
-    for color_pair in questions:
-        color_1, color_2 = color_pair
-        color_pair_as_key = f"{color_1},{color_2}"
-        for tag_pair in quad_dict[color_pair_as_key]:
-            for quad in quad_dict[color_pair_as_key][tag_pair]:
-                tmp_card0_set = []
-                # remove the card0 from tmp_card0_set if sorted(quad+[card0]) is already in full_solution_set
-                for card0 in card0_dict[color_pair_as_key][tag_pair]:
-                    tmp_quint = tuple(sorted(quad+[card0]))
-                    if tmp_quint not in quint_set:
-                        tmp_card0_set.append(card0)
-                        quint_set.add(tmp_quint)
-                if len(tmp_card0_set) == 0:
-                    continue
-                current_solution = {
-                    "q": quad, # =quad, the four cards 
-                    "a": tmp_card0_set, # the possible card0s
-                    "c": color_pair_as_key # the color pair
-                }
-                full_solution_bwiki[cnt] = current_solution.copy()
-                current_solution['t'] = tag_pair; # the tag pair
-                full_solution[cnt] = current_solution
-                cnt += 1
-    print(f"Total solutions (quint): {len(quint_set)}")
-
-    os.makedirs(args.output_dir, exist_ok=True)
-    with open(f"{args.output_dir}/full_solution.json", "w") as f:
-        json.dump(full_solution, f, separators=(',', ':'))
-    # with open(f"{args.output_dir}/full_solution_bwiki.json", "w") as f:
-    #     json.dump(full_solution_bwiki, f)
-    # feat: save the full_solution_bwiki in chunks
-    CHUNK_SIZE = 15000
-    sorted_keys = sorted(full_solution_bwiki.keys()) # ensure consistent order
-    total_items = len(sorted_keys)
-    total_chunks = (total_items + CHUNK_SIZE - 1) // CHUNK_SIZE
-    
-    meta_info = {
-        "total_chunks": total_chunks,
-        "total_items": total_items,
-        "chunk_size": CHUNK_SIZE,
-        "timestamp": int(pd.Timestamp.now().timestamp())
-    }
-
-    # save each chunk
-    for i in range(total_chunks):
-        chunk_index = i + 1
-        start_idx = i * CHUNK_SIZE
-        end_idx = start_idx + CHUNK_SIZE
-        current_keys = sorted_keys[start_idx:end_idx]
-        
-        chunk_data = {k: full_solution_bwiki[k] for k in current_keys}
-        
-        filename = f"full_solution_bwiki_{chunk_index}.json"
-        with open(f"{args.output_dir}/{filename}", "w") as f:
-            json.dump(chunk_data, f, separators=(',', ':'))
-        print(f"Saved chunk {chunk_index}/{total_chunks}: {filename} ({len(chunk_data)} items)")
-
-    # save the meta info
-    with open(f"{args.output_dir}/solutions4bwiki_meta.json", "w") as f:
-        json.dump(meta_info, f, separators=(',', ':'))
\ No newline at end of file
+    with profile_stage("dedup_solutions"):
+        solutions, quint_cnt = dedup_solutions(
+            questions, quad_dict, card0_dict, max(inputs["valid_cards"]),
+            args.dedup)
+    print(f"Total solutions (quint): {quint_cnt}")
+    with profile_stage("write_solutions"):
+        write_solutions(args.output_dir, solutions)
+
+    # save the state for the next incremental run
+    if args.incremental:
+        with profile_stage("save_state"):
+            save_state(state_path, input_digests, new_units_state)
+
+    if args.cprofile:
+        cprofiler.disable()
+        cprofiler.dump_stats(f"{args.output_dir}/calc_profile.prof")
+    if args.profile:
+        _profile.count(solutions=len(solutions), quints=quint_cnt)
+        report = build_report(
+            _profile, unit_profiles,
+            {"engine": args.engine, "jobs": args.jobs,
+             "incremental": args.incremental, "loader": args.loader,
+             "dedup": args.dedup},
+            time.perf_counter() - run_start)
+        with open(f"{args.output_dir}/calc_profile.json", "w") as f:
+            json.dump(report, f, separators=(',', ':'))
+        print_report(report)
\ No newline at end of file
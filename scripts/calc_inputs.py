@@ -0,0 +1,241 @@
+"""
+Input loading for calc.py.
+
+Reads the four CSVs and builds the tables the enumerator works on, all
+keyed by integer ids:
+ - silver_tags:   color[i] -> (tag_id), the silver tags (rarity 3) of a color
+ - valid_cards:   sorted ids of the usable cards (SR / SSR)
+ - card_tags:     card_id -> [tag_id]
+ - tag_cards:     tag_id -> [card_id]
+ - cards_encoded: color -> {code: [card_id]}, code being the 7-bit mask of
+                  the silver tags of that color owned by the card
+ - digests:       input name -> sha1 of the file
+
+Two loaders build the same tables: "csv" (the default, standard library
+only) and "pandas", which is only imported when asked for. Parsing is
+skipped altogether when a snapshot of a previous load with the same file
+digests is available. The snapshot is plain json (it is restored from the
+artifacts branch in CI, so it must not be able to run code when loaded).
+"""
+import csv
+import hashlib
+import json
+import os
+
+SNAPSHOT_VERSION = 2
+
+# Input names, as the command line arguments of calc.py
+INPUT_NAMES = ("cards_lists", "card_tags_base", "card_tags_grow", "tags_all")
+
+# SR 133 and 134 only provide 1 normal silver tag each
+EXCLUDED_CARDS = (133, 134)
+
+
+def get_file_digest(path):
+    """
+    Hash the content of an input file.
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# Get color and code of a given tag
+def get_tag_color_and_code(tag, all_tags):
+    color = next(
+        (i + 1 for i, tags in enumerate(all_tags) if tag in tags), None)
+    index = all_tags[color - 1].index(tag)
+    return color, 1 << index
+
+
+def encode_cards(card_tags, silver_tags):
+    """
+    Generate encoded card info with mapping: [color][code] -> [card_id]
+    """
+    cards_encoded = {i: {} for i in range(1, 6)}
+    for card, tags in card_tags.items():
+        temp_color_codes = {}
+        for tag in tags:
+            color, code = get_tag_color_and_code(tag, silver_tags)
+            temp_color_codes[color] = temp_color_codes.get(color, 0) | code
+        for color, code in temp_color_codes.items():
+            cards_encoded[color].setdefault(code, []).append(card)
+    return cards_encoded
+
+
+def read_int(value):
+    """
+    Parse an integer cell, None if it is empty or not an integer.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        yield from csv.DictReader(f)
+
+
+def load_tables_csv(paths):
+    """
+    Build silver_tags, valid_cards, card_tags and tag_cards with the csv
+    module. Same tables as load_tables_pandas, with the card lists in the
+    same order.
+    """
+    # silver tags (rarity=3) by color, colors in increasing order
+    tags_by_color = {}
+    for row in read_rows(paths["tags_all"]):
+        if read_int(row['rarity']) == 3 and read_int(row['color']) is not None:
+            tags_by_color.setdefault(read_int(row['color']), []).append(
+                int(row['id']))
+    silver_tags = tuple(tuple(tags_by_color[color])
+                        for color in sorted(tags_by_color))
+    # the characteristic_id columns also hold names of unknown tags,
+    # so they are compared as strings
+    silver_tags_str = {str(tag) for tags in silver_tags for tag in tags}
+
+    # cards with rarity=4,3
+    valid_cards = tuple(sorted(
+        read_int(row['id']) for row in read_rows(paths["cards_lists"])
+        if read_int(row['rarity']) in (3, 4)
+        and read_int(row['id']) not in (None, *EXCLUDED_CARDS)))
+    valid_set = set(valid_cards)
+
+    # card-tag mappings, base list first, then grow list
+    card_tags, tag_cards = {}, {}
+    for name in ("card_tags_base", "card_tags_grow"):
+        for row in read_rows(paths[name]):
+            card, tag = read_int(row['card_id']), row['characteristic_id']
+            if card not in valid_set or tag not in silver_tags_str:
+                continue
+            card_tags.setdefault(card, []).append(int(tag))
+            tag_cards.setdefault(int(tag), []).append(card)
+    # grouped by card id, as groupby does
+    card_tags = {card: card_tags[card] for card in sorted(card_tags)}
+    return silver_tags, valid_cards, card_tags, tag_cards
+
+
+def load_tables_pandas(paths):
+    """
+    Build silver_tags, valid_cards, card_tags and tag_cards with pandas.
+    """
+    import pandas as pd
+
+    # Load all silver tags
+    #
+    # silver tags are the tags with rarity=3,
+    # and should be divided by colors
+    df_tags_all = pd.read_csv(paths["tags_all"])
+    df_silver_tags = tuple(
+        df_tags_all[df_tags_all['rarity'] == 3].groupby('color'))
+    silver_tags = tuple(tuple(int(tag) for tag in df['id'])
+                        for _, df in df_silver_tags)
+    # the characteristic_id columns also hold names of unknown tags,
+    # so they are compared as strings
+    silver_tags_str = [str(tag) for tags in silver_tags for tag in tags]
+
+    # Load all cards
+    #
+    # cards are the cards with rarity=4,3
+    df_cards = pd.read_csv(paths["cards_lists"])
+    df_cards = df_cards[df_cards['rarity'].isin([3, 4])]
+    df_cards = df_cards[~df_cards['id'].isin(EXCLUDED_CARDS)]
+    valid_cards = tuple(int(card) for card in df_cards['id'].sort_values())
+
+    # Load card-tag mappings from base and grow lists,
+    # only keeping the silver tags of valid cards
+    df_card_tags_base = pd.read_csv(paths["card_tags_base"])[['card_id', 'characteristic_id']]
+    df_card_tags_grow = pd.read_csv(paths["card_tags_grow"])[['card_id', 'characteristic_id']]
+    df_card_tags = pd.concat([df_card_tags_base, df_card_tags_grow])
+    df_card_tags = df_card_tags[df_card_tags['card_id'].isin(valid_cards)]
+    df_card_tags = df_card_tags[df_card_tags['characteristic_id'].isin(
+        silver_tags_str)]
+    card_tags = {
+        int(card): [int(tag) for tag in tags]
+        for card, tags in df_card_tags['characteristic_id'].groupby(
+            df_card_tags['card_id']).apply(list).items()}
+    tag_cards = {
+        int(tag): [int(card) for card in cards]
+        for tag, cards in df_card_tags['card_id'].groupby(
+            df_card_tags['characteristic_id']).apply(list).items()}
+    return silver_tags, valid_cards, card_tags, tag_cards
+
+
+def int_keys(d):
+    return {int(k): v for k, v in d.items()}
+
+
+def inputs_from_json(inputs):
+    """
+    Restore the tuples and the integer keys that json does not keep.
+    """
+    return {
+        "silver_tags": tuple(tuple(tags) for tags in inputs["silver_tags"]),
+        "valid_cards": tuple(inputs["valid_cards"]),
+        "card_tags": int_keys(inputs["card_tags"]),
+        "tag_cards": int_keys(inputs["tag_cards"]),
+        "cards_encoded": {int(color): int_keys(codes)
+                          for color, codes in inputs["cards_encoded"].items()},
+        "digests": inputs["digests"],
+    }
+
+
+def load_snapshot(path, digests):
+    """
+    Get the inputs saved by a previous load, or None if the files changed
+    or the snapshot is not readable.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION or \
+                snapshot["inputs"]["digests"] != digests:
+            return None
+        return inputs_from_json(snapshot["inputs"])
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def save_snapshot(path, inputs):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": SNAPSHOT_VERSION, "inputs": inputs}, f,
+                  separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+LOADERS = {
+    "csv": load_tables_csv,
+    "pandas": load_tables_pandas,
+}
+
+
+def load_inputs(paths, snapshot_path=None, loader="csv"):
+    """
+    Load the inputs of calc.py.
+
+    paths: input name (see INPUT_NAMES) -> path of the CSV
+    snapshot_path: where to cache the result, or None to always parse
+    loader: "csv" or "pandas", used when there is no valid snapshot
+    """
+    digests = {name: get_file_digest(paths[name]) for name in INPUT_NAMES}
+    inputs = load_snapshot(snapshot_path, digests)
+    if inputs is not None:
+        return inputs
+
+    silver_tags, valid_cards, card_tags, tag_cards = LOADERS[loader](paths)
+    inputs = {
+        "silver_tags": silver_tags,
+        "valid_cards": valid_cards,
+        "card_tags": card_tags,
+        "tag_cards": tag_cards,
+        "cards_encoded": encode_cards(card_tags, silver_tags),
+        "digests": digests,
+    }
+    if snapshot_path:
+        save_snapshot(snapshot_path, inputs)
+    return inputs
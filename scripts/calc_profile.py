@@ -0,0 +1,148 @@
+"""
+Per-stage profile of a calc.py run (--profile).
+
+A Profile records, for each stage name:
+ - s:             wall time, not counting the nested stages
+ - calls:         number of times the stage ran
+ - rss_growth_mb: how much the stage (nested stages included) raised the
+                  peak RSS of the process
+ - rss_peak_mb:   peak RSS of the process when the stage last ended
+and free-form counters (solutions kept / pruned, quads...).
+
+Profiles of the work units are built in the worker processes, turned into
+dicts and merged into the report of the main process.
+"""
+from contextlib import contextmanager
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+REPORT_VERSION = 1
+
+
+def get_peak_rss_mb():
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+class Profile:
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._nested = []  # time spent in nested stages, per open stage
+
+    @contextmanager
+    def stage(self, name):
+        self._nested.append(0.0)
+        rss_before = get_peak_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            rss_after = get_peak_rss_mb()
+            stage = self.stages.setdefault(
+                name, {"s": 0.0, "calls": 0, "rss_growth_mb": 0.0,
+                       "rss_peak_mb": 0.0})
+            stage["s"] += elapsed - nested
+            stage["calls"] += 1
+            stage["rss_growth_mb"] += rss_after - rss_before
+            stage["rss_peak_mb"] = rss_after
+
+    def count(self, **counters):
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        return {"stages": self.stages, "counters": self.counters}
+
+
+def merge_profiles(profiles):
+    """
+    Sum the stages and counters of several profile dicts
+    (the peak RSS is the largest one).
+    """
+    merged = {"stages": {}, "counters": {}}
+    for profile in profiles:
+        for name, stage in profile["stages"].items():
+            total = merged["stages"].setdefault(
+                name, {"s": 0.0, "calls": 0, "rss_growth_mb": 0.0,
+                       "rss_peak_mb": 0.0})
+            total["s"] += stage["s"]
+            total["calls"] += stage["calls"]
+            total["rss_growth_mb"] += stage["rss_growth_mb"]
+            total["rss_peak_mb"] = max(total["rss_peak_mb"], stage["rss_peak_mb"])
+        for name, value in profile["counters"].items():
+            merged["counters"][name] = merged["counters"].get(name, 0) + value
+    return merged
+
+
+def rounded(profile):
+    """
+    Round the floats of a profile dict for the report.
+    """
+    return {
+        "stages": {name: {key: round(value, 4) if isinstance(value, float)
+                          else value for key, value in stage.items()}
+                   for name, stage in profile["stages"].items()},
+        "counters": profile["counters"],
+    }
+
+
+def build_report(main_profile, unit_profiles, settings, wall_s):
+    """
+    Build the report of a run.
+
+    main_profile: the Profile of the main process
+    unit_profiles: unit key ("color_a,color_b,case") -> profile dict
+    settings: the options of the run, stored as is
+    """
+    color_pairs = {}
+    for unit_key, profile in unit_profiles.items():
+        color_a, color_b, _ = unit_key.split(",")
+        pair = ",".join(sorted([color_a, color_b]))
+        color_pairs.setdefault(pair, []).append(profile)
+    units_total = merge_profiles(unit_profiles.values())
+    return {
+        "version": REPORT_VERSION,
+        "timestamp": int(time.time()),
+        "settings": settings,
+        "wall_s": round(wall_s, 4),
+        "peak_rss_mb": round(get_peak_rss_mb(), 1),
+        # stages of the main process; the unit stages are summed over the
+        # units, so with --jobs > 1 they add up to more than wall_s
+        "stages": rounded(main_profile.to_dict())["stages"],
+        "counters": main_profile.counters,
+        "units_total": rounded(units_total),
+        "color_pairs": {pair: rounded(merge_profiles(profiles))
+                        for pair, profiles in sorted(color_pairs.items())},
+        "units": {key: rounded(profile)
+                  for key, profile in unit_profiles.items()},
+    }
+
+
+def print_report(report, top=8):
+    """
+    Print the main stages and the slowest unit stages.
+    """
+    print(f"Profile: {report['wall_s']:.2f}s, peak RSS {report['peak_rss_mb']} MB")
+    for title, stages in (("main", report["stages"]),
+                          ("units", report["units_total"]["stages"])):
+        for name, stage in sorted(stages.items(), key=lambda x: -x[1]["s"])[:top]:
+            print(f"  {title:<5} {name:<26} {stage['s']:9.3f}s "
+                  f"{stage['calls']:>7} calls  +{stage['rss_growth_mb']:.1f} MB")
+    counters = report["units_total"]["counters"]
+    if counters.get("candidates"):
+        print(f"  solutions kept {counters['solutions']} / "
+              f"{counters['candidates']} generated "
+              f"({counters['candidates'] - counters['solutions']} pruned)")
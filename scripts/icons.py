@@ -0,0 +1,247 @@
+"""
+Icon optimization stage, run after maintain.py has downloaded the icons.
+
+From public/images/card_icons/Card_icon_<id>.png it produces, under the
+output directory:
+ - thumbs/Card_icon_<id>.{png,webp[,avif]}  resized thumbnails
+ - atlas_<k>.{png,webp[,avif]}               sprite atlases of ATLAS_ICONS icons
+ - atlas.json                                id -> [atlas, x, y] coordinates
+
+Icons are keyed by the id of their file name (the BWiki id, i.e. the
+displayId used by the site). Atlas k holds the ids in
+[k * ATLAS_ICONS, (k + 1) * ATLAS_ICONS), so new cards only touch the last
+atlas. The content hashes of the previous build are kept in
+build_state.json, and only the thumbnails / atlases whose sources changed
+are rebuilt. An icon that fails to load is logged and skipped (and tried
+again by the next build), so one broken download does not stop the stage.
+
+Requires Pillow (pip install pillow).
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+
+from PIL import Image, features
+
+ICON_NAME_RE = re.compile(r'^Card_icon_(\d+)\.png$')
+ATLAS_ICONS = 256  # icons per atlas (a 16 x 16 grid)
+ATLAS_COLUMNS = 16
+STATE_VERSION = 1
+
+
+def get_icon_hashes(icons_dir):
+    """
+    Get id -> sha256 of the icons, from icon_manifest.json when present
+    (see maintain.py), otherwise by hashing the files.
+    """
+    files = {}
+    for p in icons_dir.glob("Card_icon_*.png"):
+        m = ICON_NAME_RE.match(p.name)
+        if m:
+            files[int(m.group(1))] = p
+
+    manifest = {}
+    manifest_path = icons_dir / "icon_manifest.json"
+    if manifest_path.exists():
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = {int(k): v["sha256"] for k, v in json.load(f).items()}
+
+    hashes = {}
+    for icon_id, path in files.items():
+        if icon_id in manifest:
+            hashes[icon_id] = manifest[icon_id]
+        else:
+            with open(path, 'rb') as f:
+                hashes[icon_id] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def load_thumbnail(path, size):
+    with Image.open(path) as im:
+        return im.convert("RGBA").resize((size, size), Image.LANCZOS)
+
+
+def save_variants(im, out_base, webp_quality, avif=False):
+    """
+    Save an image as lossless-optimized PNG, WebP and optionally AVIF
+    (slow to encode, so off by default).
+    """
+    im.save(f"{out_base}.png", optimize=True)
+    im.save(f"{out_base}.webp", quality=webp_quality, method=6)
+    if avif:
+        im.save(f"{out_base}.avif", quality=webp_quality)
+
+
+def build_thumbnail(icon_path, out_base, size, webp_quality, avif=False):
+    save_variants(load_thumbnail(icon_path, size), out_base, webp_quality,
+                  avif)
+    return out_base
+
+
+def build_atlas(atlas_index, icon_paths, out_base, size, webp_quality,
+                avif=False):
+    """
+    Pack the icons (id -> path) of one atlas into a grid, leaving the slots
+    of the icons that fail to load empty.
+    Returns ({id: [atlas_index, x, y]}, [ids of the icons that failed]).
+    """
+    first_id = atlas_index * ATLAS_ICONS
+    rows = (ATLAS_ICONS + ATLAS_COLUMNS - 1) // ATLAS_COLUMNS
+    atlas = Image.new("RGBA", (ATLAS_COLUMNS * size, rows * size))
+    coords, failed = {}, []
+    for icon_id, path in sorted(icon_paths.items()):
+        try:
+            thumbnail = load_thumbnail(path, size)
+        except Exception as e:  # any decoding error of Pillow
+            print(f"WARNING: {path.name} skipped in atlas_{atlas_index}: {e}")
+            failed.append(icon_id)
+            continue
+        slot = icon_id - first_id
+        x, y = (slot % ATLAS_COLUMNS) * size, (slot // ATLAS_COLUMNS) * size
+        atlas.paste(thumbnail, (x, y))
+        coords[icon_id] = [atlas_index, x, y]
+    save_variants(atlas, out_base, webp_quality, avif)
+    return coords, failed
+
+
+def get_atlas_digest(icon_ids, hashes):
+    return hashlib.sha256(json.dumps(
+        [[i, hashes[i]] for i in sorted(icon_ids)]).encode()).hexdigest()
+
+
+def load_state(path, size, avif):
+    if not path.exists():
+        return {"thumbs": {}, "atlases": {}, "coords": {}}
+    with open(path, encoding='utf-8') as f:
+        state = json.load(f)
+    # different output settings invalidate everything
+    if state.get("version") != STATE_VERSION or state.get("size") != size \
+            or state.get("avif") != avif:
+        return {"thumbs": {}, "atlases": {}, "coords": {}}
+    return state
+
+
+def build_icons(icons_dir, out_dir, size=64, webp_quality=80, avif=False,
+                jobs=None):
+    icons_dir, out_dir = Path(icons_dir), Path(out_dir)
+    thumbs_dir = out_dir / "thumbs"
+    thumbs_dir.mkdir(parents=True, exist_ok=True)
+    state_path = out_dir / "build_state.json"
+    state = load_state(state_path, size, avif)
+
+    hashes = get_icon_hashes(icons_dir)
+    icon_path = {i: icons_dir / f"Card_icon_{i}.png" for i in hashes}
+
+    # thumbnails whose source changed
+    stale_thumbs = [i for i in sorted(hashes)
+                    if state["thumbs"].get(str(i)) != hashes[i]]
+    # atlases whose members changed
+    members = {}
+    for i in hashes:
+        members.setdefault(i // ATLAS_ICONS, []).append(i)
+    atlas_digests = {k: get_atlas_digest(ids, hashes)
+                     for k, ids in members.items()}
+    stale_atlases = [k for k in sorted(members)
+                     if state["atlases"].get(str(k)) != atlas_digests[k]]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        thumb_futures = [
+            executor.submit(build_thumbnail, icon_path[i],
+                            thumbs_dir / f"Card_icon_{i}", size, webp_quality,
+                            avif)
+            for i in stale_thumbs]
+        atlas_futures = {
+            k: executor.submit(build_atlas, k,
+                               {i: icon_path[i] for i in members[k]},
+                               out_dir / f"atlas_{k}", size, webp_quality,
+                               avif)
+            for k in stale_atlases}
+        # failed thumbnails / atlases are not recorded in the state, so
+        # that the next build tries them again
+        failed_thumbs, failed_atlases = set(), set()
+        for i, future in zip(stale_thumbs, thumb_futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"WARNING: thumbnail of Card_icon_{i}.png failed: {e}")
+                failed_thumbs.add(i)
+        previous_coords = {int(i): c for i, c in state["coords"].items()
+                           if int(i) in hashes}
+        coords = {i: c for i, c in previous_coords.items()
+                  if i // ATLAS_ICONS not in atlas_futures}
+        for k, future in atlas_futures.items():
+            try:
+                atlas_coords, failed = future.result()
+            except Exception as e:
+                # the previous atlas file, if any, is left as it was
+                print(f"WARNING: atlas_{k} failed: {e}")
+                atlas_coords, failed = {i: c for i, c in previous_coords.items()
+                                        if i // ATLAS_ICONS == k}, members[k]
+            coords.update(atlas_coords)
+            if failed:
+                failed_atlases.add(k)
+
+    # drop the outputs of icons and atlases that no longer exist
+    for i in set(map(int, state["thumbs"])) - set(hashes):
+        for ext in ("png", "webp", "avif"):
+            (thumbs_dir / f"Card_icon_{i}.{ext}").unlink(missing_ok=True)
+    for k in set(map(int, state["atlases"])) - set(members):
+        for ext in ("png", "webp", "avif"):
+            (out_dir / f"atlas_{k}.{ext}").unlink(missing_ok=True)
+
+    with open(out_dir / "atlas.json", "w", encoding='utf-8') as f:
+        json.dump({
+            "size": size,
+            "atlases": [f"atlas_{k}" for k in sorted({c[0] for c in coords.values()})],
+            "icons": {str(i): coords[i] for i in sorted(coords)}
+        }, f, separators=(',', ':'))
+
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        json.dump({
+            "version": STATE_VERSION,
+            "size": size,
+            "avif": avif,
+            "thumbs": {str(i): hashes[i] for i in sorted(hashes)
+                       if i not in failed_thumbs},
+            "atlases": {str(k): atlas_digests[k] for k in sorted(members)
+                        if k not in failed_atlases},
+            "coords": {str(i): coords[i] for i in sorted(coords)}
+        }, f, separators=(',', ':'))
+    os.replace(tmp_path, state_path)
+
+    print(f"Icons: {len(hashes)}, thumbnails rebuilt: "
+          f"{len(stale_thumbs) - len(failed_thumbs)}, atlases rebuilt: "
+          f"{len(stale_atlases)}/{len(members)}, failed: "
+          f"{len(failed_thumbs)} thumbnails, {len(failed_atlases)} atlases")
+
+
+if __name__ == "__main__":
+    base_dir = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(
+        description="Build optimized thumbnails and sprite atlases of card icons")
+    parser.add_argument("-i", "--icons-dir",
+                        default=base_dir / "public" / "images" / "card_icons",
+                        help="Path to the downloaded icons")
+    parser.add_argument("-o", "--output-dir",
+                        default=base_dir / "public" / "images" / "card_icons_opt",
+                        help="Path to the output directory")
+    parser.add_argument("-s", "--size", type=int, default=64,
+                        help="Thumbnail size in pixels (default: 64)")
+    parser.add_argument("-q", "--quality", type=int, default=80,
+                        help="WebP / AVIF quality (default: 80)")
+    parser.add_argument("--avif", action="store_true",
+                        help="Also write AVIF variants (needs Pillow with AVIF)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    if args.avif and not features.check("avif"):
+        parser.error("--avif requires Pillow built with AVIF support")
+
+    build_icons(args.icons_dir, args.output_dir, args.size, args.quality,
+                args.avif, args.jobs)
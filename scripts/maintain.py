@@ -1,18 +1,30 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import csv
+import gzip
+import hashlib
+import io
 import json
 import os
 import sys
+import tempfile
 import time
 import re
+import shutil
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from bs4 import BeautifulSoup
+from urllib.parse import urlsplit
+from bs4 import BeautifulSoup, SoupStrainer
 from http.client import IncompleteRead
-from requests.adapters import HTTPAdapter
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 from urllib3.util.retry import Retry
 
 # ====== 常量 ======
@@ -40,6 +52,26 @@ CHARACTER_MAP = {
     'ミチル': {'id': 21, 'country_id': 5, 'en': 'mitile'}
 }
 RARITY_MAP = {'R': 2, 'SR': 3, 'SSR': 4}
+BWIKI_BASE_URL = os.environ.get("BWIKI_BASE_URL", "https://wiki.biligame.com/mahoyaku")
+BWIKI_API_URL = f"{BWIKI_BASE_URL}/api.php"
+GAMERCH_CARD_LIST_URL = "https://gamerch.com/wizard-promise/117797"
+GAMERCH_PERMANENT_URL = "https://gamerch.com/wizard-promise/175474"
+PLACEHOLDER_MARK = '（仮）'  # gamerch 卡牌列表中占位用空白卡片的 alt 标记
+
+# ====== 请求头 ======
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+BWIKI_HEADERS = {
+    'Referer': 'https://wiki.biligame.com/mahoyaku/Card_1',
+    'Cookie': 'SESSDATA=fake_session_data_can_be_edited'
+}
+GAMERCH_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+# ====== 并发抓取 ======
+BWIKI_FETCH_WORKERS = int(os.environ.get("BWIKI_FETCH_WORKERS", 4))    # 同时抓取的卡牌数上限
+HOST_RATE_LIMIT = float(os.environ.get("HOST_RATE_LIMIT", 5))           # 每个域名每秒最多请求数（<=0 不限）
+BWIKI_API_BATCH = int(os.environ.get("BWIKI_API_BATCH", 50))            # 每次 api.php 请求的页面数（MediaWiki 上限 50，<=0 则逐页 ?action=raw）
 
 # ====== 路径 ======
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,16 +81,406 @@ LOG_DIR.mkdir(parents=True, exist_ok=True)
 
 LAST_CARD_INFO_FILE = LOG_DIR / "last_card_info_id.txt"
 LAST_MISMATCH_FILE = LOG_DIR / "last_characteristics_mismatch_id.txt"
+BWIKI_REVISIONS_FILE = LOG_DIR / "bwiki_revisions.json"  # 卡牌 id -> BWiki 页面最近一次看到的修订（revid、时间）
+BWIKI_FETCH_LEDGER_FILE = LOG_DIR / "bwiki_fetch_ledger.jsonl"  # 逐卡抓取台账（断点续跑、不完整的卡单独重抓）
+HTTP_CACHE_DIR = LOG_DIR / "http-cache"
+TMP_DIR = Path(__file__).resolve().parent / "tmp"  # 本次运行的中间 CSV / JSON
+HTTP_CACHE_TTL = float(os.environ.get("HTTP_CACHE_TTL", 12 * 3600))     # 页面缓存有效期（秒），期内不联网
+HTTP_ARCHIVE_DIR = Path(os.environ.get("HTTP_ARCHIVE_DIR", LOG_DIR / "http-archive"))  # --record / --replay 的响应存档
 
 ICON_DIR = DATA_DIR.parent / "images" / "card_icons"  # 即 public/images/card_icons/
 ICON_DIR.mkdir(parents=True, exist_ok=True)
 
 ICON_NAME_RE = re.compile(r'^Card_icon_(\d+)\.png$')
+ICON_DOWNLOAD_WORKERS = int(os.environ.get("ICON_DOWNLOAD_WORKERS", BWIKI_FETCH_WORKERS))  # 同时下载的图标数上限
+ICON_MANIFEST_FILE = ICON_DIR / "icon_manifest.json"  # BWiki 编号 -> 大小、sha256、抓取时间
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_IEND = b'IEND\xaeB`\x82'  # PNG 末尾 IEND 块（类型 + CRC），用于识别截断的文件
 
 # ====== 日志工具 ======
 def log(level, msg):
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {level}: {msg}")
 
+# ====== HTTP 客户端 ======
+class HostRateLimiter:
+    """
+    按域名限速：同一域名相邻两次请求之间至少间隔 1/rate 秒，线程安全。
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_time = {}
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time.get(host, now))
+            self.next_time[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class HttpClient:
+    """
+    全局共享的 HTTP 客户端：
+    - 一个 Session，按域名保持长连接池（keep-alive），避免每次请求重新握手
+    - 统一的重试/退避（含 5xx 与 IncompleteRead）
+    - 默认请求头 + 按域名限速
+    - 统计本次运行新建/复用的连接数
+    """
+    def __init__(self, pool_size=BWIKI_FETCH_WORKERS, retries=3, backoff_factor=0.5,
+                 status_forcelist=(500, 502, 503, 504), headers=None, rate=HOST_RATE_LIMIT):
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.rate_limiter = HostRateLimiter(rate)
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        self.retry = Retry(total=retries, read=retries, connect=retries,
+                           backoff_factor=backoff_factor, status_forcelist=status_forcelist,
+                           raise_on_status=False)
+        self.pool_size = max(1, pool_size)
+        # pool_maxsize 是每个域名保留的连接数，应不小于并发线程数
+        self.mount(HTTPAdapter(max_retries=self.retry, pool_maxsize=self.pool_size))
+
+    def mount(self, adapter):
+        self.adapter = adapter
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def use_archive(self, archive, replay=False):
+        """
+        --record：照常联网，每个响应同时存入 archive；
+        --replay：不联网，所有请求都由 archive 中录好的响应应答（不限速）。
+        """
+        if replay:
+            self.rate_limiter = HostRateLimiter(0)
+            self.mount(ReplayAdapter(archive))
+        else:
+            self.mount(RecordingAdapter(archive, max_retries=self.retry, pool_maxsize=self.pool_size))
+
+    def get(self, url, headers=None, **kwargs):
+        for attempt in range(self.retries):
+            self.rate_limiter.wait(url)
+            try:
+                return self.session.get(url, headers=headers, **kwargs)
+            except (IncompleteRead, requests.exceptions.ChunkedEncodingError):
+                time.sleep(self.backoff_factor * (2 ** attempt))
+        raise ConnectionError(f"请求失败: {url}")
+
+    def connection_stats(self):
+        """
+        返回 (新建连接数, 复用连接次数)。
+        """
+        opened = requests_sent = 0
+        if not hasattr(self.adapter, "poolmanager"):
+            return 0, 0  # 回放，没有真实连接
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            opened += pool.num_connections
+            requests_sent += pool.num_requests
+        return opened, max(0, requests_sent - opened)
+
+
+class HttpArchive:
+    """
+    HTTP 响应存档（gzip 压缩、按内容寻址），用于离线、可重复地跑完整的 main()：
+    - objects/<sha256>.gz：响应体与快照文件，相同内容只存一份
+    - index.json：请求（"GET 完整URL"）-> 按请求顺序的响应列表 [{"status", "headers", "body"}]；
+      回放时第 n 次请求得到第 n 个响应，次数超出时重复最后一个
+    - snapshot.json：录制开始时 main() 读取的本地状态（数据 CSV、maintain-log 状态文件、
+      图标清单），相对 BASE_DIR 的路径 -> 内容哈希；restore_snapshot 可在别处还原出同样的起点
+    """
+    # 回放时需要的响应头（Location：重定向，如 Special:Redirect 的图标）；
+    # 响应体存的是解压后的内容，不保留 Content-Encoding
+    KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Location')
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.index_path = self.root / "index.json"
+        self.snapshot_path = self.root / "snapshot.json"
+        self.lock = threading.Lock()
+        self.index = {}
+        if self.index_path.exists():
+            with open(self.index_path, encoding='utf-8') as f:
+                self.index = json.load(f)
+        self.replayed = {}  # 请求 -> 已回放次数
+        self.misses = []
+
+    @staticmethod
+    def request_key(request):
+        return f"{request.method} {request.url}"
+
+    def put_object(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.objects_dir / f"{digest}.gz"
+        if not path.exists():
+            self.objects_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            with gzip.open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get_object(self, digest: str) -> bytes:
+        with gzip.open(self.objects_dir / f"{digest}.gz", 'rb') as f:
+            return f.read()
+
+    def record(self, request, resp):
+        """
+        记下响应：条目按请求顺序先占位，resp.raw 换成 RecordingStream，
+        调用方照常（stream=True 时边下边）读，读完时响应体存入存档。
+        """
+        entry = {
+            "status": resp.status_code,
+            "headers": {k: resp.headers[k] for k in self.KEPT_HEADERS if k in resp.headers},
+            "body": None,
+        }
+        with self.lock:
+            self.index.setdefault(self.request_key(request), []).append(entry)
+
+        def done(body):
+            entry["body"] = self.put_object(body)
+        resp.raw = RecordingStream(resp.raw, done)
+
+    def replay(self, request):
+        """返回 (status, headers, body)；存档中没有该请求时返回 None。"""
+        key = self.request_key(request)
+        with self.lock:
+            entries = self.index.get(key)
+            if not entries:
+                self.misses.append(key)
+                return None
+            n = self.replayed.get(key, 0)
+            self.replayed[key] = n + 1
+            entry = entries[min(n, len(entries) - 1)]
+        return entry["status"], entry["headers"], self.get_object(entry["body"])
+
+    def save(self):
+        with self.lock:
+            # 没读完就关闭的响应没有完整的响应体，不存
+            index = {key: [entry for entry in entries if entry["body"] is not None]
+                     for key, entries in self.index.items()}
+            self.index = {key: entries for key, entries in index.items() if entries}
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.index_path)
+
+    def save_snapshot(self, paths):
+        snapshot = {path.relative_to(BASE_DIR).as_posix(): self.put_object(path.read_bytes())
+                    for path in paths if path.exists()}
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.snapshot_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=1)
+
+    def restore_snapshot(self, base_dir: Path):
+        """把录制开始时的本地状态写到 base_dir 下（同样的相对路径），返回写出的文件数。"""
+        with open(self.snapshot_path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+        for rel_path, digest in snapshot.items():
+            path = Path(base_dir) / rel_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(self.get_object(digest))
+        return len(snapshot)
+
+
+class RecordingStream:
+    """
+    urllib3 响应流的包装：读到的（已解压的）内容原样交给调用方，同时记下，
+    读到结尾时把整个响应体交给 on_done。其余属性都转给原响应。
+    """
+    def __init__(self, raw, on_done):
+        self._raw = raw
+        self._on_done = on_done
+        self._chunks = []
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self._on_done(b''.join(self._chunks))
+            self._chunks = []
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._chunks.append(chunk)
+            yield chunk
+        self._finish()
+
+    def read(self, amt=None, *args, **kwargs):
+        data = self._raw.read(amt, *args, **kwargs)
+        self._chunks.append(data)
+        if amt is None or not data:
+            self._finish()
+        return data
+
+
+class RecordingAdapter(HTTPAdapter):
+    """照常发出请求，并把（重试之后的）响应存入存档。"""
+    def __init__(self, archive, **kwargs):
+        self.archive = archive
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        resp = super().send(request, **kwargs)
+        # 不在这里读响应体：stream=True 时调用方仍是边下边读，读完才存档
+        self.archive.record(request, resp)
+        return resp
+
+
+class ReplayAdapter(BaseAdapter):
+    """本地替身：不联网，用存档中的响应应答；没有录到的请求按连接失败处理。"""
+    def __init__(self, archive):
+        super().__init__()
+        self.archive = archive
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        recorded = self.archive.replay(request)
+        if recorded is None:
+            raise requests.exceptions.ConnectionError(f"回放存档中没有该请求: {request.url}", request=request)
+        status, headers, body = recorded
+        resp = requests.Response()
+        resp.status_code = status
+        resp.headers = CaseInsensitiveDict(headers)
+        resp.headers['Content-Length'] = str(len(body))
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp.raw = io.BytesIO(body)
+        resp.url = request.url
+        resp.request = request
+        resp.reason = "Replayed"
+        return resp
+
+    def close(self):
+        pass
+
+
+http_client = HttpClient(headers=DEFAULT_HEADERS)
+
+# gamerch 页面的解析器，默认标准库 html.parser；可用环境变量 GAMERCH_HTML_PARSER 改为 lxml（需另装）
+GAMERCH_HTML_PARSER = os.environ.get("GAMERCH_HTML_PARSER") or 'html.parser'
+
+
+class RowTable:
+    """
+    gamerch 列表页的表格行：只构建 <tr>、<img> 及其子节点（SoupStrainer），不建整页的树。
+    - rows：文档顺序的所有 <tr>（含嵌套表格的行，与 soup.find_all('tr') 一致）
+    - alts：文档顺序的整页所有 img alt 文本（含不在表格行里的 img，与 soup.find_all('img') 一致）
+    - alt_rows：alt 文本 -> 第一个包含该 img 的行号（一次建好，定位起点不必逐行查找）
+    整页都解析：页面前部（如横幅表格）也可能有占位卡，在哪里停止由调用方在起点之后判断。
+    """
+    def __init__(self, content: bytes, parser=None):
+        soup = BeautifulSoup(content, parser or GAMERCH_HTML_PARSER,
+                             parse_only=SoupStrainer(['tr', 'img']))
+        self.rows = soup.find_all('tr')
+        self.alts = [img['alt'] for img in soup.find_all('img', alt=True)]
+        self.alt_rows = {}
+        for i, tr in enumerate(self.rows):
+            for img in tr.find_all('img', alt=True):
+                self.alt_rows.setdefault(img['alt'], i)
+
+    def find_alt(self, text):
+        """文档顺序中第一个包含 text 的 alt，没有则 None。"""
+        return next((alt for alt in self.alts if alt and text in alt), None)
+
+    def find_row(self, alt):
+        """第一个 img alt 包含 alt 的行号，没有则 None。"""
+        if alt in self.alt_rows:
+            return self.alt_rows[alt]
+        return next((i for i, tr in enumerate(self.rows)
+                     if tr.find('img', alt=lambda x: x and alt in x)), None)
+
+
+class PageCache:
+    """
+    页面缓存：
+    - 每个 URL 每次运行只抓取、解析一次，各阶段共享同一份解析结果
+    - 磁盘缓存（cache_dir 下）：TTL 内直接使用，不联网；
+      过期后带 ETag/Last-Modified 发条件请求，304 则继续沿用缓存
+    """
+    def __init__(self, client, cache_dir, ttl=HTTP_CACHE_TTL):
+        self.client = client
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None  # None：不用磁盘缓存
+        self.ttl = ttl
+        self.contents = {}
+        self.tables = {}
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return self.cache_dir / f"{key}.body", self.cache_dir / f"{key}.json"
+
+    def _load(self, url):
+        if self.cache_dir is None:
+            return None, None
+        body_path, meta_path = self._paths(url)
+        if not body_path.exists() or not meta_path.exists():
+            return None, None
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        except ValueError:
+            return None, None
+        return body_path.read_bytes(), meta
+
+    def _save(self, url, content, meta):
+        if self.cache_dir is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        body_path, meta_path = self._paths(url)
+        body_path.write_bytes(content)
+        meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+
+    def get_content(self, url, headers=None):
+        if url in self.contents:
+            return self.contents[url]
+
+        content, meta = self._load(url)
+        if content is not None and time.time() - meta.get('fetched_at', 0) < self.ttl:
+            log("INFO", f"使用页面缓存（未过期）: {url}")
+            self.contents[url] = content
+            return content
+
+        request_headers = dict(headers or {})
+        if content is not None:
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                request_headers['If-Modified-Since'] = meta['last_modified']
+        resp = self.client.get(url, headers=request_headers)
+
+        if resp.status_code == 304 and content is not None:
+            log("INFO", f"页面未修改（304），沿用缓存: {url}")
+        elif resp.status_code == 200:
+            content = resp.content
+            meta = {
+                'url': url,
+                'etag': resp.headers.get('ETag'),
+                'last_modified': resp.headers.get('Last-Modified'),
+            }
+        else:
+            raise ConnectionError(f"请求失败，状态码: {resp.status_code}, url={url}")
+
+        meta['fetched_at'] = time.time()
+        self._save(url, content, meta)
+        self.contents[url] = content
+        return content
+
+    def get_table(self, url, headers=None):
+        if url not in self.tables:
+            self.tables[url] = RowTable(self.get_content(url, headers))
+        return self.tables[url]
+
+
+page_cache = PageCache(http_client, HTTP_CACHE_DIR)
+
 # ====== 图标补全：工具函数 ======
 
 
@@ -78,76 +500,170 @@ def get_existing_icon_ids(icons_dir: Path) -> set[int]:
     return ids
 
 
-def get_card_ids_from_csv(card_csv: Path) -> set[int]:
+def load_icon_manifest(manifest_path: Path):
     """
-    读取 character_card.csv 的全部 id（整数化），用于与已有图标做差集补全“历史漏下的”。
+    读取图标清单，返回 {BWiki编号: {"size", "sha256", "fetched_at"}}；清单不存在时返回 None。
     """
-    ids = set()
-    if not card_csv.exists():
-        return ids
-    with open(card_csv, newline='', encoding='utf-8') as f:
-        for row in csv.DictReader(f):
-            v = row.get('id')
-            if v is not None and str(v).strip().isdigit():
-                ids.add(int(v))
-    return ids
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, encoding='utf-8') as f:
+        return {int(k): v for k, v in json.load(f).items()}
 
 
+def save_icon_manifest(manifest_path: Path, manifest: dict):
+    """
+    按编号升序写回图标清单（先写临时文件再替换，避免写坏）。
+    """
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({str(k): manifest[k] for k in sorted(manifest)}, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+def make_icon_entry(path: Path, fetched_at=None) -> dict:
+    """
+    计算图标文件的清单条目。
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return {
+        "size": size,
+        "sha256": digest.hexdigest(),
+        "fetched_at": int(fetched_at if fetched_at is not None else path.stat().st_mtime)
+    }
+
 
+def verify_icons(icons_dir: Path, manifest: dict, max_workers=ICON_DOWNLOAD_WORKERS) -> set[int]:
+    """
+    并行重新计算目录下所有图标的哈希，与清单比对：
+    - 损坏、与清单不符、清单里有但文件已丢失的图标：从清单移除并删除文件，等待重新下载
+    - 文件完好但不在清单里的图标：补录进清单
+    返回需要重新下载的 BWiki 编号集合。
+    """
+    on_disk = get_existing_icon_ids(icons_dir)
+
+    def check(bwiki_id):
+        path = icons_dir / f"Card_icon_{bwiki_id}.png"
+        problem = check_png_file(path)
+        if problem:
+            return bwiki_id, None, problem
+        entry = make_icon_entry(path)
+        known = manifest.get(bwiki_id)
+        if known and (known["size"], known["sha256"]) != (entry["size"], entry["sha256"]):
+            return bwiki_id, None, "与清单哈希不符"
+        return bwiki_id, known or entry, ""
+
+    bad_ids = set(manifest) - on_disk
+    for bwiki_id in sorted(bad_ids):
+        log("WARN", f"图标文件丢失 bwiki_id={bwiki_id}，将重新下载")
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for bwiki_id, entry, problem in executor.map(check, sorted(on_disk)):
+            if entry:
+                manifest[bwiki_id] = entry
+                continue
+            log("WARN", f"图标损坏 bwiki_id={bwiki_id}: {problem}，将重新下载")
+            (icons_dir / f"Card_icon_{bwiki_id}.png").unlink(missing_ok=True)
+            bad_ids.add(bwiki_id)
+    for bwiki_id in bad_ids:
+        manifest.pop(bwiki_id, None)
+    log("INFO", f"图标校验完成：完好 {len(manifest)} 张，待重新下载 {len(bad_ids)} 张")
+    return bad_ids
 
 
-def download_icon_for_id(card_id: int, icons_dir: Path) -> str:
+def check_png_file(path: Path, expected_size=None) -> str:
+    """
+    检查 PNG 文件是否完整，返回空字符串表示正常，否则返回问题描述。
     """
-    下载图标，返回'success'（新下载）、'exists'（已存在）、'fail'（失败）。
+    size = path.stat().st_size
+    if expected_size is not None and size != expected_size:
+        return f"长度不符 {size}/{expected_size}"
+    if size < len(PNG_SIGNATURE) + len(PNG_IEND):
+        return f"文件过小 {size}"
+    with open(path, 'rb') as f:
+        if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+            return "PNG 签名错误"
+        f.seek(-len(PNG_IEND), os.SEEK_END)
+        if f.read() != PNG_IEND:
+            return "缺少 IEND（文件被截断）"
+    return ""
+
+
+def download_icon_for_id(card_id: int, icons_dir: Path):
+    """
+    下载图标，返回 (结果, 清单条目)，结果为'success'（新下载）、'exists'（已存在）、'fail'（失败），
+    新下载时清单条目为 {"size", "sha256", "fetched_at"}，否则为 None。
+    响应体流式写入同目录的临时文件，校验通过后再原子替换到正式路径，
+    中途失败不会留下半截的 PNG。
     """
     bwiki_id = get_bwiki_card_page_id(card_id)
     if bwiki_id < 1:
-        return 'fail'
+        return 'fail', None
     out_path = icons_dir / f"Card_icon_{bwiki_id}.png"
     if out_path.exists():
-        return 'exists'
+        return 'exists', None
 
-    url = f"https://wiki.biligame.com/mahoyaku/Special:Redirect/file/Card_icon_{bwiki_id}.png"
+    url = f"{BWIKI_BASE_URL}/Special:Redirect/file/Card_icon_{bwiki_id}.png"
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Referer': 'https://wiki.biligame.com/mahoyaku/Card_1',
-            'Cookie': 'SESSDATA=fake_session_data_can_be_edited'
-        }
-        resp = retry_request(url, headers=headers)
+        resp = http_client.get(url, headers=BWIKI_HEADERS, stream=True)
     except Exception as e:
         log("ERROR", f"图标下载异常 id={card_id} (bwiki_id={bwiki_id}): {e}")
-        return 'fail'
-
-    if not resp or resp.status_code != 200:
-        log("WARN", f"图标下载失败/未找到 id={card_id} (bwiki_id={bwiki_id}), status={getattr(resp, 'status_code', None)}")
-        return 'fail'
-
-    try:
-        with open(out_path, 'wb') as f:
-            f.write(resp.content)
-        log("LOG", f"图标下载成功 id={card_id} (bwiki_id={bwiki_id}) -> {out_path.name}")
-        return 'success'
-    except Exception as e:
-        log("ERROR", f"写入图标失败 id={card_id} (bwiki_id={bwiki_id}): {e}")
-        return 'fail'
-
-
+        return 'fail', None
+
+    with resp:
+        if resp.status_code != 200:
+            log("WARN", f"图标下载失败/未找到 id={card_id} (bwiki_id={bwiki_id}), status={resp.status_code}")
+            return 'fail', None
+
+        expected_size = resp.headers.get('Content-Length')
+        expected_size = int(expected_size) if expected_size and expected_size.isdigit() else None
+        # 不以 Card_icon_ 开头，不会被 get_existing_icon_ids 当作已有图标
+        fd, tmp_name = tempfile.mkstemp(dir=icons_dir, prefix=f".icon_{bwiki_id}_", suffix=".part")
+        tmp_path = Path(tmp_name)
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in resp.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+                    digest.update(chunk)
+            # 有 Content-Encoding 时 Content-Length 是压缩后的长度，无法比对
+            problem = check_png_file(tmp_path, None if resp.headers.get('Content-Encoding') else expected_size)
+            if problem:
+                log("WARN", f"图标校验失败 id={card_id} (bwiki_id={bwiki_id}): {problem}")
+                tmp_path.unlink()
+                return 'fail', None
+            entry = {"size": tmp_path.stat().st_size, "sha256": digest.hexdigest(), "fetched_at": int(time.time())}
+            os.replace(tmp_path, out_path)
+        except Exception as e:
+            log("ERROR", f"写入图标失败 id={card_id} (bwiki_id={bwiki_id}): {e}")
+            tmp_path.unlink(missing_ok=True)
+            return 'fail', None
 
+    log("LOG", f"图标下载成功 id={card_id} (bwiki_id={bwiki_id}) -> {out_path.name}")
+    return 'success', entry
 
 
-def download_missing_icons(existing_ids: set[int], all_card_ids: set[int], icons_dir: Path) -> int:
+def download_missing_icons(manifest: dict, all_card_ids: set[int], icons_dir: Path,
+                           max_workers=ICON_DOWNLOAD_WORKERS) -> int:
     """
-    只下载本地真正缺失的BWiki编号图片。
-    existing_ids: 已有的BWiki编号集合
+    只下载本地真正缺失的BWiki编号图片，最多 max_workers 张并发下载。
+    manifest: 图标清单（BWiki编号 -> 条目），清单中的编号视为已有；下载过程中增量更新并写回
     all_card_ids: character_card.csv的原始id集合
     """
+    existing_ids = set(manifest)
+    # 清理上次中断遗留的临时文件
+    for p in icons_dir.glob(".icon_*.part"):
+        p.unlink(missing_ok=True)
+
     if not all_card_ids:
         return 0
 
     # 只对每个card_id映射后的bwiki_id判断是否缺失
     missing = []
-    for cid in all_card_ids:
+    for cid in sorted(all_card_ids):
         bwiki_id = get_bwiki_card_page_id(cid)
         if bwiki_id < 1:
             continue
@@ -155,34 +671,146 @@ def download_missing_icons(existing_ids: set[int], all_card_ids: set[int], icons
             missing.append((cid, bwiki_id))
 
     new_count = 0
-    for cid, _ in missing:
-        result = download_icon_for_id(cid, icons_dir)
-        if result == 'success':
-            new_count += 1
+    total_bytes = 0
+    start = time.monotonic()
+    manifest_path = icons_dir / ICON_MANIFEST_FILE.name
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = executor.map(lambda m: download_icon_for_id(m[0], icons_dir), missing)
+        for (_, bwiki_id), (result, entry) in zip(missing, results):
+            if result == 'exists':
+                # 文件在但不在清单里（例如手动放入），校验后补录
+                path = icons_dir / f"Card_icon_{bwiki_id}.png"
+                if not check_png_file(path):
+                    manifest[bwiki_id] = make_icon_entry(path)
+            elif result == 'success':
+                manifest[bwiki_id] = entry
+                new_count += 1
+                total_bytes += entry["size"]
+                # 每下载一批就写回一次清单，中途中断也不会丢失已下载的记录
+                if new_count % 50 == 0:
+                    save_icon_manifest(manifest_path, manifest)
+    save_icon_manifest(manifest_path, manifest)
+    elapsed = time.monotonic() - start
     log("INFO", f"卡图标补全完成：新增 {new_count} 张，缺失总数 {len(missing)} 张（目录={icons_dir}）")
+    if new_count:
+        log("INFO", f"图标下载量 {total_bytes / 1024:.1f} KB，用时 {elapsed:.1f}s，"
+                    f"吞吐 {total_bytes / 1024 / max(elapsed, 1e-6):.1f} KB/s")
     return new_count
 
+# ====== 卡牌目录（内存模型） ======
+class CardRecord:
+    """
+    character_card.csv 的一行。id 为整数，其余字段保留原始字符串，写回时逐字节不变。
+    FIELDS 以外的列（在脚本之外加的）原样存在 extra 里，写回时一并写出。
+    """
+    FIELDS = ('id', 'title', 'character_id', 'rarity', 'country',
+              'character_first_name_en', 'series', 'manually_added')
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, row):
+        self.id = int(row['id'])
+        for field in self.FIELDS[1:]:
+            v = row.get(field)
+            setattr(self, field, '' if v is None else str(v))
+        # 键为 None 的是表头之外多出的单元格，不保留
+        self.extra = {k: '' if v is None else str(v) for k, v in row.items()
+                      if k is not None and k not in self.FIELDS}
+
+    def to_row(self, fieldnames=FIELDS):
+        return [getattr(self, field) if field in self.FIELDS else self.extra.get(field, '')
+                for field in fieldnames]
+
+
+class Catalogue:
+    """
+    本次运行用到的卡牌数据，每个 CSV 只解析一次：
+    - character_card.csv：按 id / title 的 O(1) 查询、最大 id；修改后标记为脏，
+      运行结束时由 save() 统一写回
+    - characteristics_normal.csv：特性名 -> 特性 id（只读）
+    """
+    def __init__(self, data_dir: Path):
+        self.cards_path = data_dir / "character_card.csv"
+        self.cards = {}        # id -> CardRecord，保持文件中的顺序
+        self.title_index = {}  # title -> id（重名时取靠后的一行）
+        self.characteristics = {}
+        self.fieldnames = list(CardRecord.FIELDS)  # 写回时的表头：沿用文件原有的列与顺序
+        self.dirty = False
+
+        if self.cards_path.exists():
+            with open(self.cards_path, newline='', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    if str(row.get('id') or '').strip().isdigit():
+                        record = CardRecord(row)
+                        self.cards[record.id] = record
+                if reader.fieldnames:
+                    missing = [field for field in CardRecord.FIELDS if field not in reader.fieldnames]
+                    if missing:
+                        log("WARN", f"{self.cards_path} 表头缺少列 {missing}，写回时补在末尾")
+                    self.fieldnames = list(reader.fieldnames) + missing
+        self._build_title_index()
+
+        with open(data_dir / "characteristics_normal.csv", newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                self.characteristics[row['title']] = int(row['id'])
+
+    def _build_title_index(self):
+        self.title_index = {r.title.strip(): r.id for r in self.cards.values() if r.title.strip()}
+
+    def get(self, card_id):
+        return self.cards.get(card_id)
+
+    def get_id_by_title(self, title):
+        return self.title_index.get(title)
+
+    def card_ids(self, start_id=0):
+        """按文件顺序返回 id >= start_id 的卡牌 id。"""
+        return [card_id for card_id in self.cards if card_id >= start_id]
+
+    def max_card_id(self):
+        return max(self.cards, default=0)
+
+    def replace_from(self, start_id, rows):
+        """
+        与 overwrite_from_id_generic 相同的合并规则：保留 id < start_id 的旧卡，
+        再追加新卡（rows 为 dict 列表）。只改内存，save() 时写回。
+        """
+        cards = {card_id: r for card_id, r in self.cards.items() if card_id < start_id}
+        kept_count = len(cards)
+        for row in rows:
+            record = CardRecord(row)
+            cards[record.id] = record
+        log("LOG", f"更新卡牌目录: 保留旧行 {kept_count}，追加新行 {len(rows)}（起点 id>={start_id}）")
+        self.cards = cards
+        self._build_title_index()
+        self.dirty = True
+
+    def save(self):
+        """把有改动的 CSV 写回（原子替换）。"""
+        if not self.dirty:
+            return
+        with atomic_csv_writer(self.cards_path) as f:
+            writer = csv.writer(f)
+            writer.writerow(self.fieldnames)
+            writer.writerows(r.to_row(self.fieldnames) for r in self.cards.values())
+        self.dirty = False
+        log("INFO", f"已写回 {self.cards_path}（{len(self.cards)} 张卡）")
+
 # ====== 工具函数 ======
 def read_last_value_from_csv(csv_path, field):
     if not os.path.exists(csv_path):
         return 0
+    last = 0
     with open(csv_path, newline='', encoding='utf-8') as f:
-        rows = list(csv.DictReader(f))
-        if not rows:
-            return 0
-        vals = []
-        for r in rows:
+        for r in csv.DictReader(f):
             v = r.get(field)
             if v is not None and str(v).strip().isdigit():
-                vals.append(int(v))
-        return max(vals) if vals else 0
+                last = max(last, int(v))
+    return last
 
-def read_last_id_from_csv(csv_path):
-    return read_last_value_from_csv(csv_path, "id")
-
-def get_start_ids():
+def get_start_ids(catalogue):
     # 卡牌从 character_card.csv 的最大 id + 1
-    card_last = read_last_id_from_csv(DATA_DIR / "character_card.csv")
+    card_last = catalogue.max_card_id()
     if LAST_CARD_INFO_FILE.exists():
         txt = LAST_CARD_INFO_FILE.read_text().strip()
         if txt.isdigit():
@@ -207,22 +835,20 @@ def get_start_ids():
 
     return start_card_id, start_characteristics_id
 
-def get_alt_title_for_id(card_id):
-    with open(DATA_DIR / "character_card.csv", newline='', encoding='utf-8') as f:
-        for row in csv.DictReader(f):
-            if int(row['id']) == card_id:
-                target_title = row['title']
-                break
-        else:
-            raise ValueError(f"找不到 ID={card_id} 的卡片 title")
+def get_card_list_table():
+    return page_cache.get_table(GAMERCH_CARD_LIST_URL, headers=GAMERCH_HEADERS)
 
-    resp = requests.get("https://gamerch.com/wizard-promise/117797",
-                        headers={'User-Agent': 'Mozilla/5.0'})
-    soup = BeautifulSoup(resp.content, 'html.parser')
-    img_tag = soup.find('img', alt=lambda x: x and target_title in x)
-    if not img_tag:
+
+def get_alt_title_for_id(catalogue, card_id):
+    record = catalogue.get(card_id)
+    if record is None:
+        raise ValueError(f"找不到 ID={card_id} 的卡片 title")
+    target_title = record.title
+
+    alt = get_card_list_table().find_alt(target_title)
+    if alt is None:
         raise ValueError(f"找不到 title='{target_title}' 对应的 alt 文本")
-    return img_tag['alt']
+    return alt
 
 # ====== 卡信息抓取 ======
 def extract_character_info(td_element):
@@ -267,30 +893,28 @@ def process_card_row(tr, current_index):
     return row
 
 def export_card_infos(target_alt, start_index, csv_path):
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    response = requests.get("https://gamerch.com/wizard-promise/117797", headers=headers)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    found_target = False
+    """
+    从上一张卡（target_alt）的下一行开始抓取新卡信息，写入 csv_path，并返回新卡行列表。
+    """
+    table = get_card_list_table()
+    # 命中上一张 alt，跳过这一行，从下一行开始写
+    target_row = table.find_row(target_alt)
+    if target_row is not None:
+        log("INFO", f"定位到起点（上一张）: {target_alt} —— 从下一行开始写入")
     current_idx = start_index
+    rows = []
     with open(csv_path, 'w', newline='', encoding='utf-8') as f:
         fieldnames = ['id','title','character_id','rarity','country','character_first_name_en','series','manually_added']
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
-        for tr in soup.find_all('tr'):
-            if not found_target:
-                # 命中上一张 alt，跳过这一行，从下一行开始写
-                if tr.find('img', alt=lambda x: x and target_alt in x):
-                    found_target = True
-                    log("INFO", f"定位到起点（上一张）: {target_alt} —— 从下一行开始写入")
-                    continue
-                else:
-                    continue
-
-            # 新增：若遇到「仮）」则停止抓取
+        if target_row is None:
+            return rows
+        for tr in table.rows[target_row + 1:]:
+            # 新增：若遇到「仮）」则停止抓取（只看起点之后的行）
             img_tag = tr.find('img', alt=True)
             if img_tag:
                 alt_text = img_tag['alt'].strip()
-                if '（仮）' in alt_text:
+                if PLACEHOLDER_MARK in alt_text:
                     log("INFO", f"检测到占位用空白卡片，停止卡信息抓取：{alt_text}")
                     break
 
@@ -298,24 +922,9 @@ def export_card_infos(target_alt, start_index, csv_path):
             if row:
                 log("LOG", f"卡信息写入 id={current_idx}, title={row['title']}, rarity={row['rarity']}")
                 writer.writerow(row)
+                rows.append(row)
                 current_idx += 1
-
-# ====== 特性抓取 ======
-def retry_request(url, headers=None, retries=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504)):
-    session = requests.Session()
-    retry = Retry(total=retries, read=retries, connect=retries,
-                  backoff_factor=backoff_factor, status_forcelist=status_forcelist,
-                  raise_on_status=False)
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    for attempt in range(retries):
-        try:
-            return session.get(url, headers=headers)
-        except IncompleteRead:
-            time.sleep(backoff_factor * (2 ** attempt))
-    raise ConnectionError(f"请求失败: {url}")
-
+    return rows
 
 # ====== BWiki特性抓取重构 ======
 def get_bwiki_card_page_id(card_id: int) -> int:
@@ -327,97 +936,647 @@ def get_bwiki_card_page_id(card_id: int) -> int:
     else:
         return card_id - 19
 
-def fetch_bwiki_card_traits(card_id: int) -> dict:
+# {{卡牌 ...}} 模板、模板参数的分隔（| 与链接 / 嵌套模板的括号）、特性分隔符
+CARD_TEMPLATE_RE = re.compile(r"\{\{卡牌([\s\S]+?)\}\}")
+TEMPLATE_TOKEN_RE = re.compile(r"\{\{|\}\}|\[\[|\]\]|\|")
+TRAIT_SPLIT_RE = re.compile(r"[\s/，,]+")
+
+
+def parse_template_params(body):
+    """
+    解析模板名之后的参数（|参数名=值），到模板的 }} 为止，返回 {参数名: 值}，
+    同名参数以第一个为准。
+    只按顶层的 | 切分：[[页面|文字]]、{{模板|...}} 里的 | 属于参数值；
+    值到行尾为止，参数名不能跨行。
+    """
+    parts = []
+    depth = 0
+    start = None
+    end = len(body)
+    for m in TEMPLATE_TOKEN_RE.finditer(body):
+        token = m.group()
+        if token in ("{{", "[["):
+            depth += 1
+        elif token == "}}" and depth == 0:
+            end = m.start()  # 模板结束
+            break
+        elif token in ("}}", "]]"):
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            if start is not None:
+                parts.append(body[start:m.start()])
+            start = m.end()
+    if start is not None:
+        parts.append(body[start:end])
+
+    params = {}
+    for part in parts:
+        name, sep, value = part.partition("=")
+        name = name.strip()
+        if not sep or not name or "\n" in name or "\r" in name:
+            continue
+        params.setdefault(name, (value.splitlines() or [""])[0].strip())
+    return params
+
+
+def parse_bwiki_card_traits(wikitext):
+    """
+    从单卡页面的 wikitext 中解析特性信息，无卡牌模板时返回 None。
+    """
+    m = CARD_TEMPLATE_RE.search(wikitext)
+    if not m:
+        return None
+    params = parse_template_params(wikitext[m.start(1):])
+    base = params.get("卡牌持有特性基础", "")
+    grow = params.get("卡牌持有特性成长", "")
+    base_traits = [t for t in TRAIT_SPLIT_RE.split(base) if t]
+    grow_traits = [t for t in TRAIT_SPLIT_RE.split(grow) if t]
+    return {"基础": base_traits, "成长": grow_traits, "卡牌名": params.get("卡牌名", "")}
+
+
+def log_missing_template(card_id, url, wikitext):
+    idx = wikitext.find('卡牌')
+    context = wikitext[idx-50:idx+200] if idx > 50 else wikitext[:idx+200]
+    log("WARN", f"BWiki页面无卡牌模板 id={card_id}, url={url}, context: {context}")
+
+
+def get_content_sha1(wikitext):
+    return hashlib.sha1(wikitext.encode('utf-8')).hexdigest()
+
+
+def fetch_bwiki_card_traits(card_id: int):
     """
-    抓取BWiki单卡页面，解析模板参数，返回特性信息。
+    抓取BWiki单卡页面（?action=raw），解析模板参数，
+    返回 (特性信息, 页面信息 {"sha1"}；请求失败或页面不存在时为 None)。
     """
     page_id = get_bwiki_card_page_id(card_id)
-    url = f"https://wiki.biligame.com/mahoyaku/Card_{page_id}"
+    url = f"{BWIKI_BASE_URL}/Card_{page_id}"
     raw_url = url + "?action=raw"
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Referer': 'https://wiki.biligame.com/mahoyaku/Card_1',
-            'Cookie': 'SESSDATA=fake_session_data_can_be_edited'
-        }
-        resp = retry_request(raw_url, headers=headers)
+        resp = http_client.get(raw_url, headers=BWIKI_HEADERS)
     except Exception as e:
         log("ERROR", f"BWiki页面请求异常 id={card_id}, url={raw_url}: {e}")
-        return {"基础": [], "成长": [], "卡牌名": f"请求失败({card_id})"}
+        return {"基础": [], "成长": [], "卡牌名": f"请求失败({card_id})"}, None
     if not resp or resp.status_code != 200:
         log("WARN", f"BWiki页面未找到 id={card_id}, url={raw_url}, status={getattr(resp, 'status_code', None)}")
-        return {"基础": [], "成长": [], "卡牌名": f"未找到({card_id})"}
+        return {"基础": [], "成长": [], "卡牌名": f"未找到({card_id})"}, None
     wikitext = resp.text
     # log("DEBUG", f"抓取页面 id={card_id}, url={raw_url}, wikitext片段: {wikitext[:300].replace(chr(10),' ').replace(chr(13),' ')} ...")
-    m = re.search(r"\{\{卡牌([\s\S]+?)\}\}", wikitext)
-    if not m:
-        idx = wikitext.find('卡牌')
-        context = wikitext[idx-50:idx+200] if idx > 50 else wikitext[:idx+200]
-        log("WARN", f"BWiki页面无卡牌模板 id={card_id}, url={raw_url}, context: {context}")
-        return {"基础": [], "成长": [], "卡牌名": f"无模板({card_id})"}
-    template = m.group(1)
-    def extract_param(field):
-        pat = rf"\|{field}\s*=([^\n\r]*)"
-        m2 = re.search(pat, template)
-        return m2.group(1).strip() if m2 else ""
-    base = extract_param("卡牌持有特性基础")
-    grow = extract_param("卡牌持有特性成长")
-    card_name = extract_param("卡牌名")
-    base_traits = [t.strip() for t in re.split(r"[\s/，,]+", base) if t.strip()]
-    grow_traits = [t.strip() for t in re.split(r"[\s/，,]+", grow) if t.strip()]
-    return {"基础": base_traits, "成长": grow_traits, "卡牌名": card_name}
-
-
-def export_characteristics_json_bwiki(start_index):
-    """
-    遍历character_card.csv，从start_index开始，抓取BWiki特性。
-    """
-    card_csv = DATA_DIR / "character_card.csv"
-    result = {}
-    with open(card_csv, newline='', encoding='utf-8') as f:
-        for row in csv.DictReader(f):
-            try:
-                card_id = int(row['id'])
-            except Exception:
-                continue
-            if card_id < start_index:
+    page = {"sha1": get_content_sha1(wikitext)}
+    traits = parse_bwiki_card_traits(wikitext)
+    if traits is None:
+        log_missing_template(card_id, raw_url, wikitext)
+        return {"基础": [], "成长": [], "卡牌名": f"无模板({card_id})"}, page
+    return traits, page
+
+
+def query_bwiki_pages(titles, content=True):
+    """
+    通过 api.php（action=query&prop=revisions）一次取多个页面的最新修订。
+    返回 {请求的标题: {"revid", "timestamp", "content"（content=True 时）} 或 None（页面不存在）}；
+    请求或响应异常时抛出。
+    """
+    params = {
+        "action": "query",
+        "prop": "revisions",
+        "rvprop": "ids|timestamp|content" if content else "ids|timestamp",
+        "rvslots": "main",
+        "titles": "|".join(titles),
+        "format": "json",
+        "formatversion": "2",
+    }
+    contents = {}
+    normalized = {}
+    while True:
+        resp = http_client.get(BWIKI_API_URL, headers=BWIKI_HEADERS, params=params)
+        if resp.status_code != 200:
+            raise ConnectionError(f"请求失败，状态码: {resp.status_code}, url={resp.url}")
+        data = resp.json()
+        if "error" in data:
+            raise ConnectionError(f"api.php 返回错误: {data['error']}")
+        query = data.get("query", {})
+        # 标题会被规范化（Card_12 -> Card 12）
+        for item in query.get("normalized", []):
+            normalized[item["to"]] = item["from"]
+        for page in query.get("pages", []):
+            title = normalized.get(page["title"], page["title"])
+            if page.get("missing") or page.get("invalid"):
+                contents[title] = None
                 continue
-            traits = fetch_bwiki_card_traits(card_id)
+            for rev in page.get("revisions", []):
+                info = {"revid": rev.get("revid"), "timestamp": rev.get("timestamp")}
+                if content:
+                    slot = rev.get("slots", {}).get("main", rev)
+                    info["content"] = slot.get("content", slot.get("*"))
+                contents[title] = info
+        # 内容过大时 API 分多次返回，带 continue 参数继续
+        if "continue" not in data:
+            break
+        params.update(data["continue"])
+    return contents
+
+
+def get_bwiki_card_titles(card_ids):
+    return {card_id: f"Card_{get_bwiki_card_page_id(card_id)}" for card_id in card_ids}
+
+
+def fetch_bwiki_card_traits_batch(card_ids) -> list:
+    """
+    一次 api.php 请求抓取多张卡的BWiki页面，返回与 card_ids 同顺序的
+    (特性信息, 页面信息 {"page", "revid", "timestamp", "sha1"}；页面不存在时为 None)。
+    API 不可用时逐页回退到 fetch_bwiki_card_traits（页面信息中没有修订）。
+    """
+    titles = get_bwiki_card_titles(card_ids)
+    try:
+        # 两张卡可能对应同一页面，标题去重
+        contents = query_bwiki_pages(list(dict.fromkeys(titles.values())))
+    except Exception as e:
+        log("WARN", f"BWiki api.php 批量请求失败（{card_ids[0]}~{card_ids[-1]}），改为逐页抓取: {e}")
+        return [fetch_bwiki_card_traits(card_id) for card_id in card_ids]
+
+    results = []
+    for card_id in card_ids:
+        url = f"{BWIKI_BASE_URL}/{titles[card_id]}"
+        page = contents.get(titles[card_id])
+        if page is None or page.get("content") is None:
+            log("WARN", f"BWiki页面未找到 id={card_id}, url={url}")
+            results.append(({"基础": [], "成长": [], "卡牌名": f"未找到({card_id})"}, None))
+            continue
+        wikitext = page["content"]
+        page_info = {"page": titles[card_id], "revid": page["revid"],
+                     "timestamp": page["timestamp"], "sha1": get_content_sha1(wikitext)}
+        traits = parse_bwiki_card_traits(wikitext)
+        if traits is None:
+            log_missing_template(card_id, url, wikitext)
+            traits = {"基础": [], "成长": [], "卡牌名": f"无模板({card_id})"}
+        results.append((traits, page_info))
+    return results
+
+
+class FetchLedger:
+    """
+    BWiki 逐卡抓取台账（jsonl）：每张卡抓完立即追加一行
+    {"card_id", "status", "sha1", "revid", "timestamp", "traits", "fetched_at"}，同一张卡以最后一行为准。
+    status：ok（基础、成长都有）、partial（页面有但特性不完整）、failed（请求失败或页面不存在）。
+    - 运行中途退出后重跑：status=ok 且页面修订未变的卡直接沿用台账里的特性，不再请求正文
+    - 本次运行的 CSV 全部写完后 compact()：只留下 partial / failed 的卡（新卡、旧卡都一样），
+      下次运行由 update_changed_bwiki_cards 单独重抓，不回退起点
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if path.exists():
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 上次写到一半的行
+                    self.entries[entry["card_id"]] = entry
+
+    def get_done(self, card_id, current_revisions=None):
+        """
+        status=ok 时返回 (特性信息, 页面信息)，否则 None。
+        current_revisions（query_bwiki_revisions 的结果）不为 None 时，还要求台账记下的修订
+        就是页面的当前修订：记账之后页面又被编辑、或查不到当前修订的卡都返回 None。
+        """
+        entry = self.entries.get(card_id)
+        if entry is None or entry["status"] != "ok":
+            return None
+        if current_revisions is not None:
+            current = current_revisions.get(card_id)
+            if current is None or entry.get("revid") != current["revid"]:
+                return None
+        page = {key: entry[key] for key in ("page", "revid", "timestamp", "sha1") if key in entry}
+        return entry["traits"], page
+
+    def retry_ids(self):
+        return sorted(card_id for card_id, entry in self.entries.items() if entry["status"] != "ok")
+
+    def record(self, card_id, traits, page, status=None):
+        """status 为 None 时按抓取结果判定；调用方也可指定（如特性无法换算时记为 partial）。"""
+        if status is None:
+            if page is None:
+                status = "failed"
+            elif traits["基础"] and traits["成长"]:
+                status = "ok"
+            else:
+                status = "partial"
+        entry = {"card_id": card_id, "status": status, **(page or {}), "traits": traits,
+                 "fetched_at": int(time.time())}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.entries[card_id] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def compact(self):
+        """只保留待重抓（partial / failed）的卡，原子替换台账。"""
+        with self.lock:
+            self.entries = {card_id: entry for card_id, entry in self.entries.items()
+                            if entry["status"] != "ok"}
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for card_id in sorted(self.entries):
+                    f.write(json.dumps(self.entries[card_id], ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+
+
+def export_characteristics_json_bwiki(catalogue, start_index, max_workers=BWIKI_FETCH_WORKERS,
+                                      batch_size=BWIKI_API_BATCH, revisions=None, ledger=None):
+    """
+    遍历卡牌目录，从start_index开始，抓取BWiki特性（见 fetch_characteristics_bwiki）。
+    """
+    return fetch_characteristics_bwiki(catalogue.card_ids(start_index), max_workers,
+                                       batch_size, revisions, ledger)
+
+
+def fetch_characteristics_bwiki(card_ids, max_workers=BWIKI_FETCH_WORKERS,
+                                batch_size=BWIKI_API_BATCH, revisions=None, ledger=None):
+    """
+    抓取 card_ids 的BWiki特性，返回 {str(card_id): 特性信息}。
+    batch_size > 0 时每 batch_size 张卡一次 api.php 请求，否则每张卡一次 ?action=raw 请求；
+    最多 max_workers 个请求并发，结果与日志仍按卡牌 ID 顺序输出。
+    revisions 不为 None 时记下各卡页面的修订（card_id -> {"page", "revid", "timestamp"}）；
+    ledger 不为 None 时跳过台账中已抓取成功、且页面修订未变的卡（batch_size <= 0 时不用 api.php，
+    无从比较修订，沿用所有抓取成功的卡），其余每张卡抓完即写入台账。
+    """
+    done = {}
+    if ledger is not None:
+        ok_ids = [card_id for card_id in card_ids if ledger.get_done(card_id) is not None]
+        current_revisions = None
+        if ok_ids and batch_size > 0:
+            current_revisions = query_bwiki_revisions(ok_ids, max_workers, batch_size)
+        done = {card_id: ledger.get_done(card_id, current_revisions) for card_id in ok_ids}
+        done = {card_id: cached for card_id, cached in done.items() if cached is not None}
+        if ok_ids:
+            log("INFO", f"沿用抓取台账中的 {len(done)} 张卡（{len(ok_ids) - len(done)} 张页面已修订），"
+                        f"其余 {len(card_ids) - len(done)} 张重新抓取")
+    to_fetch = [card_id for card_id in card_ids if card_id not in done]
+
+    if batch_size > 0:
+        batches = [to_fetch[i:i + batch_size] for i in range(0, len(to_fetch), batch_size)]
+        fetch_batch = fetch_bwiki_card_traits_batch
+    else:
+        batches = [[card_id] for card_id in to_fetch]
+        fetch_batch = lambda batch: [fetch_bwiki_card_traits(card_id) for card_id in batch]
+
+    def fetch(batch):
+        results = fetch_batch(batch)
+        # 抓完即记账，中途退出也不丢
+        if ledger is not None:
+            for card_id, (traits, page) in zip(batch, results):
+                ledger.record(card_id, traits, page)
+        return results
+
+    result = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # map 按提交顺序返回，与完成顺序无关
+        fetched = (item for batch in executor.map(fetch, batches) for item in batch)
+        for card_id in card_ids:
+            traits, page = done[card_id] if card_id in done else next(fetched)
             if not traits["基础"] or not traits["成长"]:
                 log("WARN", f"特性缺失 id={card_id}, 卡牌名={traits.get('卡牌名','')}, 基础={traits['基础']}, 成长={traits['成长']}")
             else:
                 log("LOG", f"特性写入 id={card_id}, 基础={traits['基础']}, 成长={traits['成长']}")
+            if revisions is not None and page and page.get("revid") is not None:
+                revisions[card_id] = {key: page[key] for key in ("page", "revid", "timestamp")}
             result[str(card_id)] = traits
     return result
 
+# ====== BWiki页面修订检查 ======
+def load_bwiki_revisions(path: Path) -> dict:
+    """
+    读取 card_id -> {"page", "revid", "timestamp"}；文件不存在或损坏时返回空字典。
+    """
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding='utf-8'))
+    except ValueError as e:
+        log("WARN", f"修订记录损坏，将重新建立: {path}: {e}")
+        return {}
+    return {int(card_id): rev for card_id, rev in data.items()}
+
+
+def save_bwiki_revisions(path: Path, revisions: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    # 每张卡一行，便于 git diff
+    lines = [f'"{card_id}": {json.dumps(revisions[card_id], ensure_ascii=False)}'
+             for card_id in sorted(revisions)]
+    tmp_path.write_text("{\n" + ",\n".join(lines) + "\n}\n", encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def query_bwiki_revisions(card_ids, max_workers=BWIKI_FETCH_WORKERS, batch_size=BWIKI_API_BATCH):
+    """
+    批量查询各卡页面的当前修订（不取正文），
+    返回 card_id -> {"page", "revid", "timestamp"}，页面不存在或查询失败的卡不在其中。
+    """
+    titles = get_bwiki_card_titles(card_ids)
+    unique_titles = list(dict.fromkeys(titles.values()))
+    batches = [unique_titles[i:i + batch_size] for i in range(0, len(unique_titles), batch_size)]
+
+    def query(batch):
+        try:
+            return query_bwiki_pages(batch, content=False)
+        except Exception as e:
+            log("WARN", f"BWiki 修订查询失败（{batch[0]}~{batch[-1]}）: {e}")
+            return {}
+
+    pages = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for result in executor.map(query, batches):
+            pages.update(result)
+    return {card_id: {"page": title, "revid": pages[title]["revid"],
+                      "timestamp": pages[title]["timestamp"]}
+            for card_id, title in titles.items() if pages.get(title)}
+
+
+def update_changed_bwiki_cards(catalogue, before_id, revisions, ledger=None):
+    """
+    检查 id < before_id 的卡（特性已在 CSV 中）：
+    - 没有修订记录的卡只记下当前修订（首次运行建立基线），不重抓
+    - BWiki页面修订有变化的卡、台账中上次结果不完整的卡（含上次运行新增、特性不完整的卡），单独重新抓取；
+      特性（换算成特性 id 后）与 CSV 中不同时才就地替换这些卡的行（见 merge_characteristic_rows），
+      并更新修订记录（只改了简介、排版等的页面不动 CSV）
+    - 重抓结果仍不完整（基础或成长为空）、有特性名不在 characteristics_normal.csv 中、
+      或卡牌稀有度不明（成长等级为空）的卡不改 CSV、不更新修订记录，记入台账下次运行再试
+    """
+    card_ids = [card_id for card_id in catalogue.card_ids() if card_id < before_id]
+    retry = set()
+    if ledger is not None:
+        known = set(card_ids)
+        retry = {card_id for card_id in ledger.retry_ids() if card_id in known}
+    changed, baseline = [], 0
+    if BWIKI_API_BATCH <= 0:
+        log("INFO", "BWIKI_API_BATCH<=0，跳过BWiki页面修订检查")
+    else:
+        current = query_bwiki_revisions(card_ids)
+        for card_id in card_ids:
+            rev = current.get(card_id)
+            if rev is None:
+                continue
+            old = revisions.get(card_id)
+            if old is None:
+                revisions[card_id] = rev
+                baseline += 1
+            elif old["revid"] != rev["revid"]:
+                changed.append(card_id)
+        log("INFO", f"BWiki页面修订检查: {len(card_ids)} 张卡，新记录 {baseline}，有变化 {len(changed)}")
+    if retry:
+        log("INFO", f"上次特性不完整、单独重抓: {sorted(retry)}")
+    refetch = sorted(retry.union(changed))
+    if not refetch:
+        return
+
+    fetched_revisions = {}
+    characteristics_data = fetch_characteristics_bwiki(refetch, revisions=fetched_revisions, ledger=ledger)
+    give_path = DATA_DIR / "card_give_characteristic.csv"
+    grow_path = DATA_DIR / "card_give_characteristic_grow_list.csv"
+    old_give_rows = read_rows_by_key(give_path, "card_id", refetch)
+    old_grow_rows = read_rows_by_key(grow_path, "card_id", refetch)
+    give_rows, grow_rows = {}, {}
+    for card_id in refetch:
+        data = characteristics_data[str(card_id)]
+        if not data["基础"] or not data["成长"]:
+            log("WARN", f"重抓后特性仍不完整，暂不更新 id={card_id}")
+            continue
+        new_give, new_grow = build_characteristic_rows(catalogue, card_id, data)
+        unresolved = [r['characteristic_id'] for r in new_give + new_grow
+                      if not isinstance(r['characteristic_id'], int)]
+        if unresolved or not new_grow:
+            reason = f"特性名不在特性表中 {unresolved}" if unresolved else "稀有度不明，无成长等级"
+            log("WARN", f"重抓后无法换算特性（{reason}），暂不更新 id={card_id}")
+            if ledger is not None:
+                ledger.record(card_id, data, fetched_revisions.get(card_id, {}), status="partial")
+            continue
+        revid = fetched_revisions.get(card_id, {}).get('revid')
+        if card_id in fetched_revisions:
+            revisions[card_id] = fetched_revisions[card_id]
+        old_give, old_grow = old_give_rows.get(card_id, []), old_grow_rows.get(card_id, [])
+        if get_characteristic_ids(new_give, 'No') == get_characteristic_ids(old_give, 'No') and \
+                get_characteristic_ids(new_grow, 'level') == get_characteristic_ids(old_grow, 'level'):
+            log("LOG", f"页面有修订但特性未变，不改 CSV id={card_id}, 修订={revid}")
+            continue
+        give_rows[card_id] = merge_characteristic_rows(old_give, new_give, 'No', ('manually_added',))
+        grow_rows[card_id] = merge_characteristic_rows(old_grow, new_grow, 'level',
+                                                       ('value', 'manually_added'))
+        log("LOG", f"更新特性 id={card_id}, 修订={revid}")
+    if give_rows:
+        patch_csv_by_key(DATA_DIR / "card_give_characteristic.csv", "card_id", give_rows)
+        patch_csv_by_key(DATA_DIR / "card_give_characteristic_grow_list.csv", "card_id", grow_rows)
+
 # ====== CSV 覆盖工具 ======
+@contextmanager
+def atomic_csv_writer(dest_csv):
+    """
+    写入 dest 同目录的临时文件，成功后 fsync 并原子替换 dest（保留权限），
+    中途出错则删除临时文件，dest 保持原样。
+    """
+    dest_dir = os.path.dirname(os.path.abspath(dest_csv))
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, prefix=".merge_", suffix=".csv")
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as out:
+            yield out
+            out.flush()
+            os.fsync(out.fileno())
+        if os.path.exists(dest_csv):
+            shutil.copymode(dest_csv, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, dest_csv)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
 def overwrite_from_id_generic(src_csv, dest_csv, key_field, start_id):
-    """将 src 追加到 dest，但会先保留 dest 中 key_field < start_id 的旧行，再覆盖写回。"""
-    kept_rows = []
-    kept_fields = []
-    if os.path.exists(dest_csv):
-        with open(dest_csv, newline='', encoding='utf-8') as f:
-            dest_reader = csv.DictReader(f)
-            kept_fields = dest_reader.fieldnames or []
-            for r in dest_reader:
-                v = r.get(key_field, "")
-                if str(v).isdigit() and int(v) < start_id:
-                    kept_rows.append(r)
-    # 读取新增
-    with open(src_csv, newline='', encoding='utf-8') as f:
-        src_reader = csv.DictReader(f)
-        if not kept_fields:
-            kept_fields = src_reader.fieldnames or []
-        new_rows = [r for r in src_reader if any((str(v).strip() if v is not None else "") for v in r.values())]
-    with open(dest_csv, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=kept_fields)
+    """
+    将 src 追加到 dest，但会先保留 dest 中 key_field < start_id 的旧行，再覆盖写回。
+    流式合并：逐行读 dest 的旧行、src 的新行，经 atomic_csv_writer 写回。
+    内存占用与 CSV 大小无关，中途崩溃也不会写坏 dest。
+    """
+    kept_count = new_count = 0
+    with atomic_csv_writer(dest_csv) as out, \
+            open(src_csv, newline='', encoding='utf-8') as src:
+        src_reader = csv.DictReader(src)
+        writer = None
+        if os.path.exists(dest_csv):
+            with open(dest_csv, newline='', encoding='utf-8') as f:
+                dest_reader = csv.DictReader(f)
+                if dest_reader.fieldnames:
+                    writer = csv.DictWriter(out, fieldnames=dest_reader.fieldnames)
+                    writer.writeheader()
+                for r in dest_reader:
+                    v = r.get(key_field, "")
+                    if str(v).isdigit() and int(v) < start_id:
+                        writer.writerow(r)
+                        kept_count += 1
+        # dest 不存在或为空时，沿用 src 的表头
+        if writer is None:
+            writer = csv.DictWriter(out, fieldnames=src_reader.fieldnames or [])
+            writer.writeheader()
+        # 追加新增（跳过空行）
+        for r in src_reader:
+            if any((str(v).strip() if v is not None else "") for v in r.values()):
+                writer.writerow(r)
+                new_count += 1
+    log("LOG", f"覆盖写入 {dest_csv}: 保留旧行 {kept_count}，追加新行 {new_count}（起点 {key_field}>={start_id}）")
+
+def patch_csv_by_key(dest_csv, key_field, rows_by_key):
+    """
+    就地替换 dest 中 key_field 属于 rows_by_key（key -> 新行列表）的行，位置不变，其余行原样保留；
+    dest 中没有的 key 插在第一个更大的 key 之前。经 atomic_csv_writer 写回。
+    """
+    with open(dest_csv, newline='', encoding='utf-8') as f:
+        present = {int(r[key_field]) for r in csv.DictReader(f) if str(r.get(key_field, "")).isdigit()}
+    # dest 中没有的 key，按升序等待插入
+    missing = sorted(key for key in rows_by_key if key not in present)
+    replaced_count = 0
+    with atomic_csv_writer(dest_csv) as out, open(dest_csv, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        writer = csv.DictWriter(out, fieldnames=reader.fieldnames)
         writer.writeheader()
-        writer.writerows(kept_rows + new_rows)
-    log("LOG", f"覆盖写入 {dest_csv}: 保留旧行 {len(kept_rows)}，追加新行 {len(new_rows)}（起点 {key_field}>={start_id}）")
+        done = set()
+        for r in reader:
+            v = r.get(key_field, "")
+            key = int(v) if str(v).isdigit() else None
+            while missing and key is not None and missing[0] < key:
+                writer.writerows(rows_by_key[missing.pop(0)])
+            if key in rows_by_key:
+                if key not in done:
+                    writer.writerows(rows_by_key[key])
+                    done.add(key)
+                replaced_count += 1
+                continue
+            writer.writerow(r)
+        for key in missing:
+            writer.writerows(rows_by_key[key])
+    log("LOG", f"就地更新 {dest_csv}: 替换 {len(rows_by_key)} 张卡的旧行 {replaced_count}")
+
+def read_rows_by_key(csv_path, key_field, keys):
+    """读出 csv_path 中 key_field 属于 keys 的行，返回 key -> 行列表（文件顺序）。"""
+    keys = set(keys)
+    rows = {}
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for r in csv.DictReader(f):
+            v = r.get(key_field, "")
+            if str(v).isdigit() and int(v) in keys:
+                rows.setdefault(int(v), []).append(r)
+    return rows
+
+
+def get_characteristic_ids(rows, slot_field):
+    """一张卡的特性行 -> 按 No / level 排好的 [(No 或 level, 特性 id)]，用于比较特性是否有变。"""
+    return sorted((int(r[slot_field]), str(r['characteristic_id']).strip()) for r in rows)
+
+
+def merge_characteristic_rows(old_rows, new_rows, slot_field, kept_fields):
+    """
+    用新构造的行替换一张卡的旧行：同一 No / level 已有旧行时，沿用旧行（保留 kept_fields
+    等人工维护的单元格），只换特性 id；旧行中没有的 No / level 用新行。
+    """
+    old_by_slot = {str(r[slot_field]): r for r in old_rows}
+    merged = []
+    for new in new_rows:
+        old = old_by_slot.get(str(new[slot_field]))
+        if old is None:
+            merged.append(new)
+            continue
+        row = dict(old)
+        row['characteristic_id'] = new['characteristic_id']
+        for field in kept_fields:
+            row[field] = old.get(field, '')
+        merged.append(row)
+    return merged
+
 
-def collect_and_write_permanent_ids(card_info_path: Path, output_path: Path):
+def build_characteristic_rows(catalogue, card_id, data):
     """
-    从 character_card.csv 读取 title->id 映射，
+    由一张卡的特性信息构造 give / grow 两个 CSV 的行（dict 列表）。
+    """
+    characteristics_map = catalogue.characteristics
+    card = catalogue.get(card_id)
+    exists_in_character_card = card is not None
+    manually_added = '1' if not exists_in_character_card else card.manually_added
+
+    give_chars, grow_list = [], []
+    base_chars = data.get('基础', [])
+    for idx, char_name in enumerate(base_chars, 1):
+        char_id = characteristics_map.get(char_name)
+        give_chars.append({
+            'card_id': card_id,
+            'No': idx,
+            'characteristic_id': char_id if char_id is not None else char_name,
+            'manually_added': '1' if char_id is None else manually_added
+        })
+    grow_chars = data.get('成长', [])
+    if exists_in_character_card:
+        rarity = int(card.rarity)
+        if rarity == 2:
+            levels = [35, 45, 55, 70]
+        elif rarity == 3:
+            levels = [15, 40, 65, 75]
+        elif rarity == 4:
+            levels = [30, 55, 75, 100]
+        else:
+            levels = []
+        for char_name, level in zip(grow_chars, levels):
+            char_id = characteristics_map.get(char_name)
+            grow_list.append({
+                'card_id': card_id,
+                'level': level,
+                'characteristic_id': char_id if char_id is not None else char_name,
+                'value': '',
+                'manually_added': '1' if char_id is None else '1'
+            })
+
+    log("LOG", f"构造 give/grow: card_id={card_id}, base={base_chars}, grow={grow_chars}")
+    return give_chars, grow_list
+
+def get_permanent_row_title(tr):
+    """
+    恒常列表的一行 -> 与卡牌目录一致的 title（「【卡名】角色名」），不是卡牌行时返回 None。
+    """
+    td = tr.find('td', class_='mu__table--col2')
+    if not td:
+        return None
+    a_tag = td.find('a')
+    if not a_tag:
+        return None
+    href = a_tag.get('href') or ''
+    if 'wizard-promise' not in href:
+        return None
+
+    text = (a_tag.text or '').strip()
+    if not text or '】' not in text:
+        return None
+
+    try:
+        left, right = text.split('】', 1)
+    except ValueError:
+        return None
+    title_part = left
+    name_part = right
+
+    if name_part not in CHARACTER_MAP:
+        for char_name in CHARACTER_MAP:
+            if char_name in name_part:
+                name_part = char_name
+                break
+
+    return f"{title_part}】{name_part}"
+
+
+def collect_and_write_permanent_ids(catalogue, output_path: Path):
+    """
+    用卡牌目录的 title->id 映射，
     抓取 https://gamerch.com/wizard-promise/175474 页面，
     解析每行卡名匹配到 title，得到 id 列表。
     以“追加模式”更新 permanent.txt：
@@ -436,61 +1595,17 @@ def collect_and_write_permanent_ids(card_info_path: Path, output_path: Path):
         except Exception as e:
             log("WARN", f"读取 {output_path} 出错，将重新生成: {e}")
 
-    # ===== 读取 character_card.csv，建立 title -> id 映射 =====
-    title_to_id = {}
-    with open(card_info_path, 'r', encoding='utf-8', newline='') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                card_id = int(row['id'])
-            except Exception:
-                continue
-            title_str = row.get('title', '').strip()
-            if title_str:
-                title_to_id[title_str] = card_id
-
     # ===== 抓取页面 =====
-    url = "https://gamerch.com/wizard-promise/175474"
-    resp = retry_request(url, headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'})
-    if not resp or resp.status_code != 200:
-        raise ConnectionError(f"请求失败，状态码: {getattr(resp, 'status_code', 'unknown')}")
-
-    soup = BeautifulSoup(resp.content, 'html.parser')
+    table = page_cache.get_table(GAMERCH_PERMANENT_URL,
+                                 headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'})
 
     # ===== 解析行 =====
     found_ids = set()
-    tr_list = soup.find_all('tr')
-    for tr in tr_list:
-        td = tr.find('td', class_='mu__table--col2')
-        if not td:
-            continue
-        a_tag = td.find('a')
-        if not a_tag:
+    for tr in table.rows:
+        normalized_title = get_permanent_row_title(tr)
+        if normalized_title is None:
             continue
-        href = a_tag.get('href') or ''
-        if 'wizard-promise' not in href:
-            continue
-
-        text = (a_tag.text or '').strip()
-        if not text or '】' not in text:
-            continue
-
-        try:
-            left, right = text.split('】', 1)
-        except ValueError:
-            continue
-        title_part = left
-        name_part = right
-
-        if name_part not in CHARACTER_MAP:
-            for char_name in CHARACTER_MAP:
-                if char_name in name_part:
-                    name_part = char_name
-                    break
-
-        normalized_title = f"{title_part}】{name_part}"
-
-        cid = title_to_id.get(normalized_title)
+        cid = catalogue.get_id_by_title(normalized_title)
         if cid is not None:
             found_ids.add(cid)
         else:
@@ -513,87 +1628,64 @@ def collect_and_write_permanent_ids(card_info_path: Path, output_path: Path):
 
 # ====== 主逻辑 ======
 
+def load_or_init_icon_manifest(icons_dir: Path) -> dict:
+    """
+    读取图标清单；首次运行（没有清单）时扫描并校验已有图标生成清单。
+    """
+    manifest = load_icon_manifest(icons_dir / ICON_MANIFEST_FILE.name)
+    if manifest is None:
+        log("INFO", "未找到图标清单，扫描已有图标生成清单")
+        manifest = {}
+        verify_icons(icons_dir, manifest)
+    return manifest
+
+
+def verify_icons_main():
+    """
+    --verify-icons：重新校验所有图标，删除损坏的并重新下载。
+    """
+    manifest = load_icon_manifest(ICON_MANIFEST_FILE) or {}
+    verify_icons(ICON_DIR, manifest)
+    download_missing_icons(manifest, set(Catalogue(DATA_DIR).card_ids()), ICON_DIR)
+
+
 def main():
-    start_card_id, start_characteristics_id = get_start_ids()
+    catalogue = Catalogue(DATA_DIR)
+    start_card_id, start_characteristics_id = get_start_ids(catalogue)
     log("INFO", f"卡信息起点 ID: {start_card_id}")
     log("INFO", f"特性信息起点 ID: {start_characteristics_id}")
 
     # 分开计算两套起点的“上一张”的 alt
-    alt_title_for_cards = get_alt_title_for_id(start_card_id - 1)
-    alt_title_for_chars = get_alt_title_for_id(start_characteristics_id - 1)
+    alt_title_for_cards = get_alt_title_for_id(catalogue, start_card_id - 1)
+    alt_title_for_chars = get_alt_title_for_id(catalogue, start_characteristics_id - 1)
 
     log("INFO", f"获取到【卡信息】起点卡的上一张 alt: {alt_title_for_cards}")
     log("INFO", f"获取到【特性】起点卡的上一张 alt: {alt_title_for_chars}")
 
-    tmp_dir = Path(__file__).resolve().parent / "tmp"
+    tmp_dir = TMP_DIR
     tmp_dir.mkdir(exist_ok=True)
 
     # === 卡信息 ===
     tmp_card_info_csv = tmp_dir / "new_character_card.csv"
-    export_card_infos(alt_title_for_cards, start_card_id, tmp_card_info_csv)
-    overwrite_from_id_generic(tmp_card_info_csv, DATA_DIR / "character_card.csv", "id", start_card_id)
+    new_cards = export_card_infos(alt_title_for_cards, start_card_id, tmp_card_info_csv)
+    catalogue.replace_from(start_card_id, new_cards)
 
     # === 特性 JSON（BWiki重构） ===
     tmp_characteristics_json = tmp_dir / "new_characteristics.json"
-    characteristics_data = export_characteristics_json_bwiki(start_characteristics_id)
+    fetched_revisions = {}
+    ledger = FetchLedger(BWIKI_FETCH_LEDGER_FILE)
+    characteristics_data = export_characteristics_json_bwiki(catalogue, start_characteristics_id,
+                                                             revisions=fetched_revisions, ledger=ledger)
     with open(tmp_characteristics_json, 'w', encoding='utf-8') as f:
         json.dump(characteristics_data, f, ensure_ascii=False, separators=(',', ':'))
     log("INFO", f"已写入临时特性 JSON: {tmp_characteristics_json}")
 
     # === 生成 give / grow 两个 CSV（内存中先构造） ===
-    characteristics_map = {}
-    with open(DATA_DIR / "characteristics_normal.csv", 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            characteristics_map[row['title']] = int(row['id'])
-
-    character_card = {}
-    with open(DATA_DIR / "character_card.csv", 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            card_id = int(row['id'])
-            character_card[card_id] = {
-                'rarity': int(row['rarity']),
-                'manually_added': row['manually_added']
-            }
-
     give_chars, grow_list = [], []
     for json_id, data in characteristics_data.items():
-        card_id = int(json_id)
-        exists_in_character_card = card_id in character_card
-        manually_added = '1' if not exists_in_character_card else character_card[card_id]['manually_added']
-
-        base_chars = data.get('基础', [])
-        for idx, char_name in enumerate(base_chars, 1):
-            char_id = characteristics_map.get(char_name)
-            give_chars.append({
-                'card_id': card_id,
-                'No': idx,
-                'characteristic_id': char_id if char_id is not None else char_name,
-                'manually_added': '1' if char_id is None else manually_added
-            })
-        grow_chars = data.get('成长', [])
-        if exists_in_character_card:
-            rarity = character_card[card_id]['rarity']
-            if rarity == 2:
-                levels = [35, 45, 55, 70]
-            elif rarity == 3:
-                levels = [15, 40, 65, 75]
-            elif rarity == 4:
-                levels = [30, 55, 75, 100]
-            else:
-                levels = []
-            for char_name, level in zip(grow_chars, levels):
-                char_id = characteristics_map.get(char_name)
-                grow_list.append({
-                    'card_id': card_id,
-                    'level': level,
-                    'characteristic_id': char_id if char_id is not None else char_name,
-                    'value': '',
-                    'manually_added': '1' if char_id is None else '1'
-                })
-
-        log("LOG", f"构造 give/grow: card_id={card_id}, base={base_chars}, grow={grow_chars}")
+        give_rows, grow_rows = build_characteristic_rows(catalogue, int(json_id), data)
+        give_chars.extend(give_rows)
+        grow_list.extend(grow_rows)
 
     tmp_give_csv = tmp_dir / "card_give_characteristics.csv"
     tmp_grow_csv = tmp_dir / "card_give_characteristics_grow_list.csv"
@@ -611,44 +1703,95 @@ def main():
     overwrite_from_id_generic(tmp_give_csv, DATA_DIR / "card_give_characteristic.csv", "card_id", start_characteristics_id)
     overwrite_from_id_generic(tmp_grow_csv, DATA_DIR / "card_give_characteristic_grow_list.csv", "card_id", start_characteristics_id)
 
+    # === 旧卡：只重抓BWiki页面有修订、或上次特性不完整的卡，就地更新两个特性 CSV ===
+    revisions = load_bwiki_revisions(BWIKI_REVISIONS_FILE)
+    for cid, data in characteristics_data.items():
+        # 本次抓取完整的卡记下修订；不完整的留在台账里，下次单独重抓
+        if data.get("基础") and data.get("成长") and int(cid) in fetched_revisions:
+            revisions[int(cid)] = fetched_revisions[int(cid)]
+    try:
+        update_changed_bwiki_cards(catalogue, start_characteristics_id, revisions, ledger)
+    except Exception as e:
+        log("ERROR", f"BWiki页面修订检查失败: {e}")
+    save_bwiki_revisions(BWIKI_REVISIONS_FILE, revisions)
+
     # === 恒常（kojo）id 生成 ===
     try:
         permanent_out = DATA_DIR / "permanent.txt"
-        collect_and_write_permanent_ids(DATA_DIR / "character_card.csv", permanent_out)
+        collect_and_write_permanent_ids(catalogue, permanent_out)
     except Exception as e:
         log("ERROR", f"生成恒常卡牌列表失败: {e}")
 
     # === 补全缺失卡图标（public/images/card_icons/Card_icon_<id>.png） ===
-    existing_icon_ids = get_existing_icon_ids(ICON_DIR)
-    all_card_ids = get_card_ids_from_csv(DATA_DIR / "character_card.csv")
-    download_missing_icons(existing_icon_ids, all_card_ids, ICON_DIR)
+    download_missing_icons(load_or_init_icon_manifest(ICON_DIR), set(catalogue.card_ids()), ICON_DIR)
 
-    # === 更新状态 ===
-    last_id_in_card_info = read_last_id_from_csv(DATA_DIR / "character_card.csv")
+    # === 写回有改动的 CSV，更新状态 ===
+    catalogue.save()
+    last_id_in_card_info = catalogue.max_card_id()
     LAST_CARD_INFO_FILE.write_text(str(last_id_in_card_info), encoding='utf-8')
 
-    # 修正：分别记录基础特性和成长特性缺失的最小card_id，取较小者
-    min_basic_missing = None
-    min_grow_missing = None
-    for cid, data in characteristics_data.items():
-        if not data.get("基础") and (min_basic_missing is None or int(cid) < min_basic_missing):
-            min_basic_missing = int(cid)
-        if not data.get("成长") and (min_grow_missing is None or int(cid) < min_grow_missing):
-            min_grow_missing = int(cid)
-    mismatch_id = None
-    if min_basic_missing is not None and min_grow_missing is not None:
-        mismatch_id = min(min_basic_missing, min_grow_missing)
-    elif min_basic_missing is not None:
-        mismatch_id = min_basic_missing
-    elif min_grow_missing is not None:
-        mismatch_id = min_grow_missing
-    if mismatch_id:
-        LAST_MISMATCH_FILE.write_text(str(mismatch_id), encoding='utf-8')
-        log("WARN", f"检测到数据不匹配，从 {mismatch_id} 起的特性将在下次重新抓取")
+    # 特性不完整的卡（新卡已写入的行保留）不再经 mismatch 文件回退整个起点，而是留在台账里，
+    # 下次运行由 update_changed_bwiki_cards 单独重抓、就地补全。
+    # mismatch 文件只清空：升级前写下的旧值在升级后第一次运行时仍生效
+    LAST_MISMATCH_FILE.write_text("", encoding='utf-8')
+    ledger.compact()
+    retry_ids = ledger.retry_ids()
+    if retry_ids:
+        log("WARN", f"检测到 {len(retry_ids)} 张卡特性不完整，将在下次单独重新抓取: {retry_ids}")
+
+    opened, reused = http_client.connection_stats()
+    log("INFO", f"HTTP 连接统计：新建 {opened} 个，复用 {reused} 次")
+    log("INFO", "更新完成！")
+
+def get_state_files():
+    """
+    main() 读取的本地状态：决定本次发出哪些请求、从哪里开始写。
+    """
+    data_files = sorted(p for p in DATA_DIR.iterdir() if p.is_file())
+    return data_files + [LAST_CARD_INFO_FILE, LAST_MISMATCH_FILE, BWIKI_REVISIONS_FILE,
+                         BWIKI_FETCH_LEDGER_FILE, ICON_MANIFEST_FILE]
+
+
+def setup_http_archive(archive_dir: Path, replay=False) -> HttpArchive:
+    """
+    --record：重新录制（旧的响应体保留，按内容复用），先存下本地状态快照；
+    --replay：只用存档应答。两种模式都不读写磁盘页面缓存，所有页面都经过存档。
+    """
+    archive = HttpArchive(archive_dir)
+    if replay:
+        if not archive.index:
+            raise SystemExit(f"回放存档为空: {archive.index_path}")
+        log("INFO", f"回放模式：存档中 {len(archive.index)} 个请求（{archive_dir}）")
     else:
-        LAST_MISMATCH_FILE.write_text("", encoding='utf-8')
+        archive.index = {}
+        archive.save_snapshot(get_state_files())
+        log("INFO", f"录制模式：响应存入 {archive_dir}")
+    http_client.use_archive(archive, replay)
+    page_cache.cache_dir = None
+    return archive
 
-    log("INFO", "更新完成！")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="抓取并更新卡牌、特性、恒常列表与卡图标数据")
+    parser.add_argument("--verify-icons", action="store_true",
+                        help="只校验已有卡图标（重新计算哈希），并重新下载损坏或缺失的图标")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", action="store_true",
+                      help="照常运行，并把所有 HTTP 响应录入存档（见 --archive）")
+    mode.add_argument("--replay", action="store_true",
+                      help="不联网，用存档中录好的响应运行")
+    parser.add_argument("--archive", type=Path, default=HTTP_ARCHIVE_DIR,
+                        help=f"HTTP 响应存档目录（默认 {HTTP_ARCHIVE_DIR}）")
+    args = parser.parse_args()
+    archive = setup_http_archive(args.archive, args.replay) if args.record or args.replay else None
+    try:
+        if args.verify_icons:
+            verify_icons_main()
+        else:
+            main()
+    finally:
+        if args.record:
+            archive.save()
+            log("INFO", f"已录制 {len(archive.index)} 个请求: {archive.index_path}")
+        elif args.replay and archive.misses:
+            log("WARN", f"回放时有 {len(archive.misses)} 个请求不在存档中，例如: {archive.misses[0]}")
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+Local HTTP query service for deck lookups.
+
+Loads the calc.py output once and answers the same questions as the
+browser calculators, so a client only downloads its own results:
+ - /calc?ids=1,2,3[&onlyOwnedAll=1]   the rules of js/calc.js
+ - /prophecy?ids=1,2,3                the rules of js/prophecy.js
+
+The ids are the ones typed by users (before the +19 shift of ids >= 337).
+Responses are json, gzipped when the client accepts it, with an ETag keyed
+by the timestamp in solutions4bwiki_meta.json.
+"""
+import argparse
+from array import array
+import csv
+import gzip
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from solution_index import count_owned, read_solution_index
+from solution_pack import read_solution_pack
+
+# Do not bother compressing tiny bodies
+GZIP_MIN_SIZE = 1024
+
+
+class SolutionStore:
+    """
+    The solutions, their index and the valid card ids, held in memory.
+    """
+
+    def __init__(self, solutions_dir, cards_csv):
+        self.pack = read_solution_pack(f"{solutions_dir}/full_solution.bin")
+        self.index = {
+            field: {card: array("I", postings)
+                    for card, postings in postings_by_card.items()}
+            for field, postings_by_card in read_solution_index(
+                f"{solutions_dir}/solution_index.json").items()
+        }
+        with open(f"{solutions_dir}/solutions4bwiki_meta.json") as f:
+            self.timestamp = json.load(f)["timestamp"]
+        # only SR (3) and SSR (4) cards can be used, as in filterHighRarityCards
+        with open(cards_csv, newline='', encoding='utf-8') as f:
+            self.valid_ids = {
+                int(row['id']) for row in csv.DictReader(f)
+                if row['rarity'].strip() in ("3", "4")}
+
+    def get_owned_ids19(self, ids):
+        """
+        Shift the ids as filtedCardByIds19 does, keeping the input order.
+        """
+        ids19 = [id + 19 if id >= 337 else id for id in ids]
+        return [id for id in ids19 if id in self.valid_ids]
+
+    def count_hits(self, owned_ids19):
+        """
+        Returns ({cnt: owned quad cards}, {cnt having an owned card0}),
+        for the solutions having at least one owned quad card.
+        """
+        owned = set(owned_ids19)
+        return (count_owned(self.index["q"], owned),
+                count_owned(self.index["a"], owned))
+
+    def get_result(self, cnt):
+        solution = self.pack.get_solution(cnt)
+        return {
+            "quad": solution["q"],
+            "dset": solution["a"],
+            "dset_tag": solution["t"],
+            "colors": solution["c"]
+        }
+
+    def calc(self, owned_ids19, only_owned_all=False):
+        """
+        Same filtering as calculateCardSet in js/calc.js.
+        """
+        quad_hits, card0_hits = self.count_hits(owned_ids19)
+        results = []
+        for cnt, n_quad in quad_hits.items():
+            has_card0 = cnt in card0_hits
+            if only_owned_all and not (n_quad == 4 and has_card0):
+                continue
+            if (has_card0 and n_quad >= 3) or n_quad == 4:
+                results.append(self.get_result(cnt))
+        return results
+
+    def prophecy(self, owned_ids19):
+        """
+        Same filtering as calculateProphecyCardSet in js/prophecy.js:
+        the strict tier, or the weak tier if the strict tier found nothing.
+        """
+        quad_hits, card0_hits = self.count_hits(owned_ids19)
+        strict, weak = [], []
+        has_full_result = False
+        for cnt, n_quad in quad_hits.items():
+            has_card0 = cnt in card0_hits
+            # the cards that already make a deck are left to /calc
+            if (has_card0 and n_quad >= 3) or n_quad == 4:
+                has_full_result = True
+            elif (has_card0 and n_quad == 2) or n_quad == 3:
+                strict.append(cnt)
+            elif has_card0 or n_quad >= 2:
+                weak.append(cnt)
+        if not has_full_result and not strict:
+            strict = weak
+        return [self.get_result(cnt) for cnt in strict]
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    store = None  # set by make_server
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path not in ("/calc", "/prophecy"):
+            self.send_error(404)
+            return
+
+        # weak, since the gzipped and plain bodies share it
+        etag = f'W/"{self.store.timestamp}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        query = parse_qs(url.query)
+        ids_text = "".join(query.get("ids", [""])).replace(" ", "")
+        # no ids (missing or empty parameter) is an empty selection, as on
+        # the static pages: only malformed ids are an error
+        try:
+            ids = [int(id) for id in ids_text.split(",") if id]
+        except ValueError:
+            self.send_error(400, "ids should be a list of integers")
+            return
+
+        owned_ids19 = self.store.get_owned_ids19(ids)
+        if url.path == "/calc":
+            only_owned_all = query.get("onlyOwnedAll", ["0"])[0] in (
+                "1", "true")
+            results = self.store.calc(owned_ids19, only_owned_all)
+        else:
+            results = self.store.prophecy(owned_ids19)
+
+        body = json.dumps({"ids19": owned_ids19, "results": results},
+                          separators=(',', ':')).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if len(body) >= GZIP_MIN_SIZE and \
+                "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(store, host, port, quiet=False):
+    handler = type("BoundQueryHandler", (QueryHandler,), {"store": store})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.quiet = quiet
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve deck lookups from the calc.py output")
+    parser.add_argument("-s", "--solutions-dir", default="solutions",
+                        help="Path to the calc.py output directory")
+    parser.add_argument("-c", "--cards-lists",
+                        default="public/data/character_card.csv",
+                        help="Path to character_card.csv")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8300)
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Do not log every request")
+    args = parser.parse_args()
+
+    server = make_server(
+        SolutionStore(args.solutions_dir, args.cards_lists),
+        args.host, args.port, args.quiet)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
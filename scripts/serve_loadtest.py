@@ -0,0 +1,59 @@
+"""
+Load test for serve.py: many concurrent clients with random collections.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+from urllib.request import Request, urlopen
+
+
+def run_client(base_url, endpoint, requests_per_client, max_id, n_ids, seed):
+    """
+    Send requests_per_client queries, returns the latency of each of them.
+    """
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(requests_per_client):
+        ids = ",".join(map(str, sorted(rng.sample(range(1, max_id + 1), n_ids))))
+        request = Request(f"{base_url}/{endpoint}?ids={ids}",
+                          headers={"Accept-Encoding": "gzip"})
+        start = time.perf_counter()
+        with urlopen(request) as resp:
+            resp.read()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for serve.py")
+    parser.add_argument("-u", "--url", default="http://127.0.0.1:8300")
+    parser.add_argument("-e", "--endpoint", choices=("calc", "prophecy"),
+                        default="calc")
+    parser.add_argument("-c", "--clients", type=int, default=32,
+                        help="Number of concurrent clients (default: 32)")
+    parser.add_argument("-n", "--requests", type=int, default=20,
+                        help="Requests per client (default: 20)")
+    parser.add_argument("--ids", type=int, default=300,
+                        help="Owned cards per request (default: 300)")
+    parser.add_argument("--max-id", type=int, default=1500,
+                        help="Largest card id to pick from (default: 1500)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        futures = [
+            executor.submit(run_client, args.url, args.endpoint,
+                            args.requests, args.max_id, args.ids, seed)
+            for seed in range(args.clients)]
+        latencies = sorted(x for future in futures for x in future.result())
+    elapsed = time.perf_counter() - start
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    print(f"{len(latencies)} requests in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.1f} req/s)")
+    print(f"latency p50={percentile(0.5) * 1000:.1f}ms "
+          f"p90={percentile(0.9) * 1000:.1f}ms "
+          f"p99={percentile(0.99) * 1000:.1f}ms")
@@ -0,0 +1,102 @@
+"""
+Inverted card -> solution index of full_solution.json.
+
+The index holds two posting lists per card id, the sorted indices of the
+solutions where the card is:
+ - "q": one of the four quad cards
+ - "a": one of the card0 candidates
+
+With it, "which solutions can I build with my owned cards" is answered by
+merging the posting lists of the owned cards, instead of scanning every
+solution.
+"""
+from collections import Counter
+from itertools import chain
+import json
+
+
+def build_solution_index(full_solution):
+    """
+    Build the posting lists from the solutions
+    (cnt -> {"q", "a", ...}, as in full_solution.json).
+
+    Returns {"q": {card_id: [cnt]}, "a": {card_id: [cnt]}}.
+    """
+    index = {"q": {}, "a": {}}
+    # cnt goes up, so every posting list is sorted as it is built
+    for cnt in range(len(full_solution)):
+        solution = full_solution[cnt]
+        for field in ("q", "a"):
+            for card in solution[field]:
+                index[field].setdefault(card, []).append(cnt)
+    return index
+
+
+def write_solution_index(path, index):
+    """
+    Save the index as json, with the card ids sorted.
+    """
+    with open(path, "w") as f:
+        json.dump({
+            field: {str(card): index[field][card]
+                    for card in sorted(index[field])}
+            for field in ("q", "a")
+        }, f, separators=(',', ':'))
+
+
+def read_solution_index(path):
+    with open(path) as f:
+        raw = json.load(f)
+    return {
+        field: {int(card): postings for card, postings in raw[field].items()}
+        for field in ("q", "a")
+    }
+
+
+def query_solutions(index, owned_ids, min_quad=3, min_card0=1):
+    """
+    Get the sorted indices of the solutions with at least min_quad owned
+    quad cards and at least min_card0 owned card0 candidates.
+
+    owned_ids are card ids as used in the solutions.
+    """
+    owned_ids = set(owned_ids)
+    quad_hits = count_owned(index["q"], owned_ids, min_quad)
+    if min_card0 <= 0:
+        return list(quad_hits)
+    card0_hits = count_owned(index["a"], owned_ids, min_card0)
+    return [cnt for cnt in quad_hits if cnt in card0_hits]
+
+
+def count_owned(postings, owned_ids, min_count=1):
+    """
+    Merge the posting lists of the owned cards.
+
+    Returns {cnt: number of owned cards} for the solutions having
+    at least min_count of them, in increasing order of cnt.
+    """
+    counts = Counter(chain.from_iterable(
+        postings[card] for card in owned_ids if card in postings))
+    return {cnt: counts[cnt] for cnt in sorted(
+        cnt for cnt, n in counts.items() if n >= min_count)}
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description="Query the solution index with owned card ids")
+    parser.add_argument("index", help="Path to solution_index.json")
+    parser.add_argument("ids", help="Owned card ids, comma separated")
+    parser.add_argument("-k", "--min-quad", type=int, default=3,
+                        help="Minimum number of owned quad cards (default: 3)")
+    args = parser.parse_args()
+
+    index = read_solution_index(args.index)
+    owned_ids = [int(x) for x in args.ids.split(",") if x.strip()]
+    start = time.perf_counter()
+    result = query_solutions(index, owned_ids, args.min_quad)
+    elapsed = time.perf_counter() - start
+    print(f"{len(result)} solutions in {elapsed * 1000:.2f} ms")
+    print(",".join(map(str, result)))
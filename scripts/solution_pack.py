@@ -0,0 +1,240 @@
+"""
+Packed binary format of full_solution.json.
+
+Layout (all little-endian):
+
+    header:
+        magic            4s   b"S3KP"
+        version          u16
+        n_color_keys     u16
+        n_tag_keys       u16
+        (padding)        u16
+        n_solutions      u32
+        n_card0_values   u32
+    dictionary tables (color pair keys, then tag pair keys):
+        for each key: length u8, then the utf-8 bytes ("1,2", "8,15", ...)
+    columns:
+        quads            u16[n_solutions * 4]   the four cards of each solution
+        color index      u8[n_solutions]        index into the color pair keys
+        tag index        u16[n_solutions]       index into the tag pair keys
+        card0 offsets    u32[n_solutions + 1]   card0s of solution k are
+        card0 values     u16[n_card0_values]    values[offsets[k]:offsets[k+1]]
+
+Solution k of the pack is the entry str(k) of full_solution.json.
+"""
+from array import array
+import struct
+import sys
+
+MAGIC = b"S3KP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHHII")
+
+
+def _unsigned_typecode(size):
+    """
+    The array typecode of the unsigned ints of size bytes: the item sizes
+    of array typecodes depend on the platform, the columns of the file
+    do not.
+    """
+    for typecode in "BHILQ":
+        if array(typecode).itemsize == size:
+            return typecode
+    raise RuntimeError(f"No array typecode of {size} bytes")
+
+
+U8, U16, U32 = (_unsigned_typecode(size) for size in (1, 2, 4))
+
+
+def _to_le_bytes(values):
+    """
+    Dump an array as little-endian bytes.
+    """
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le_bytes(typecode, data):
+    """
+    Load an array from little-endian bytes.
+    """
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _pack_keys(keys):
+    chunks = []
+    for key in keys:
+        raw = key.encode("utf-8")
+        chunks.append(struct.pack("<B", len(raw)) + raw)
+    return b"".join(chunks)
+
+
+def _unpack_keys(data, offset, count):
+    keys = []
+    for _ in range(count):
+        length = data[offset]
+        keys.append(data[offset + 1:offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+    return keys, offset
+
+
+def write_solution_pack(path, full_solution):
+    """
+    Write the solutions (cnt -> {"q", "a", "c", "t"}, as in full_solution.json,
+    or a SolutionPack) to a packed binary file.
+    """
+    if isinstance(full_solution, SolutionPack):
+        full_solution.write(path)
+        return
+    pack = SolutionPack.empty()
+    for cnt in range(len(full_solution)):
+        solution = full_solution[cnt]
+        pack.append(solution["q"], solution["a"], solution["c"], solution["t"])
+    pack.write(path)
+
+
+class SolutionPack:
+    """
+    Column view of a packed solution file.
+
+    Also used by calc.py to hold the solutions while they are built
+    (see append / append_block), in place of the full_solution dict.
+    """
+
+    def __init__(self, color_keys, tag_keys, quads, colors, tags,
+                 card0_offsets, card0_values):
+        self.color_keys = color_keys
+        self.tag_keys = tag_keys
+        self.quads = quads
+        self.colors = colors
+        self.tags = tags
+        self.card0_offsets = card0_offsets
+        self.card0_values = card0_values
+        # key -> index into color_keys / tag_keys, for append
+        self._color_index = {key: i for i, key in enumerate(color_keys)}
+        self._tag_index = {key: i for i, key in enumerate(tag_keys)}
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], array(U16), array(U8), array(U16),
+                   array(U32, [0]), array(U16))
+
+    def __len__(self):
+        return len(self.colors)
+
+    def __getitem__(self, k):
+        # so that a pack can be used where the full_solution dict was
+        return self.get_solution(k)
+
+    def _get_key_index(self, keys, index, key):
+        if key not in index:
+            index[key] = len(keys)
+            keys.append(key)
+        return index[key]
+
+    def append(self, quad, card0s, color_key, tag_key):
+        """
+        Append a solution (in the shape of full_solution.json).
+        """
+        self.quads.extend(quad)
+        self.colors.append(self._get_key_index(
+            self.color_keys, self._color_index, color_key))
+        self.tags.append(self._get_key_index(
+            self.tag_keys, self._tag_index, tag_key))
+        self.card0_values.extend(card0s)
+        self.card0_offsets.append(len(self.card0_values))
+
+    def append_block(self, quads, card0_counts, card0_values, color_key,
+                     tag_key):
+        """
+        Append solutions of the same color pair and tag pair at once:
+        quads holds the 4 cards of each solution one after the other,
+        card0_counts the number of card0s of each solution and card0_values
+        all their card0s.
+        """
+        if not len(card0_counts):
+            return
+        color = self._get_key_index(self.color_keys, self._color_index,
+                                    color_key)
+        tag = self._get_key_index(self.tag_keys, self._tag_index, tag_key)
+        self.quads.extend(quads)
+        self.colors.extend([color] * len(card0_counts))
+        self.tags.extend([tag] * len(card0_counts))
+        self.card0_values.extend(card0_values)
+        offset = self.card0_offsets[-1]
+        for count in card0_counts:
+            offset += count
+            self.card0_offsets.append(offset)
+
+    def write(self, path):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.color_keys),
+                                len(self.tag_keys), 0, len(self),
+                                len(self.card0_values)))
+            f.write(_pack_keys(self.color_keys))
+            f.write(_pack_keys(self.tag_keys))
+            for column in (self.quads, self.colors, self.tags,
+                           self.card0_offsets, self.card0_values):
+                f.write(_to_le_bytes(column))
+
+    def get_quad(self, k):
+        return self.quads[4 * k:4 * k + 4].tolist()
+
+    def get_card0s(self, k):
+        return self.card0_values[
+            self.card0_offsets[k]:self.card0_offsets[k + 1]].tolist()
+
+    def get_solution(self, k):
+        """
+        Get solution k in the shape of full_solution.json.
+        """
+        return {
+            "q": self.get_quad(k),
+            "a": self.get_card0s(k),
+            "c": self.color_keys[self.colors[k]],
+            "t": self.tag_keys[self.tags[k]]
+        }
+
+    def to_dict(self):
+        """
+        Rebuild the whole object of full_solution.json.
+        """
+        return {str(k): self.get_solution(k) for k in range(len(self))}
+
+
+def read_solution_pack(path):
+    """
+    Read a packed solution file written by write_solution_pack.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    (magic, version, n_color_keys, n_tag_keys, _,
+     n_solutions, n_card0_values) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"Not a solution pack: {path}")
+    if version != VERSION:
+        raise ValueError(f"Unsupported solution pack version: {version}")
+
+    offset = HEADER.size
+    color_keys, offset = _unpack_keys(data, offset, n_color_keys)
+    tag_keys, offset = _unpack_keys(data, offset, n_tag_keys)
+
+    columns = []
+    for typecode, count in ((U16, n_solutions * 4),
+                            (U8, n_solutions),
+                            (U16, n_solutions),
+                            (U32, n_solutions + 1),
+                            (U16, n_card0_values)):
+        size = array(typecode).itemsize * count
+        columns.append(_from_le_bytes(typecode, data[offset:offset + size]))
+        offset += size
+
+    return SolutionPack(color_keys, tag_keys, *columns)
+
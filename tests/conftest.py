@@ -0,0 +1,67 @@
+from itertools import combinations
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+# the scripts are run as scripts, not installed: import them from their directory
+sys.path[:0] = [str(ROOT / "scripts"), str(ROOT / "benchmarks")]
+
+import calc  # noqa: E402
+from calc_inputs import load_inputs  # noqa: E402
+from synthetic_catalogue import generate_catalogue  # noqa: E402
+
+QUESTIONS = tuple(combinations(range(1, 6), 2))
+
+
+@pytest.fixture(scope="session")
+def synthetic_catalogue(tmp_path_factory):
+    """
+    {calc.py input name: path} of a 500-card synthetic catalogue.
+    """
+    return generate_catalogue(tmp_path_factory.mktemp("catalogue"), 500, seed=1)
+
+
+@pytest.fixture(scope="session")
+def synthetic_inputs(synthetic_catalogue):
+    """
+    calc.py inputs of the synthetic catalogue.
+    """
+    return load_inputs(synthetic_catalogue)
+
+
+@pytest.fixture(scope="session")
+def solve(synthetic_inputs):
+    """
+    solve(engine) -> (quad_dict, card0_dict) of the synthetic catalogue.
+    """
+    solved = {}
+
+    def solve(engine="python"):
+        if engine not in solved:
+            if engine == "numpy":
+                calc.import_numpy()
+            quad_dict = {f"{a},{b}": {} for a, b in QUESTIONS}
+            card0_dict = {f"{a},{b}": {} for a, b in QUESTIONS}
+            for key, quads, card0s, _, _ in calc.solve_units(
+                    calc.get_units(QUESTIONS), 1, synthetic_inputs["cards_encoded"],
+                    synthetic_inputs["tag_cards"], synthetic_inputs["silver_tags"],
+                    engine):
+                quad_dict[key].update(quads)
+                card0_dict[key].update(card0s)
+            solved[engine] = quad_dict, card0_dict
+        return solved[engine]
+    return solve
+
+
+@pytest.fixture(scope="session")
+def outputs(tmp_path_factory, synthetic_inputs, solve):
+    """
+    The outputs of calc.py for the synthetic catalogue.
+    """
+    output_dir = tmp_path_factory.mktemp("solutions")
+    solutions, _ = calc.dedup_solutions(
+        QUESTIONS, *solve(), max(synthetic_inputs["valid_cards"]))
+    calc.write_solutions(str(output_dir), solutions)
+    return output_dir
@@ -0,0 +1,36 @@
+"""
+The numpy engine of calc.py gives the same quints as the Python reference.
+"""
+import pytest
+
+import calc
+from conftest import QUESTIONS
+
+pytest.importorskip("numpy")
+
+
+def quint_set(solutions):
+    return {tuple(sorted(solution["q"] + [card0]))
+            for solution in map(solutions.get_solution, range(len(solutions)))
+            for card0 in solution["a"]}
+
+
+def test_engines_same_quints(synthetic_inputs, solve):
+    max_card_id = max(synthetic_inputs["valid_cards"])
+    quints = {}
+    for engine in calc.SOLVERS:
+        solutions, count = calc.dedup_solutions(QUESTIONS, *solve(engine), max_card_id)
+        quints[engine] = quint_set(solutions)
+        assert len(quints[engine]) == count
+    assert quints["python"]
+    assert quints["numpy"] == quints["python"]
+
+
+@pytest.mark.parametrize("mode", sorted(calc.DEDUP_MODES))
+def test_dedup_modes_same_solutions(synthetic_inputs, solve, mode):
+    max_card_id = max(synthetic_inputs["valid_cards"])
+    reference, count = calc.dedup_solutions(QUESTIONS, *solve(), max_card_id)
+    solutions, mode_count = calc.dedup_solutions(QUESTIONS, *solve(), max_card_id, mode)
+    assert mode_count == count
+    assert [solutions.get_solution(i) for i in range(len(solutions))] == \
+        [reference.get_solution(i) for i in range(len(reference))]
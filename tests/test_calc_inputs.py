@@ -0,0 +1,29 @@
+from calc_inputs import INPUT_NAMES, load_inputs
+import calc_inputs
+from synthetic_catalogue import generate_catalogue
+
+
+def test_snapshot_round_trip(tmp_path, monkeypatch):
+    paths = generate_catalogue(tmp_path / "catalogue", 200, seed=2)
+    snapshot_path = tmp_path / "out" / "calc_inputs.json"
+    parsed = load_inputs(paths, snapshot_path)
+    assert snapshot_path.exists()
+
+    # the second load comes from the snapshot, with the same types
+    def no_parsing(paths):
+        raise AssertionError("the CSVs were parsed again")
+    monkeypatch.setitem(calc_inputs.LOADERS, "csv", no_parsing)
+    restored = load_inputs(paths, snapshot_path)
+    assert restored == parsed
+    assert isinstance(restored["silver_tags"][0], tuple)
+    assert isinstance(restored["valid_cards"], tuple)
+    assert set(restored["digests"]) == set(INPUT_NAMES)
+
+
+def test_unreadable_snapshot_is_ignored(tmp_path):
+    paths = generate_catalogue(tmp_path / "catalogue", 200, seed=2)
+    snapshot_path = tmp_path / "calc_inputs.json"
+    expected = load_inputs(paths)
+    for content in (b"\x80\x05K\x01.", b'{"version": 2, "inputs": []}'):
+        snapshot_path.write_bytes(content)
+        assert load_inputs(paths, snapshot_path) == expected
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+import icons  # noqa: E402
+
+
+def write_icon(icons_dir, icon_id, color):
+    Image.new("RGBA", (8, 8), color).save(icons_dir / f"Card_icon_{icon_id}.png")
+
+
+def read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def icons_dir(tmp_path):
+    path = tmp_path / "card_icons"
+    path.mkdir()
+    for icon_id, color in ((1, "red"), (2, "green"), (300, "blue")):
+        write_icon(path, icon_id, color)
+    return path
+
+
+def test_broken_icon_is_skipped(icons_dir, tmp_path):
+    out_dir = tmp_path / "opt"
+    (icons_dir / "Card_icon_2.png").write_bytes(b"not a png")
+    icons.build_icons(icons_dir, out_dir, size=4, jobs=1)
+
+    atlas = read_json(out_dir / "atlas.json")
+    assert sorted(atlas["icons"]) == ["1", "300"]
+    assert atlas["atlases"] == ["atlas_0", "atlas_1"]
+    assert not (out_dir / "thumbs" / "Card_icon_2.png").exists()
+    # the broken icon and its atlas are built again by the next run
+    state = read_json(out_dir / "build_state.json")
+    assert sorted(state["thumbs"]) == ["1", "300"]
+    assert sorted(state["atlases"]) == ["1"]
+
+    write_icon(icons_dir, 2, "green")
+    icons.build_icons(icons_dir, out_dir, size=4, jobs=1)
+    assert sorted(read_json(out_dir / "atlas.json")["icons"]) == ["1", "2", "300"]
+    assert (out_dir / "thumbs" / "Card_icon_2.png").exists()
+
+
+def test_removed_icon_outputs_are_deleted(icons_dir, tmp_path):
+    out_dir = tmp_path / "opt"
+    icons.build_icons(icons_dir, out_dir, size=4, jobs=1)
+    assert (out_dir / "thumbs" / "Card_icon_300.webp").exists()
+
+    (icons_dir / "Card_icon_300.png").unlink()
+    icons.build_icons(icons_dir, out_dir, size=4, jobs=1)
+    assert not list((out_dir / "thumbs").glob("Card_icon_300.*"))
+    assert not list(out_dir.glob("atlas_1.*"))
+    assert sorted(read_json(out_dir / "atlas.json")["icons"]) == ["1", "2"]
@@ -0,0 +1,133 @@
+"""
+--record / --replay HTTP archive of maintain.py, against a local server.
+"""
+import http.server
+import random
+import threading
+import zlib
+
+import pytest
+
+import maintain
+
+
+def png_bytes(n_bytes):
+    """
+    A PNG file with n_bytes of random image data (the icon download only
+    checks the framing of the file).
+    """
+    def chunk(kind, data):
+        body = kind + data
+        return len(data).to_bytes(4, "big") + body + zlib.crc32(body).to_bytes(4, "big")
+    header = (64).to_bytes(4, "big") * 2 + bytes([8, 6, 0, 0, 0])
+    data = random.Random(0).randbytes(n_bytes)
+    return maintain.PNG_SIGNATURE + chunk(b"IHDR", header) + chunk(b"IDAT", data) + chunk(b"IEND", b"")
+
+
+ICON = png_bytes(16 * 1024)
+
+
+class WikiStub(http.server.BaseHTTPRequestHandler):
+    """
+    Special:Redirect/file/<name> answers 302 to /images/<name> as BWiki does,
+    /images/<name> the icon, ?action=raw a short page.
+    """
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        host = f"http://{self.headers['Host']}"
+        if "/Special:Redirect/file/" in self.path:
+            self.send_response(302)
+            self.send_header("Location", f"{host}/images/{self.path.rsplit('/', 1)[-1]}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/images/Card_icon_5.png":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(ICON)))
+            self.end_headers()
+            self.wfile.write(ICON)
+        elif self.path.endswith("?action=raw"):
+            body = "{{卡牌|卡牌名=x|卡牌持有特性基础=a|卡牌持有特性成长=b}}".encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/x-wiki; charset=UTF-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def wiki(monkeypatch):
+    WikiStub.requests = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), WikiStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(maintain, "BWIKI_BASE_URL", f"http://127.0.0.1:{server.server_port}/mahoyaku")
+    yield WikiStub
+    server.shutdown()
+    server.server_close()
+
+
+def use_client(monkeypatch, archive, replay):
+    client = maintain.HttpClient(headers=maintain.DEFAULT_HEADERS, rate=0)
+    client.use_archive(archive, replay)
+    monkeypatch.setattr(maintain, "http_client", client)
+    return client
+
+
+def test_record_and_replay_icon_redirect(wiki, monkeypatch, tmp_path):
+    archive_dir = tmp_path / "archive"
+    recorded_dir, replayed_dir = tmp_path / "recorded", tmp_path / "replayed"
+    recorded_dir.mkdir()
+    replayed_dir.mkdir()
+
+    archive = maintain.HttpArchive(archive_dir)
+    use_client(monkeypatch, archive, replay=False)
+    result, entry = maintain.download_icon_for_id(5, recorded_dir)
+    assert result == "success"
+    traits, _ = maintain.fetch_bwiki_card_traits(1)
+    assert traits["基础"] == ["a"]
+    archive.save()
+    assert len(wiki.requests) == 3
+
+    # the redirect is kept with its Location, the icon and the page with their bodies
+    archive = maintain.HttpArchive(archive_dir)
+    redirect, = [entries[0] for key, entries in archive.index.items() if "Special:Redirect" in key]
+    assert redirect["status"] == 302 and redirect["headers"]["Location"].endswith("/images/Card_icon_5.png")
+    icon, = [entries[0] for key, entries in archive.index.items() if key.endswith("/images/Card_icon_5.png")]
+    assert archive.get_object(icon["body"]) == ICON
+
+    wiki.requests.clear()
+    use_client(monkeypatch, archive, replay=True)
+    result, replayed_entry = maintain.download_icon_for_id(5, replayed_dir)
+    assert result == "success"
+    assert replayed_entry["sha256"] == entry["sha256"]
+    assert (replayed_dir / "Card_icon_5.png").read_bytes() == ICON
+    assert maintain.fetch_bwiki_card_traits(1)[0] == traits
+    assert wiki.requests == [] and archive.misses == []
+
+
+def test_record_streams_the_body(wiki, monkeypatch, tmp_path):
+    archive = maintain.HttpArchive(tmp_path / "archive")
+    client = use_client(monkeypatch, archive, replay=False)
+
+    resp = client.get(f"{maintain.BWIKI_BASE_URL}/Special:Redirect/file/Card_icon_5.png", stream=True)
+    key = f"GET {resp.url}"
+    # nothing is read before the caller reads it
+    assert archive.index[key][0]["body"] is None
+    chunks = list(resp.iter_content(chunk_size=1024))
+    assert len(chunks) > 1 and b"".join(chunks) == ICON
+    assert archive.get_object(archive.index[key][0]["body"]) == ICON
+
+    # a response closed before its end is not saved
+    client.get(f"{maintain.BWIKI_BASE_URL}/Card_1?action=raw", stream=True).close()
+    archive.save()
+    assert [key for key in archive.index if "action=raw" in key] == []
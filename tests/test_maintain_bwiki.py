@@ -0,0 +1,385 @@
+"""
+BWiki trait fetching of maintain.py, against a local stub of the wiki.
+"""
+import http.server
+import json
+import threading
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import maintain
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def card_page(name, base, grow):
+    return (f"{{{{卡牌\n|卡牌名={name}\n|卡牌持有特性基础={base}\n"
+            f"|卡牌持有特性成长={grow}\n}}}}\n正文")
+
+
+class BWikiStub(http.server.BaseHTTPRequestHandler):
+    """
+    Serves Card_<n>?action=raw from pages (title -> wikitext); titles in
+    statuses are answered with that status instead, other titles with 404.
+
+    api.php answers action=query&prop=revisions as MediaWiki does with
+    formatversion=2: the titles are normalized (Card_1 -> Card 1), absent
+    pages are "missing", and at most api_limit pages with content are
+    returned per response, the rest after a "continue".
+    """
+    pages = {}
+    statuses = {}
+    requests = []
+    api_limit = 50
+
+    def send(self, status, body=b"", content_type="text/x-wiki; charset=UTF-8"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def query(self, params):
+        titles = params["titles"][0].split("|")
+        found = [title for title in titles if title in self.pages]
+        offset = int(params.get("rvcontinue", ["0"])[0])
+        content = "content" in params["rvprop"][0]
+        limit = self.api_limit if content else len(found)
+        pages = [{"title": title.replace("_", " "), "missing": True}
+                 for title in titles if title not in self.pages and not offset]
+        for title in found[offset:offset + limit]:
+            rev = {"revid": 1000 + int(title.split("_")[1]),
+                   "timestamp": "2026-01-01T00:00:00Z"}
+            if content:
+                rev["slots"] = {"main": {"content": self.pages[title]}}
+            pages.append({"title": title.replace("_", " "), "revisions": [rev]})
+        data = {"batchcomplete": True, "query": {
+            "normalized": [{"from": title, "to": title.replace("_", " ")}
+                           for title in titles if "_" in title],
+            "pages": pages}}
+        if offset + limit < len(found):
+            data = {"continue": {"rvcontinue": str(offset + limit), "continue": "||"},
+                    "query": data["query"]}
+        return data
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.requests.append(self.path)
+        title = url.path.rsplit("/", 1)[-1]
+        if title == "api.php":
+            body = json.dumps(self.query(parse_qs(url.query))).encode("utf-8")
+            return self.send(200, body, "application/json; charset=utf-8")
+        if parse_qs(url.query).get("action") != ["raw"]:
+            return self.send(400)
+        if title in self.statuses:
+            return self.send(self.statuses[title])
+        if title not in self.pages:
+            return self.send(404)
+        self.send(200, self.pages[title].encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def bwiki(monkeypatch):
+    BWikiStub.pages = {}
+    BWikiStub.statuses = {}
+    BWikiStub.requests = []
+    BWikiStub.api_limit = 50
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), BWikiStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_port}/mahoyaku"
+    monkeypatch.setattr(maintain, "BWIKI_BASE_URL", base_url)
+    monkeypatch.setattr(maintain, "BWIKI_API_URL", f"{base_url}/api.php")
+    monkeypatch.setattr(maintain.http_client, "rate_limiter", maintain.HostRateLimiter(0))
+    yield BWikiStub
+    server.shutdown()
+    server.server_close()
+
+
+def test_raw_page(bwiki):
+    wikitext = card_page("【東の国】オズ", "真面目，正直", "優しい/勇敢")
+    bwiki.pages["Card_5"] = wikitext
+    traits, page = maintain.fetch_bwiki_card_traits(5)
+    assert traits == {"基础": ["真面目", "正直"], "成长": ["優しい", "勇敢"],
+                      "卡牌名": "【東の国】オズ"}
+    assert page == {"sha1": maintain.get_content_sha1(wikitext)}
+
+
+def test_raw_page_id_mapping(bwiki):
+    # the wiki pages after 336 are numbered 19 below the card ids
+    bwiki.pages["Card_381"] = card_page("x", "a", "b")
+    traits, _ = maintain.fetch_bwiki_card_traits(400)
+    assert traits["基础"] == ["a"]
+
+
+def test_raw_missing_page(bwiki):
+    traits, page = maintain.fetch_bwiki_card_traits(6)
+    assert traits == {"基础": [], "成长": [], "卡牌名": "未找到(6)"}
+    assert page is None
+
+
+def test_raw_non_200(bwiki):
+    bwiki.statuses["Card_7"] = 403
+    traits, page = maintain.fetch_bwiki_card_traits(7)
+    assert traits["卡牌名"] == "未找到(7)"
+    assert page is None
+
+
+def test_raw_page_without_template(bwiki):
+    bwiki.pages["Card_8"] = "没有模板"
+    traits, page = maintain.fetch_bwiki_card_traits(8)
+    assert traits["卡牌名"] == "无模板(8)"
+    assert page is not None
+
+
+def test_concurrent_raw_fetch_in_card_order(bwiki):
+    card_ids = list(range(1, 21))
+    for card_id in card_ids:
+        if card_id % 4:
+            bwiki.pages[f"Card_{card_id}"] = card_page(f"c{card_id}", f"b{card_id}", "g")
+    bwiki.statuses["Card_10"] = 403
+
+    result = maintain.fetch_characteristics_bwiki(card_ids, max_workers=4, batch_size=0)
+
+    assert list(result) == [str(card_id) for card_id in card_ids]
+    for card_id in card_ids:
+        traits = result[str(card_id)]
+        if card_id % 4 and card_id != 10:
+            assert traits["基础"] == [f"b{card_id}"]
+        else:
+            assert traits["基础"] == [] and traits["卡牌名"] == f"未找到({card_id})"
+    assert len(bwiki.requests) == len(card_ids)
+
+
+@pytest.mark.parametrize("template, expected", [
+    # one parameter per line
+    ("{{卡牌\n|卡牌名=x\n|卡牌持有特性基础=a，b\n|卡牌持有特性成长=c\n}}",
+     {"基础": ["a", "b"], "成长": ["c"], "卡牌名": "x"}),
+    # a link with a | does not swallow the next parameters of the line
+    ("{{卡牌|卡牌名=[[オズ|x]]|卡牌持有特性基础=a|卡牌持有特性成长=c}}",
+     {"基础": ["a"], "成长": ["c"], "卡牌名": "[[オズ|x]]"}),
+    # neither does a nested template, nor does it end the card template
+    ("{{卡牌\n|卡牌名={{ruby|x|y}}\n|卡牌持有特性基础 = a\n|卡牌持有特性成长=c}}{{其他|卡牌名=z}}",
+     {"基础": ["a"], "成长": ["c"], "卡牌名": "{{ruby|x|y}}"}),
+    # the first of two parameters of the same name, values end at the line end
+    ("{{卡牌\n|卡牌名=x\n注释\n|卡牌名=y\n|卡牌持有特性基础=\n}}",
+     {"基础": [], "成长": [], "卡牌名": "x"}),
+])
+def test_template_params(template, expected):
+    assert maintain.parse_bwiki_card_traits("正文\n" + template) == expected
+
+
+def test_api_batch(bwiki):
+    bwiki.api_limit = 2
+    card_ids = [1, 2, 3, 4, 5, 400]
+    for card_id in (1, 2, 3, 5):
+        bwiki.pages[f"Card_{card_id}"] = card_page(f"c{card_id}", f"b{card_id}", "g")
+    bwiki.pages["Card_381"] = card_page("c400", "[[特性|b400]]|x", "g")
+
+    results = maintain.fetch_bwiki_card_traits_batch(card_ids)
+
+    # 5 pages with content, 2 per response: the query is continued twice
+    assert len(bwiki.requests) == 3
+    assert all("/api.php?" in path for path in bwiki.requests)
+    for card_id, (traits, page) in zip(card_ids, results):
+        if card_id == 4:
+            assert traits["卡牌名"] == "未找到(4)" and page is None
+            continue
+        title = f"Card_{maintain.get_bwiki_card_page_id(card_id)}"
+        assert traits["卡牌名"] == f"c{card_id}"
+        assert page == {"page": title, "revid": 1000 + int(title[5:]),
+                        "timestamp": "2026-01-01T00:00:00Z",
+                        "sha1": maintain.get_content_sha1(bwiki.pages[title])}
+    # the top-level | after the link starts a (nameless) parameter
+    assert results[-1][0]["基础"] == ["[[特性|b400]]"]
+
+
+def test_api_revisions_only(bwiki):
+    bwiki.api_limit = 1
+    bwiki.pages["Card_1"] = card_page("c1", "b", "g")
+    bwiki.pages["Card_2"] = card_page("c2", "b", "g")
+
+    pages = maintain.query_bwiki_pages(["Card_1", "Card_2", "Card_3"], content=False)
+
+    assert len(bwiki.requests) == 1
+    assert pages == {"Card_1": {"revid": 1001, "timestamp": "2026-01-01T00:00:00Z"},
+                     "Card_2": {"revid": 1002, "timestamp": "2026-01-01T00:00:00Z"},
+                     "Card_3": None}
+
+
+def ledger_entry(card_id, revid, base):
+    return {"card_id": card_id, "status": "ok", "page": f"Card_{card_id}", "revid": revid,
+            "timestamp": "2025-01-01T00:00:00Z", "sha1": "x",
+            "traits": {"基础": [base], "成长": ["g"], "卡牌名": f"c{card_id}"}}
+
+
+def test_ledger_reuse_checks_revid(bwiki, tmp_path):
+    for card_id in (1, 2, 3):
+        bwiki.pages[f"Card_{card_id}"] = card_page(f"c{card_id}", "new", "g")
+    ledger_path = tmp_path / "ledger.jsonl"
+    # card 1 was edited after it was recorded, card 3 is not in the ledger
+    ledger_path.write_text("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in (
+        ledger_entry(1, 900, "old"), ledger_entry(2, 1002, "old"))), encoding="utf-8")
+    ledger = maintain.FetchLedger(ledger_path)
+
+    result = maintain.fetch_characteristics_bwiki([1, 2, 3], batch_size=50, ledger=ledger)
+
+    assert [result[str(card_id)]["基础"] for card_id in (1, 2, 3)] == [["new"], ["old"], ["new"]]
+    assert ledger.entries[1]["revid"] == 1001
+
+
+def test_ledger_reuse_without_api(bwiki, tmp_path):
+    # the raw pages have no revision to compare: ok entries are reused as they are
+    bwiki.pages["Card_1"] = card_page("c1", "new", "g")
+    ledger_path = tmp_path / "ledger.jsonl"
+    ledger_path.write_text(json.dumps(ledger_entry(1, 900, "old"), ensure_ascii=False) + "\n",
+                           encoding="utf-8")
+
+    result = maintain.fetch_characteristics_bwiki(
+        [1], batch_size=0, ledger=maintain.FetchLedger(ledger_path))
+
+    assert result["1"]["基础"] == ["old"]
+    assert bwiki.requests == []
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """
+    Cards 1-4 with their curated characteristic CSVs: card 3 has an unknown
+    rarity, the value column of the grow list is filled by hand.
+    """
+    (tmp_path / "character_card.csv").write_text(
+        ",".join(maintain.CardRecord.FIELDS) + "\n"
+        "1,【a】オズ,1,2,1,oz,main,\n"
+        "2,【b】オズ,1,3,1,oz,main,\n"
+        "3,【c】オズ,1,9,1,oz,main,\n"
+        "4,【d】オズ,1,2,1,oz,main,\n", encoding="utf-8")
+    (tmp_path / "characteristics_normal.csv").write_text(
+        "id,title,color,rarity,bonus,t1,t2\n"
+        + "".join(f"{k},t{k},1,1,150,2,20\n" for k in range(1, 10)), encoding="utf-8")
+    (tmp_path / "card_give_characteristic.csv").write_text(
+        "card_id,No,characteristic_id,manually_added\n"
+        + "".join(f"{card_id},1,1,\n{card_id},2,2,\n" for card_id in range(1, 5)),
+        encoding="utf-8")
+    (tmp_path / "card_give_characteristic_grow_list.csv").write_text(
+        "card_id,level,characteristic_id,value,manually_added\n"
+        "1,35,3,1,\n1,45,4,2,\n1,55,5,1,\n1,70,6,3,\n"
+        "2,15,3,1,\n2,40,4,2,\n2,65,5,1,\n2,75,6,3,\n"
+        "3,30,3,1,\n"
+        "4,35,3,1,\n", encoding="utf-8")
+    monkeypatch.setattr(maintain, "DATA_DIR", tmp_path)
+    return tmp_path
+
+
+def test_patch_keeps_curated_cells(bwiki, data_dir):
+    # card 1: only the text of the page changed
+    bwiki.pages["Card_1"] = card_page("c1", "t1，t2", "t3 t4 t5 t6") + "新的简介"
+    # card 2: the third grow trait changed
+    bwiki.pages["Card_2"] = card_page("c2", "t1，t2", "t3 t4 t9 t6")
+    # card 3: no grow levels for its rarity, card 4: a trait not in the table
+    bwiki.pages["Card_3"] = card_page("c3", "t7", "t8")
+    bwiki.pages["Card_4"] = card_page("c4", "t1", "未知 t4")
+    give_before = (data_dir / "card_give_characteristic.csv").read_text(encoding="utf-8")
+    revisions = {card_id: {"page": f"Card_{card_id}", "revid": 1, "timestamp": ""}
+                 for card_id in range(1, 5)}
+
+    ledger = maintain.FetchLedger(data_dir / "ledger.jsonl")
+
+    maintain.update_changed_bwiki_cards(maintain.Catalogue(data_dir), 5, revisions, ledger)
+
+    assert (data_dir / "card_give_characteristic.csv").read_text(encoding="utf-8") == give_before
+    grow = (data_dir / "card_give_characteristic_grow_list.csv").read_text(encoding="utf-8")
+    assert grow.splitlines() == [
+        "card_id,level,characteristic_id,value,manually_added",
+        "1,35,3,1,", "1,45,4,2,", "1,55,5,1,", "1,70,6,3,",
+        "2,15,3,1,", "2,40,4,2,", "2,65,9,1,", "2,75,6,3,",
+        "3,30,3,1,",
+        "4,35,3,1,",
+    ]
+    # the skipped cards keep their revisions and are retried by the next run
+    assert [revisions[card_id]["revid"] for card_id in range(1, 5)] == [1001, 1002, 1, 1]
+    assert ledger.retry_ids() == [3, 4]
+
+
+@pytest.fixture
+def maintain_run(bwiki, tmp_path, monkeypatch):
+    """
+    main() on a data directory with cards 1-2; the card list of tests/fixtures
+    adds cards 3 (SSR) and 4 (SR). Icons are not downloaded.
+    """
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "character_card.csv").write_text(
+        ",".join(maintain.CardRecord.FIELDS) + "\n"
+        "1,【中央の魔法使い】オズ,1,2,1,oz,main,\n"
+        "2,【感謝を伝えたくて】オズ,1,3,1,oz,main,\n", encoding="utf-8")
+    (data / "characteristics_normal.csv").write_text(
+        "id,title,color,rarity,bonus,t1,t2\n"
+        + "".join(f"{k},t{k},1,1,150,2,20\n" for k in range(1, 10)), encoding="utf-8")
+    (data / "card_give_characteristic.csv").write_text(
+        "card_id,No,characteristic_id,manually_added\n1,1,1,\n2,1,2,\n", encoding="utf-8")
+    (data / "card_give_characteristic_grow_list.csv").write_text(
+        "card_id,level,characteristic_id,value,manually_added\n1,35,3,1,\n2,15,3,1,\n",
+        encoding="utf-8")
+    logs = tmp_path / "log"
+    logs.mkdir()
+    for name, path in (("DATA_DIR", data), ("TMP_DIR", tmp_path / "tmp"),
+                       ("LAST_CARD_INFO_FILE", logs / "last_card_info_id.txt"),
+                       ("LAST_MISMATCH_FILE", logs / "last_characteristics_mismatch_id.txt"),
+                       ("BWIKI_REVISIONS_FILE", logs / "bwiki_revisions.json"),
+                       ("BWIKI_FETCH_LEDGER_FILE", logs / "bwiki_fetch_ledger.jsonl")):
+        monkeypatch.setattr(maintain, name, path)
+    cache = maintain.PageCache(maintain.http_client, None)
+    page = (FIXTURES / "gamerch_card_list.html").read_bytes()
+    cache.contents[maintain.GAMERCH_CARD_LIST_URL] = page
+    cache.contents[maintain.GAMERCH_PERMANENT_URL] = page
+    monkeypatch.setattr(maintain, "page_cache", cache)
+    monkeypatch.setattr(maintain, "download_missing_icons", lambda *args, **kwargs: 0)
+    monkeypatch.setattr(maintain, "load_or_init_icon_manifest", lambda icons_dir: {})
+    for card_id in (1, 2):
+        bwiki.pages[f"Card_{card_id}"] = card_page(f"c{card_id}", f"t{card_id}", "t3")
+    return data
+
+
+def content_titles(requests):
+    """Titles of the api.php queries that asked for the page contents."""
+    titles = []
+    for path in requests:
+        params = parse_qs(urlsplit(path).query)
+        if "content" in params.get("rvprop", [""])[0]:
+            titles.extend(params["titles"][0].split("|"))
+    return titles
+
+
+def test_partial_new_card_retried_alone(bwiki, maintain_run):
+    data = maintain_run
+    # card 3 has no grow traits yet, card 4 after it is complete
+    bwiki.pages["Card_3"] = card_page("c3", "t1，t2", "")
+    bwiki.pages["Card_4"] = card_page("c4", "t4", "t5 t6 t7 t8")
+
+    maintain.main()
+
+    grow_path = data / "card_give_characteristic_grow_list.csv"
+    grow = grow_path.read_text(encoding="utf-8").splitlines()
+    assert [line for line in grow if line.startswith("3,")] == []
+    assert len([line for line in grow if line.startswith("4,")]) == 4
+    assert maintain.LAST_MISMATCH_FILE.read_text(encoding="utf-8") == ""
+    assert maintain.FetchLedger(maintain.BWIKI_FETCH_LEDGER_FILE).retry_ids() == [3]
+
+    # the page is completed: the next run fetches card 3 only, and inserts its grow rows
+    bwiki.pages["Card_3"] = card_page("c3", "t1，t2", "t3 t4 t5 t6")
+    bwiki.requests.clear()
+    give_before = (data / "card_give_characteristic.csv").read_text(encoding="utf-8")
+
+    maintain.main()
+
+    assert content_titles(bwiki.requests) == ["Card_3"]
+    assert (data / "card_give_characteristic.csv").read_text(encoding="utf-8") == give_before
+    assert grow_path.read_text(encoding="utf-8").splitlines() == grow[:3] + [
+        "3,30,3,,1", "3,55,4,,1", "3,75,5,,1", "3,100,6,,1"] + grow[3:]
+    assert maintain.FetchLedger(maintain.BWIKI_FETCH_LEDGER_FILE).retry_ids() == []
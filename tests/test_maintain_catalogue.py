@@ -0,0 +1,52 @@
+"""
+Catalogue of maintain.py: character_card.csv read once, written back on save().
+"""
+import maintain
+
+HEADER = "id,title,character_id,rarity,note,country,character_first_name_en,series,manually_added\n"
+ROWS = ("1,【中央の魔法使い】オズ,1,2,手で追加,1,oz,main,\n"
+        "2,【感謝を伝えたくて】オズ,1,3,,1,oz,main,\n")
+
+
+def make_data_dir(path, cards):
+    (path / "character_card.csv").write_text(cards, encoding="utf-8")
+    (path / "characteristics_normal.csv").write_text(
+        "id,title,color,rarity,bonus,t1,t2\n", encoding="utf-8")
+    return path
+
+
+def new_card(card_id):
+    return {"id": card_id, "title": "【夜の庭】ミスラ", "character_id": 7, "rarity": 4,
+            "country": 2, "character_first_name_en": "mithra", "series": "unknown",
+            "manually_added": 1}
+
+
+def test_save_without_changes_is_byte_identical(tmp_path):
+    make_data_dir(tmp_path, HEADER + ROWS)
+    catalogue = maintain.Catalogue(tmp_path)
+    catalogue.dirty = True
+    catalogue.save()
+    assert (tmp_path / "character_card.csv").read_text(encoding="utf-8") == HEADER + ROWS
+
+
+def test_save_keeps_unknown_columns(tmp_path):
+    make_data_dir(tmp_path, HEADER + ROWS)
+    catalogue = maintain.Catalogue(tmp_path)
+    catalogue.replace_from(3, [new_card(3)])
+    catalogue.save()
+    # the extra column keeps its place and its cells, empty for the new card
+    assert (tmp_path / "character_card.csv").read_text(encoding="utf-8") == (
+        HEADER + ROWS + "3,【夜の庭】ミスラ,7,4,,2,mithra,unknown,1\n")
+
+
+def test_save_adds_missing_columns(tmp_path):
+    make_data_dir(tmp_path, "id,title,rarity\n1,【中央の魔法使い】オズ,2\n")
+    catalogue = maintain.Catalogue(tmp_path)
+    catalogue.replace_from(2, [new_card(2)])
+    catalogue.save()
+    lines = (tmp_path / "character_card.csv").read_text(encoding="utf-8").splitlines()
+    assert lines == [
+        "id,title,rarity,character_id,country,character_first_name_en,series,manually_added",
+        "1,【中央の魔法使い】オズ,2,,,,,",
+        "2,【夜の庭】ミスラ,4,7,2,mithra,unknown,1",
+    ]
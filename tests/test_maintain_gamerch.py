@@ -0,0 +1,67 @@
+"""
+gamerch card list parsing of maintain.py, on a saved page.
+"""
+import csv
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+import maintain
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+@pytest.fixture(params=["html.parser", pytest.param("lxml", marks=pytest.mark.skipif(
+    importlib.util.find_spec("lxml") is None, reason="lxml is not installed"))])
+def card_list(request, monkeypatch):
+    """
+    The card list page served from the page cache, parsed with each parser.
+    """
+    cache = maintain.PageCache(maintain.http_client, None)
+    cache.contents[maintain.GAMERCH_CARD_LIST_URL] = (FIXTURES / "gamerch_card_list.html").read_bytes()
+    monkeypatch.setattr(maintain, "page_cache", cache)
+    monkeypatch.setattr(maintain, "GAMERCH_HTML_PARSER", request.param)
+    return cache
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    with open(tmp_path / "character_card.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(maintain.CardRecord.FIELDS)
+        writer.writerow([1, "【中央の魔法使い】オズ", 1, 2, 1, "oz", "main", ""])
+        writer.writerow([2, "【感謝を伝えたくて】オズ", 1, 3, 1, "oz", "main", ""])
+    (tmp_path / "characteristics_normal.csv").write_text(
+        "id,title,color,rarity,bonus,t1,t2\n", encoding="utf-8")
+    return maintain.Catalogue(tmp_path)
+
+
+def test_alt_lookup_past_early_placeholder(card_list, catalogue):
+    # the banner placeholder comes first in the page, the card rows after it
+    assert maintain.get_alt_title_for_id(catalogue, 2) == "【感謝を伝えたくて】オズ"
+    assert maintain.get_alt_title_for_id(catalogue, 1) == "【中央の魔法使い】オズ"
+
+
+def test_alt_lookup_unknown_card(card_list, catalogue):
+    with pytest.raises(ValueError):
+        maintain.get_alt_title_for_id(catalogue, 3)
+
+
+def test_export_stops_at_placeholder_after_target(card_list, catalogue, tmp_path):
+    alt = maintain.get_alt_title_for_id(catalogue, 2)
+    csv_path = tmp_path / "new_character_card.csv"
+
+    rows = maintain.export_card_infos(alt, 3, csv_path)
+
+    expected = [(3, "【夜の庭】ミスラ", 7, 4), (4, "【星の記憶】ネロ", 13, 3)]
+    assert [(row["id"], row["title"], row["character_id"], row["rarity"])
+            for row in rows] == expected
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        assert [int(row["id"]) for row in csv.DictReader(f)] == [3, 4]
+
+
+def test_export_from_last_card(card_list, catalogue, tmp_path):
+    # the row after the target is the placeholder: no new card
+    rows = maintain.export_card_infos("【星の記憶】ネロ", 5, tmp_path / "new.csv")
+    assert rows == []
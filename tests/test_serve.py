@@ -0,0 +1,52 @@
+"""
+Query service of serve.py, on the calc.py outputs of the synthetic catalogue.
+"""
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from serve import SolutionStore, make_server
+
+
+@pytest.fixture(scope="module")
+def server_url(outputs, synthetic_catalogue):
+    store = SolutionStore(str(outputs), synthetic_catalogue["cards_lists"])
+    server = make_server(store, "127.0.0.1", 0, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def get_json(url):
+    with urlopen(url) as resp:
+        return json.load(resp)
+
+
+@pytest.mark.parametrize("path", ["/calc", "/prophecy"])
+@pytest.mark.parametrize("query", ["", "?ids=", "?ids=%20", "?ids=,"])
+def test_no_ids_is_an_empty_selection(server_url, path, query):
+    assert get_json(server_url + path + query) == {"ids19": [], "results": []}
+
+
+@pytest.mark.parametrize("query", ["?ids=1,x", "?ids=1.5"])
+def test_malformed_ids(server_url, query):
+    with pytest.raises(HTTPError) as e:
+        urlopen(server_url + "/calc" + query)
+    assert e.value.code == 400
+
+
+def test_calc_results(server_url, outputs):
+    # the cards of a solution below the id shift, typed as they are
+    with open(outputs / "full_solution.json") as f:
+        solution = next(solution for solution in json.load(f).values()
+                        if max(solution["q"] + solution["a"]) < 337)
+    cards = solution["q"] + solution["a"][:1]
+    result = get_json(f"{server_url}/calc?ids={','.join(map(str, cards))}")
+    assert result["ids19"] == cards
+    assert {"quad": solution["q"], "dset": solution["a"], "dset_tag": solution["t"],
+            "colors": solution["c"]} in result["results"]
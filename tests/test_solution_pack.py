@@ -0,0 +1,28 @@
+"""
+full_solution.bin holds the same solutions as full_solution.json.
+"""
+from array import array
+import json
+
+from solution_pack import U8, U16, U32, read_solution_pack, write_solution_pack
+
+
+def test_fixed_width_columns():
+    assert [array(typecode).itemsize for typecode in (U8, U16, U32)] == [1, 2, 4]
+
+
+def test_pack_matches_json(outputs):
+    with open(outputs / "full_solution.json") as f:
+        expected = json.load(f)
+    assert expected
+    assert read_solution_pack(outputs / "full_solution.bin").to_dict() == expected
+
+
+def test_round_trip_from_json(outputs, tmp_path):
+    with open(outputs / "full_solution.json") as f:
+        expected = json.load(f)
+    path = tmp_path / "full_solution.bin"
+    write_solution_pack(path, {int(cnt): solution for cnt, solution in expected.items()})
+    assert read_solution_pack(path).to_dict() == expected
+    # the same bytes as the pack written by calc.py
+    assert path.read_bytes() == (outputs / "full_solution.bin").read_bytes()